@@ -42,8 +42,11 @@
 # IMPORT
 
 from __future__ import print_function
+import os
 import signal
-import re
+import logging
+import time
+import json
 import subprocess
 import gi
 gi.require_version('Gtk', '3.0')
@@ -53,17 +56,25 @@ from gi.repository import GLib
 from utils import aws_utils
 from utils import gtk_utils
 from utils import definitions
+from utils import event_stream
 
 
 # CONSTANTS
 
 # URIs.
-PMP_COMMAND = 'python3 -u %s/pmp.py -c %s' % \
+PMP_COMMAND = 'exec python3 -u %s/pmp.py -c %s' % \
     (definitions.PMP_PATH, definitions.PMP_CONFIGURATION_PATH)
+PMP_EVENTS_OPTIONS = ' --quiet --events-fd %d'
 
 # ALARMS.
 ALARM_WINDOWS_TIMEOUT_ms = 5000 
 
+# Console.
+CONSOLE_STATISTICS_INTERVAL_s = 1
+
+# Time given to the PMP application to flush its samples and exit.
+PMP_STOP_TIMEOUT_s = 10
+
 
 # CLASSES
 
@@ -81,7 +92,8 @@ class RunPMPWindow(Gtk.Window):
         self.maximize()
         self.set_border_width(gtk_utils.DEFAULT_SPACE)
         self.set_position(Gtk.WindowPosition.CENTER)
-        self.connect('destroy', self.on_close_clicked)
+        self.connect('delete-event', self.on_delete_event)
+        self.connect('destroy', self.on_destroyed)
         self.main_grid = Gtk.Grid()
         self.main_grid.set_row_spacing(gtk_utils.DEFAULT_SPACE)
         self.main_grid.set_row_homogeneous(False)
@@ -114,44 +126,122 @@ class RunPMPWindow(Gtk.Window):
             gtk_utils.on_textview_change,
             self.console_textview_scrolling)
         self.main_grid.attach(self.console_frame, 0, 1, 1, 1)
+        self.console = gtk_utils.ConsoleModel(self.console_textbuffer)
+        GLib.timeout_add_seconds(
+            CONSOLE_STATISTICS_INTERVAL_s,
+            self.on_console_statistics)
 
         self.stop_button = Gtk.Button.new_with_label('Close')
         self.stop_button.connect('clicked', self.on_close_clicked)
         self.main_grid.attach(self.stop_button, 0, 2, 1, 1)
 
-        self.run_thread = gtk_utils.ProgressBarWindowThread(self.on_run)
-        self.run_thread.start()
+        self.alarm_manager = gtk_utils.AlarmManager(
+            '%s/media/severity_%%d.png' % (definitions.PMP_PATH),
+            '%s/media/severity_%%d.wav' % (definitions.PMP_PATH),
+            ALARM_WINDOWS_TIMEOUT_ms)
 
         self.pmp_process = None
+        self.pmp_stopping = False
+        self.pmp_stop_timeout_id = None
+        self.destroyed = False
+        self.task_runner = gtk_utils.TaskRunner()
+        self.task_runner.submit(self.on_run, name='Run',
+            done_callback=self.on_run_done)
 
     #
     # Callback for alarm.
     #
     def on_alarm_triggered(self, title, severity):
-        window = gtk_utils.AlarmWindow(
-            title,
-            '%s/media/severity_%d.png' % (definitions.PMP_PATH, severity),
-            '%s/media/severity_%d.wav' % (definitions.PMP_PATH, severity),
-            ALARM_WINDOWS_TIMEOUT_ms)
-        window.show_all()
+        self.alarm_manager.trigger(title, severity)
 
     #
     # Prepare callback.
+    # Run by the task runner: the console is thread-safe.
+    #
+    def on_run(self, context):
+        context.set_text('Starting AWS Greengrass...')
+        self.console.append('Starting AWS Greengrass...\n')
+        if aws_utils.restart_aws_greengrass(
+            progress_callback=lambda line: self.console.append(line + '\n')):
+            self.console.append('Done.\n')
+        else:
+            self.console.append('AWS Greengrass did not start.\n')
+
+    #
+    # Callback for the prepare task being done.
     #
-    def on_run(self, progress_bar_window):
-        progress_bar_window.set_text('Restarting AWS Greengrass...')
-        gtk_utils.write_to_buffer(self.console_textbuffer, 'Restarting AWS Greengrass...')
-        aws_utils.restart_aws_greengrass()
-        gtk_utils.write_to_buffer(self.console_textbuffer, 'Done.\nRunning the application...\n')
-        self.pmp_process = self.execute_command_and_write_to_buffer(
-            PMP_COMMAND, self.console_textbuffer)
+    def on_run_done(self, future):
+        if future.cancelled() or future.is_cancel_requested():
+            return
+        self.console.append('Running the application...\n')
+        self.pmp_process = self.execute_pmp_and_write_to_console()
 
     #
     # Callback for "Close" button clicked.
+    # The window is destroyed once the PMP application has exited.
     #
     def on_close_clicked(self, widget):
+        self.stop_button.set_sensitive(False)
+        self.task_runner.shutdown()
+        if not self.stop_pmp():
+            self.destroy()
+
+    #
+    # Callback for "delete-event" event, i.e. the window being closed.
+    #
+    def on_delete_event(self, widget, event):
+        self.on_close_clicked(widget)
+        return True
+
+    #
+    # Callback for "destroy" event.
+    #
+    def on_destroyed(self, widget):
+        self.destroyed = True
+        self.task_runner.shutdown()
+        self.stop_pmp()
+
+    #
+    # Stop the PMP application as with 'CTRL+C', so that it flushes its dumps
+    # and spool, killing it if it does not exit in time.
+    # Non-blocking call: its output is still read while it exits.
+    #
+    # @return True if the application is being stopped, False if not running.
+    #
+    def stop_pmp(self):
+        if self.pmp_stopping:
+            return True
+        if not self.pmp_process or self.pmp_process.poll() is not None:
+            return False
+        self.pmp_stopping = True
+        self.console.append('Stopping the application...\n')
+        self.pmp_process.send_signal(signal.SIGINT)
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, self.pmp_process.pid,
+            self.on_pmp_stopped)
+        self.pmp_stop_timeout_id = GLib.timeout_add_seconds(
+            PMP_STOP_TIMEOUT_s, self.on_pmp_stop_timeout)
+        return True
+
+    #
+    # Callback for the PMP application not exiting in time.
+    #
+    def on_pmp_stop_timeout(self):
+        self.pmp_stop_timeout_id = None
+        self.console.append('Application not responding, killing it...\n')
         self.pmp_process.kill()
-        self.destroy()
+        return False
+
+    #
+    # Callback for the PMP application having exited while being stopped.
+    # Called either by the child watch or by the reader of its output, whichever
+    # comes first.
+    #
+    def on_pmp_stopped(self, *args):
+        if self.pmp_stop_timeout_id is not None:
+            GLib.source_remove(self.pmp_stop_timeout_id)
+            self.pmp_stop_timeout_id = None
+        if not self.destroyed:
+            self.destroy()
 
     #
     # Callback for "enter-notify-event" event.
@@ -160,45 +250,97 @@ class RunPMPWindow(Gtk.Window):
         return True
 
     #
-    # Execute a command and write its output to a buffer.
-    # Non-blocking call by default.
-    # When run in blocking mode it may miss some text to write to the given buffer.
+    # Callback for updating the statistics of the console.
+    #
+    def on_console_statistics(self):
+        statistics = self.console.get_statistics()
+        self.console_frame.set_label(
+            'Console (dropped lines: %d, repaint: %.1f [ms] mean, ' \
+            '%.1f [ms] max)' % (statistics["dropped_lines"],
+            statistics["frame_time_ms_mean"], statistics["frame_time_ms_max"]))
+        return True
+
+    #
+    # Execute the PMP application and write its output to the console.
+    # Samples, events and status are read from the application's event stream,
+    # while its standard output only carries setup and error messages.
+    # Non-blocking call.
     #
-    def execute_command_and_write_to_buffer(self, command, buffer, blocking=False):
+    def execute_pmp_and_write_to_console(self):
+        read_fd, write_fd = os.pipe()
         process = subprocess.Popen(
-            command, shell = True, stdout = subprocess.PIPE)
-        GLib.io_add_watch(
+            PMP_COMMAND + PMP_EVENTS_OPTIONS % (write_fd),
+            shell = True, stdout = subprocess.PIPE, pass_fds = (write_fd,))
+        os.close(write_fd)
+        gtk_utils.StreamReader(
             process.stdout,
-            GLib.IO_IN,
-            self.write_to_buffer_callback,
-            buffer)
-        if blocking:
-            process.wait()
+            self.write_to_console_callback,
+            self.on_pmp_exit,
+            process)
+        GLib.io_add_watch(
+            read_fd,
+            GLib.IO_IN | GLib.IO_HUP,
+            self.read_events_callback,
+            event_stream.EventStreamReader())
         return process
 
     #
-    # Callback for writing to buffer.
+    # Callback for writing lines to the console.
+    #
+    def write_to_console_callback(self, lines):
+        for line in lines:
+            self.console.append(line)
+
+    #
+    # Callback for the exit of the PMP application.
+    #
+    def on_pmp_exit(self, exit_code):
+        self.console.append('Application exited with code %d.\n' % (exit_code))
+        if self.pmp_stopping:
+            self.on_pmp_stopped()
+
+    #
+    # Callback for reading the event stream.
+    #
+    def read_events_callback(self, fd, condition, reader):
+        chunk = os.read(fd, event_stream.READ_SIZE_bytes) \
+            if condition & GLib.IO_IN else b''
+        if not chunk:
+            os.close(fd)
+            return False
+        for message in reader.feed(chunk):
+            self.on_event_stream_message(message)
+        return True
+
+    #
+    # Handling a message of the event stream.
     #
-    def write_to_buffer_callback(self, fd, condition, buffer):
-        if condition == GLib.IO_IN:
-            line = fd.readline().decode("utf-8")
+    def on_event_stream_message(self, message):
+        if message["type"] == event_stream.TYPE_SAMPLE:
+            self.console.append('[%s] (%s): %s\n' % (
+                message["client"],
+                self.timestamp(message["time"]),
+                json.dumps(message["data"], sort_keys=True)))
+        elif message["type"] == event_stream.TYPE_EVENT:
             # Handling alarms on console.
-            if "severity" in line:
-                client = re.split('\[|\]', line)[1]
-                severity = int(line.split('\"')[1])
-                self.on_alarm_triggered(client, severity)
-                line = re.sub(r'Event.*:', '%s:' % definitions.EVENTS[severity].upper(), line)
-                line = ('<span color="{:s}">%s</span>' % (line))
-                buffer.insert_markup(
-                    buffer.get_end_iter(),
-                    line.format(definitions.COLORS[severity]),
-                    -1)
-            else:
-                buffer.insert_at_cursor(line)
-            while Gtk.events_pending():
-                Gtk.main_iteration()
-            return True
-        return False
+            severity = message["severity"]
+            self.on_alarm_triggered(message["client"], severity)
+            line = '[%s] (%s): %s: %s%s\n' % (
+                message["client"],
+                self.timestamp(message["time"]),
+                definitions.EVENTS[severity].upper(),
+                message["message"],
+                '' if message["value"] is None \
+                    else ' (%s)' % (message["value"]))
+            self.console.append(line, definitions.COLORS[severity])
+        elif message["type"] == event_stream.TYPE_STATUS:
+            self.console.append('%s\n' % (message["message"]))
+
+    #
+    # Get the time of a message in the format used by the console.
+    #
+    def timestamp(self, seconds):
+        return time.strftime("%H:%M:%S", time.localtime(seconds))
 
 
 # RUNNING MAIN APPLICATION
@@ -207,6 +349,9 @@ if __name__ == "__main__":
     # Adding signal to catch 'CRTL+C'.
     signal.signal(signal.SIGINT, signal.SIG_DFL)
 
+    # Logging the statistics of the background tasks.
+    logging.basicConfig(level=logging.INFO)
+
     try:
         main_window = RunPMPWindow()
         main_window.show_all()
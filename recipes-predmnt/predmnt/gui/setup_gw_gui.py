@@ -44,6 +44,7 @@ from __future__ import print_function
 import os
 import subprocess
 import signal
+import logging
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
@@ -52,13 +53,14 @@ from gi.repository import Gtk
 from utils import aws_utils
 from utils import fs_utils
 from utils import gtk_utils
+from utils import pip_utils
 from utils import definitions
 
 
 # CONSTANTS
 
-# GTK.
-TIMEOUT_ms = 1000
+# Time to wait for a USB key with a wheelhouse [s].
+USB_KEY_TIMEOUT_s = 2
 
 
 # CLASSES
@@ -78,6 +80,7 @@ class SetupGwWindow(Gtk.Window):
         self.set_border_width(gtk_utils.DEFAULT_SPACE)
         self.set_position(Gtk.WindowPosition.CENTER)
         self.connect('destroy', Gtk.Widget.destroy)
+        self.task_runner = gtk_utils.TaskRunner()
         self.main_grid = Gtk.Grid()
         self.main_grid.set_row_spacing(gtk_utils.DEFAULT_SPACE)
         self.main_grid.set_row_homogeneous(False)
@@ -182,26 +185,26 @@ class SetupGwWindow(Gtk.Window):
     # Callback for "Connect" button clicked.
     #
     def on_connect_clicked(self, widget):
-        self.connect_button.set_sensitive(False)
-        self.update_button.set_sensitive(False)
-        self.on_connect_thread = gtk_utils.ProgressBarWindowThread(self.on_connect)
-        self.on_connect_thread.start()
-
-    #
-    # Connect callback.
-    #
-    def on_connect(self, progress_bar_window):
-        gtk_utils.delete_buffer(self.console_textbuffer)
         connection_ssid = self.connection_ssid_entry.get_text()
         connection_password = self.connection_password_entry.get_text()
+        gtk_utils.delete_buffer(self.console_textbuffer)
         if not (connection_ssid and connection_password):
-            self.connect_button.set_sensitive(True)
-            self.update_button.set_sensitive(True)
             gtk_utils.write_to_buffer(
                 self.console_textbuffer, 'Insert valid SSID and password.\n')
             return
-        progress_bar_window.set_text('Connecting...')
-        gtk_utils.write_to_buffer(
+        self.connect_button.set_sensitive(False)
+        self.update_button.set_sensitive(False)
+        self.task_runner.submit(self.on_connect,
+            connection_ssid, connection_password,
+            name='Connect', done_callback=self.on_connect_done)
+
+    #
+    # Connect callback.
+    # Run by the task runner: widgets are updated through the context.
+    #
+    def on_connect(self, context, connection_ssid, connection_password):
+        context.set_text('Connecting...')
+        context.write(
             self.console_textbuffer, 'Connecting to %s...' % (connection_ssid))
         fs_utils.create_wifi_scripts(connection_ssid, connection_password)
         ip_address = None
@@ -214,15 +217,20 @@ class SetupGwWindow(Gtk.Window):
         except subprocess.CalledProcessError as e:
             pass
         if ip_address:
-            gtk_utils.write_to_buffer(
+            context.write(
                 self.console_textbuffer, 
                 'Connected with ip address %s.\n' \
                 'From Bash use \"%s\" or \"%s\".\n' \
                 % (ip_address, fs_utils.CONNECT_WIFI_PATH, fs_utils.DISCONNECT_WIFI_PATH))
         else:
-            gtk_utils.write_to_buffer(
+            context.write(
                 self.console_textbuffer, 
                 'Impossible to connect to %s' % (connection_ssid))
+
+    #
+    # Callback for the connect task being done.
+    #
+    def on_connect_done(self, future):
         self.connect_button.set_sensitive(True)
         self.update_button.set_sensitive(True)
 
@@ -233,34 +241,35 @@ class SetupGwWindow(Gtk.Window):
         self.connect_button_status = self.connect_button.get_sensitive()
         self.connect_button.set_sensitive(False)
         self.update_button.set_sensitive(False)
-        self.on_connect_thread = gtk_utils.ProgressBarWindowThread(self.on_configure)
-        self.on_connect_thread.start()
+        self.task_runner.submit(self.on_configure,
+            name='Configure', done_callback=self.on_configure_done)
 
     #
-    # Callback for "Configure" button clicked.
+    # Configure callback.
+    # Run by the task runner: widgets are updated through the context.
     #
-    def on_configure(self, progress_bar_window):
+    def on_configure(self, context):
         # Adding user and group to the system.
-        progress_bar_window.set_text('Configuring...')
-        gtk_utils.write_to_buffer(
+        context.set_text('Configuring...')
+        context.write(
             self.console_textbuffer, 'Adding user and group to the system...\n')
         try:
             command = 'adduser --system ggc_user 2>&1'
             output = subprocess.check_output(command,
                 stderr=subprocess.STDOUT, shell=True).decode('utf-8')
-            gtk_utils.write_to_buffer(self.console_textbuffer, output)
+            context.write(self.console_textbuffer, output)
         except subprocess.CalledProcessError as e:
             pass
         try:
             command = 'addgroup --system ggc_group 2>&1'
             output = subprocess.check_output(command,
                 stderr=subprocess.STDOUT, shell=True).decode('utf-8')
-            gtk_utils.write_to_buffer(self.console_textbuffer, output)
+            context.write(self.console_textbuffer, output)
         except subprocess.CalledProcessError as e:
             pass
 
         # Enabling hardlink and softlink protection at operating system start-up.
-        gtk_utils.write_to_buffer(
+        context.write(
             self.console_textbuffer,
             'Enabling hardlink and softlink protection at operating system ' \
             'start-up...\n')
@@ -269,22 +278,45 @@ class SetupGwWindow(Gtk.Window):
         fd.close()
 
         # Installing Python packages.
-        gtk_utils.write_to_buffer(
+        context.set_text('Installing Python packages...')
+        context.write(
             self.console_textbuffer, 'Installing Python packages...\n')
-        command = '%s 2>&1' % (definitions.PYTHON_PIP_UPGRADE)
-        gtk_utils.execute_command_and_write_to_buffer(
-            command, self.console_textbuffer)
-        if self.check_setup(None):
-            command = 'pip3 install %s 2>&1' % (definitions.PYTHON_PACKAGES_TO_INSTALL)
-            gtk_utils.execute_command_and_write_to_buffer(
-                command, self.console_textbuffer)
-            #GLib.timeout_add(TIMEOUT_ms, self.check_setup, None)
-            while self.check_setup(None):
-                pass
-        else:
-            gtk_utils.write_to_buffer(
+        packages = definitions.PYTHON_PACKAGES_TO_INSTALL.split(' ')
+        wheelhouse_path = None
+        if pip_utils.get_missing_packages(packages):
+            wheelhouse_path = self.find_wheelhouse()
+        if wheelhouse_path:
+            context.write(
                 self.console_textbuffer,
-                'Python packages installed.\n')
+                'Installing from wheelhouse \"%s\"...\n' % (wheelhouse_path))
+        try:
+            result = pip_utils.install_packages(
+                packages,
+                lambda text: context.write(self.console_textbuffer, text),
+                [definitions.PYTHON_PIP_UPGRADE.split(' ')],
+                wheelhouse_path)
+            if result.missing:
+                context.write(
+                    self.console_textbuffer,
+                    'Python packages not installed (return code %s): %s.\n' % \
+                    (result.return_code, ', '.join(result.missing)))
+            else:
+                context.write(
+                    self.console_textbuffer,
+                    'Python packages installed in %.1f [s].\n' % \
+                    (result.elapsed_s))
+        except ValueError as e:
+            context.write(
+                self.console_textbuffer, 'Invalid wheelhouse: %s\n' % (e))
+        finally:
+            if wheelhouse_path and \
+                wheelhouse_path.startswith(fs_utils.MOUNT_POINT_PATH):
+                fs_utils.unmount_usb_key()
+
+    #
+    # Callback for the configure task being done.
+    #
+    def on_configure_done(self, future):
         self.connect_button.set_sensitive(self.connect_button_status)
         self.update_button.set_sensitive(True)
 
@@ -292,22 +324,24 @@ class SetupGwWindow(Gtk.Window):
     # Callback for "Close" button clicked.
     #
     def on_close_clicked(self, widget):
+        self.task_runner.shutdown()
         self.destroy()
 
     #
-    # Checking whether the setup has been completed.
+    # Find a wheelhouse to install the Python packages from, either in the image
+    # or on a USB key.
+    #
+    # @return The path of the wheelhouse, or None if not found.
     #
-    def check_setup(self, user_data):
-        import imp
-        import pkg_resources
-        #from pip._internal.utils.misc import get_installed_distributions
-        imp.reload(pkg_resources)
-        installed_packages = set(package.key for package in pkg_resources.working_set) 
-        #installed_packages = get_installed_distributions(local_only=False)
-        #installed_packages = set(package.project_name for package in installed_packages)
-        if set(definitions.PYTHON_PACKAGES_TO_INSTALL.split(' ')).issubset(installed_packages):
-            return False
-        return True
+    def find_wheelhouse(self):
+        if pip_utils.is_wheelhouse(definitions.WHEELHOUSE_PATH):
+            return definitions.WHEELHOUSE_PATH
+        usb_key_path = fs_utils.mount_usb_key(USB_KEY_TIMEOUT_s,
+            lambda path: pip_utils.is_wheelhouse(
+                os.path.join(path, definitions.WHEELHOUSE_FOLDER)))
+        if usb_key_path:
+            return os.path.join(usb_key_path, definitions.WHEELHOUSE_FOLDER)
+        return None
 
     #
     # Check whether a WiFi network has been configured.
@@ -336,6 +370,9 @@ if __name__ == "__main__":
     # Adding signal to catch 'CRTL+C'.
     signal.signal(signal.SIGINT, signal.SIG_DFL)
 
+    # Logging the statistics of the background tasks.
+    logging.basicConfig(level=logging.INFO)
+
     try:
         main_window = SetupGwWindow()
         main_window.show_all()
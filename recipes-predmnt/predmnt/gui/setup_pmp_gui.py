@@ -43,12 +43,15 @@
 from __future__ import print_function
 import os
 import signal
+import logging
 import json
+import functools
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 
 from utils import aws_utils
+from utils import credentials
 from utils import fs_utils
 from utils import gtk_utils
 from utils import definitions
@@ -66,7 +69,11 @@ INFORMATION = \
 6) Deploy the solution from the dashboard to the gateway"""
 
 # Setup.
-MAXIMUM_NUMBER_OF_DEVICES = 4
+MAXIMUM_NUMBER_OF_MASTERBOARDS = 4
+MAXIMUM_NUMBER_OF_DEVICES = definitions.MASTERBOARD_POSITIONS
+
+# Time to wait for the USB key when selecting the credentials [s].
+USB_KEY_TIMEOUT_s = 2
 
 
 # CLASSES
@@ -86,6 +93,7 @@ class SetupPMPWindow(Gtk.Window):
         self.set_border_width(gtk_utils.DEFAULT_SPACE)
         self.set_position(Gtk.WindowPosition.CENTER)
         self.connect('destroy', Gtk.Widget.destroy)
+        self.task_runner = gtk_utils.TaskRunner()
         self.main_grid = Gtk.Grid()
         self.main_grid.set_row_spacing(gtk_utils.DEFAULT_SPACE)
         self.main_grid.set_column_spacing(gtk_utils.DEFAULT_SPACE)
@@ -214,8 +222,8 @@ class SetupPMPWindow(Gtk.Window):
         self.main_grid.attach(self.hbox, 0, 3, 2, 1)
 
         # self.edge_gateway = '/media/usb/AG_Edge.zip'
-        # self.devices_dict['Position 1'] = '/media/usb/AG_Device_1.zip'
-        # self.devices_dict['Position 4'] = '/media/usb/AG_Device_2.zip'
+        # self.devices_dict[(1, 1)] = '/media/usb/AG_Device_1.zip'
+        # self.devices_dict[(2, 4)] = '/media/usb/AG_Device_2.zip'
 
         self.set_buttons_status()
 
@@ -231,11 +239,46 @@ class SetupPMPWindow(Gtk.Window):
         status = True if self.edge_gateway and self.devices_dict else False
         self.configure_button.set_sensitive(status)
 
+    #
+    # Detect and mount the USB key in the background, then call the given
+    # function with its path, or None, from the GTK main loop.
+    #
+    def detect_usb_key(self, callback):
+        self.edge_gateway_add_button.set_sensitive(False)
+        self.device_add_button.set_sensitive(False)
+        self.configure_button.set_sensitive(False)
+        self.task_runner.submit(self.on_detect_usb_key,
+            name='Detect USB key', show_progress=False,
+            done_callback=functools.partial(self.on_usb_key_detected, callback))
+
+    #
+    # USB key detection callback.
+    # Run by the task runner.
+    #
+    def on_detect_usb_key(self, context):
+        return fs_utils.mount_usb_key(USB_KEY_TIMEOUT_s)
+
+    #
+    # Callback for the USB key detection task being done.
+    #
+    def on_usb_key_detected(self, callback, future):
+        if future.cancelled():
+            return
+        self.set_buttons_status()
+        callback(future.result() if not future.exception() else None)
+
     #
     # Callback for "Add" button clicked for edge gateway.
     #
     def on_add_edge_gateway_clicked(self, widget):
-        fs_utils.mount_usb_key()
+        self.detect_usb_key(self.add_edge_gateway)
+
+    #
+    # Select the edge gateway's credentials.
+    #
+    # @param usb_key_path Path of the USB key, if any.
+    #
+    def add_edge_gateway(self, usb_key_path):
         dialog = Gtk.FileChooserDialog(
             title='Select Edge Credentials zip file',
             parent=self,
@@ -253,6 +296,8 @@ class SetupPMPWindow(Gtk.Window):
         credentials_filter.set_name("Credential Zip files")
         credentials_filter.add_pattern("*.zip")
         dialog.add_filter(credentials_filter)
+        if usb_key_path:
+            dialog.set_current_folder(usb_key_path)
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             self.edge_gateway = dialog.get_filename()
@@ -266,7 +311,14 @@ class SetupPMPWindow(Gtk.Window):
     # Callback for "Add" button clicked for devices.
     #
     def on_add_devices_clicked(self, widget):
-        fs_utils.mount_usb_key()
+        self.detect_usb_key(self.add_devices)
+
+    #
+    # Select the devices' credentials.
+    #
+    # @param usb_key_path Path of the USB key, if any.
+    #
+    def add_devices(self, usb_key_path):
         dialog = Gtk.FileChooserDialog(
             title='Select Device Credentials zip file',
             parent=self,
@@ -284,23 +336,53 @@ class SetupPMPWindow(Gtk.Window):
         credentials_filter.set_name("Credential Zip files")
         credentials_filter.add_pattern("*.zip")
         dialog.add_filter(credentials_filter)
+        if usb_key_path:
+            dialog.set_current_folder(usb_key_path)
+        masterboard_box = gtk_utils.StringComboBox(
+            'Masterboard', 1, MAXIMUM_NUMBER_OF_MASTERBOARDS)
+        masterboard_box.get_widget().set_active(0)
         position_box = gtk_utils.StringComboBox(
             'Position', 1, MAXIMUM_NUMBER_OF_DEVICES)
-        dialog.set_extra_widget(position_box.get_widget())
+        extra_box = Gtk.Box(
+            orientation=Gtk.Orientation.HORIZONTAL, spacing=gtk_utils.DEFAULT_SPACE)
+        extra_box.add(masterboard_box.get_widget())
+        extra_box.add(position_box.get_widget())
+        folder_button = Gtk.CheckButton.new_with_label('Whole folder')
+        folder_button.connect('toggled', self.on_folder_toggled,
+            dialog, credentials_filter)
+        extra_box.add(folder_button)
+        dialog.set_extra_widget(extra_box)
         response = dialog.run()
         if response == Gtk.ResponseType.OK:
             filename = dialog.get_filename()
-            position = position_box.get_widget().get_active_text()
+            masterboard = masterboard_box.get_widget().get_active() + 1
+            position = position_box.get_widget().get_active() + 1
             for key in [key for key, value in self.devices_dict.items() if filename == value]:
                 del self.devices_dict[key]
-            self.devices_dict[position] = filename
+            self.devices_dict[(masterboard, position)] = filename
             gtk_utils.delete_buffer(self.devices_textbuffer)
             for key, value in sorted(self.devices_dict.items()):
-                gtk_utils.write_to_buffer(self.devices_textbuffer, '%s: %s\n' % \
-                    (key, os.path.basename(value)))
+                gtk_utils.write_to_buffer(self.devices_textbuffer,
+                    'Masterboard %d, Position %d: %s\n' % \
+                    (key[0], key[1], os.path.basename(value) \
+                    if not os.path.isdir(value) else '%s/ (%d devices)' % \
+                    (os.path.basename(value),
+                    len(credentials.get_archives(value)))))
         self.set_buttons_status()
         dialog.destroy()
 
+    #
+    # Callback for "Whole folder" button toggled, to select either a device's
+    # credentials or a folder of them, installed on consecutive positions.
+    #
+    def on_folder_toggled(self, widget, dialog, credentials_filter):
+        if widget.get_active():
+            dialog.remove_filter(credentials_filter)
+            dialog.set_action(Gtk.FileChooserAction.SELECT_FOLDER)
+        else:
+            dialog.set_action(Gtk.FileChooserAction.OPEN)
+            dialog.add_filter(credentials_filter)
+
     #
     # Callback for "Configure" button clicked.
     #
@@ -309,41 +391,67 @@ class SetupPMPWindow(Gtk.Window):
         self.edge_gateway_add_button.set_sensitive(False)
         self.device_add_button.set_sensitive(False)
         self.show_button.set_sensitive(False)
-        self.on_configure_thread = \
-            gtk_utils.ProgressBarWindowThread(self.on_configure)
-        self.on_configure_thread.start()
+        self.task_runner.submit(self.on_configure,
+            self.edge_gateway, dict(self.devices_dict),
+            name='Install credentials', done_callback=self.on_configure_done)
 
     #
     # Configure callback.
+    # Run by the task runner: widgets are updated through the context.
     #
-    def on_configure(self, progress_bar_window):
-        fs_utils.mount_usb_key()
-        progress_bar_window.set_text('Installing credentials...')
-        gtk_utils.write_to_buffer(self.console_textbuffer,
-            'Installing credentials...\n')
+    def on_configure(self, context, edge_gateway, devices_dict):
+        output_callback = lambda message: context.write(
+            self.console_textbuffer, message)
+        context.set_text('Installing credentials...')
+        output_callback('Installing credentials...\n')
         fs_utils.create_file_from_json(
             definitions.PMP_CONFIGURATION_PATH,
             definitions.DEFAULT_PMP_CONFIGURATION_JSON)
-        aws_utils.configure_edge_gateway_aws(
-            self.edge_gateway, self.console_textbuffer)
-        aws_utils.configure_devices_aws(
-            self.devices_dict, self.console_textbuffer)
+        installed = aws_utils.configure_edge_gateway_aws(
+            edge_gateway, output_callback) and \
+            aws_utils.configure_devices_aws(
+            devices_dict, output_callback)
         fs_utils.unmount_usb_key()
-        progress_bar_window.set_text('Restarting AWS Greengrass...')
-        gtk_utils.write_to_buffer(self.console_textbuffer,
-            'Credentials installed.\nRestarting AWS Greengrass...')
-        aws_utils.restart_aws_greengrass()
-        progress_bar_window.set_text('Waiting for deployment...')
-        gtk_utils.write_to_buffer(self.console_textbuffer,
-            'Done.\nWaiting for deployment...')
-        aws_utils.wait_for_aws_deployment()
-        gtk_utils.write_to_buffer(self.console_textbuffer, 'Done.\n')
+        if installed:
+            output_callback('Credentials installed.\n')
+            self.deploy(context)
+        else:
+            output_callback('Credentials not installed.\n')
+
+    #
+    # Callback for the configure task being done.
+    #
+    def on_configure_done(self, future):
         self.edge_gateway = None
         self.devices_dict = {}
         gtk_utils.delete_buffer(self.edge_gateway_textbuffer)
         gtk_utils.delete_buffer(self.devices_textbuffer)
         self.set_buttons_status()
 
+    #
+    # Restart AWS Greengrass with the installed credentials and wait for the
+    # deployment of the solution.
+    #
+    def deploy(self, context):
+        context.set_text('Restarting AWS Greengrass...')
+        context.write(self.console_textbuffer,
+            'Restarting AWS Greengrass...\n')
+        if not aws_utils.restart_aws_greengrass(
+            progress_callback=lambda line: context.write(
+                self.console_textbuffer, line + '\n'),
+            force=True):
+            context.write(self.console_textbuffer,
+                'AWS Greengrass did not start.\n')
+            return
+        context.set_text('Waiting for deployment...')
+        context.write(self.console_textbuffer,
+            'Done.\nWaiting for deployment...')
+        deployed = aws_utils.wait_for_aws_deployment(
+            progress_callback=lambda elapsed_s: context.set_text(
+                'Waiting for deployment... (%d [s])' % (elapsed_s)))
+        context.write(self.console_textbuffer,
+            'Done.\n' if deployed else 'Timeout.\n')
+
     #
     # Callback for "Show" button clicked.
     #
@@ -361,6 +469,7 @@ class SetupPMPWindow(Gtk.Window):
     # Callback for "Close" button clicked.
     #
     def on_close_clicked(self, widget):
+        self.task_runner.shutdown()
         self.destroy()
 
 
@@ -370,6 +479,9 @@ if __name__ == "__main__":
     # Adding signal to catch 'CRTL+C'.
     signal.signal(signal.SIGINT, signal.SIG_DFL)
 
+    # Logging the statistics of the background tasks.
+    logging.basicConfig(level=logging.INFO)
+
     try:
         main_window = SetupPMPWindow()
         main_window.show_all()
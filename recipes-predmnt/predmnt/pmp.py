@@ -42,34 +42,35 @@
 # IMPORT
 
 from __future__ import print_function
+import time
+LOAD_TIME = time.time()
 import os
 import sys
 import signal
 import getopt
+import threading
+import functools
+import concurrent.futures
 import json
 import logging
 from enum import Enum
-import threading
-import serial
-from serial import SerialException
-from serial import SerialTimeoutException
 import random
-import time
-
-import wire_st_sdk.iolink.iolink_protocol as iolink_protocol
-from wire_st_sdk.iolink.iolink_master import IOLinkMaster
-from wire_st_sdk.iolink.iolink_master import IOLinkMasterListener
-from wire_st_sdk.iolink.iolink_device import IOLinkDevice
-from wire_st_sdk.utils.wire_st_exceptions import WireSTInvalidOperationException
-
-from edge_st_sdk.aws.aws_greengrass import AWSGreengrass
-from edge_st_sdk.aws.aws_greengrass import AWSGreengrassListener
-from edge_st_sdk.aws.aws_client import AWSClient
-from edge_st_sdk.edge_client import EdgeClientListener
-from edge_st_sdk.utils.edge_st_exceptions import EdgeSTInvalidDataException
-from edge_st_sdk.utils.edge_st_exceptions import EdgeSTInvalidOperationException
 
 from utils import definitions
+from utils import scheduler
+from utils import fdm_codec
+from utils import dump_writer
+from utils import spool
+from utils import deadband
+from utils import stream_stats
+from utils import event_stream
+from utils import metrics
+from utils import profiling
+from utils import tracing
+from utils import log_pipeline
+# The serial port and the SDKs are imported by "utils.iolink_utils" and by
+# "utils.edge_utils" only when the sensors and the cloud are used.
+IMPORTED_TIME = time.time()
 
 
 # CONSTANTS
@@ -77,7 +78,10 @@ from utils import definitions
 # Usage message.
 USAGE = """Usage:
 
-python3 pmp.py [-h] -c <configuration_file>
+python3 pmp.py [-h] [-q] [-e <events_fd>] [--profile=<mode>
+    [--profile-duration=<seconds>] [--profile-samples=<samples>]
+    [--profile-output=<prefix>] [--profile-top=<functions>]]
+    [--startup-report] -c <configuration_file>
 
 """
 
@@ -86,7 +90,30 @@ HELP = """-h, --help
     Shows these help information.
 -c, --config-file
     Configuration file (.json).
-"""
+-q, --quiet
+    Does not print samples, events and status to the console.
+-e, --events-fd
+    File descriptor (e.g. of a pipe) to write samples, events and status to,
+    in JSON-lines format.
+--profile
+    Profiles the acquisition loop, either with the "cprofile" deterministic
+    profiler or with the "sampling" statistical profiler, and writes the
+    results on exit. Both profile the workers of all the buses.
+--profile-duration
+    Stops the application after profiling for the given number of seconds.
+--profile-samples
+    Stops the application after profiling the given number of samples.
+--profile-output
+    Prefix of the paths of the profiling results: "<prefix>.pstats",
+    "<prefix>.txt" (top functions), and "<prefix>.collapsed" (flame graph input,
+    "sampling" mode only). Default: "%s".
+--profile-top
+    Number of top functions of the summary. Default: %d.
+--startup-report
+    Prints the time spent by each phase of the startup, from the start of the
+    interpreter to the beginning of the acquisitions. Run with
+    "python3 -X importtime" for the import time of each module.
+""" % (definitions.PROFILE_PATH, profiling.DEFAULT_TOP)
 
 # Presentation message.
 INTRO = """####################################################
@@ -107,6 +134,39 @@ INE_FDM_DATA_TIMEOUT_s = 5
 ACO_DATA_TIMEOUT_s = 30
 SHADOW_GET_TIMEOUT_s = 5
 
+# Scheduler.
+SCHEDULER_LATENESS_WARNING_s = 1.0
+
+# Polling workers.
+WORKER_JOIN_TIMEOUT_s = 1.0
+
+# Maximum number of clients started concurrently.
+DEFAULT_STARTUP_WORKERS = 8
+
+# Streams.
+STREAM_ENV = definitions.MQTT_ENV_TOPIC
+STREAM_TDM = definitions.MQTT_INE_TOPIC + definitions.MQTT_TDM_TOPIC
+STREAM_FDM = definitions.MQTT_INE_TOPIC + definitions.MQTT_FDM_TOPIC
+STREAM_FDM_RED = STREAM_FDM + definitions.MQTT_RED_TOPIC
+
+# Stages of the acquisition loop.
+STAGE_ACQUIRE = 'acquire'
+STAGE_ENCODE = 'encode'
+STAGE_PUBLISH = 'publish'
+STAGE_DUMP = 'dump'
+STAGE_TOTAL = 'total'
+
+# Metrics.
+METRIC_STAGE_DURATION = 'pmp_stage_duration_seconds'
+METRIC_SAMPLES = 'pmp_samples_total'
+METRIC_PUBLISHED_MESSAGES = 'pmp_published_messages_total'
+METRIC_PUBLISHED_BYTES = 'pmp_published_bytes_total'
+METRIC_ERRORS = 'pmp_errors_total'
+METRIC_SCHEDULER_LATENESS = 'pmp_scheduler_lateness_seconds'
+METRIC_SCHEDULER_SKIPPED = 'pmp_scheduler_skipped_total'
+METRIC_DEADBAND_PUBLISHED = 'pmp_deadband_published_total'
+METRIC_DEADBAND_SUPPRESSED = 'pmp_deadband_suppressed_total'
+
 
 # CLASSES
 
@@ -138,92 +198,81 @@ class AxesIndex(Enum):
 
 
 #
-# Implementation of the interface used by the IOLinkMaster class to notify the
-# status of the connection.
+# Implementation of the interface used by the Scheduler class to notify that a
+# task has been run.
 #
-class MyIOLinkMasterListener(IOLinkMasterListener):
+class MySchedulerListener(scheduler.SchedulerListener):
 
     #
-    # To be called whenever a masterboard changes its status.
+    # Constructor.
     #
-    # @param masterboard IOLinkMaster instance that has changed its status.
-    # @param new_status New status.
-    # @param old_status Old status.
+    # @param pmp Application to report the status to.
     #
-    def on_status_change(self, masterboard, new_status, old_status):
-        print('Masterboard on port \"%s\" from \"%s\" to \"%s\".' %
-            (masterboard.get_port().port, str(old_status), str(new_status)))
+    def __init__(self, pmp):
+        self._pmp = pmp
 
     #
-    # To be called whenever a masterboard finds a new device connected.
+    # To be called whenever a task has been run.
     #
-    # @param masterboard (IOLinkMaster): Masterboard that has found a new device.
-    # @param device_id (str): New device found.
-    # @param device_position (int): Position of the new device found.
+    # @param scheduler  Scheduler that has run the task.
+    # @param task       Task that has been run.
+    # @param lateness_s Delay between the due time and the start of the task.
     #
-    def on_device_found(self, masterboard, device_id, device_position):
-        print('Masterboard on port \"%s\" found device \"%s\" on position \"%d\".' %
-            (masterboard.get_port().port, device_id, device_position))
+    def on_task_run(self, scheduler, task, lateness_s):
+        self._pmp.metrics.observe(
+            METRIC_SCHEDULER_LATENESS, (task.name,), lateness_s)
+        self._pmp.metrics.set(
+            METRIC_SCHEDULER_SKIPPED, (task.name,), task.skipped)
+        if lateness_s > SCHEDULER_LATENESS_WARNING_s:
+            self._pmp.print_status(event_stream.STATUS_SCHEDULER,
+                'Task \"%s\" ran %.3f [s] late (max %.3f [s], mean %.3f [s], ' \
+                'skipped %d).' % (task.name, lateness_s, task.max_lateness_s,
+                task.get_mean_lateness_s(), task.skipped),
+                {"task": task.name, "lateness_s": round(lateness_s, 3),
+                "skipped": task.skipped})
 
 
 #
-# Implementation of the interface used by the EdgeClient class to notify that a
-# client has updated its status.
+# Implementation of the interface used by the SpoolPublisher class to notify its
+# statistics.
 #
-class MyAWSGreengrassListener(AWSGreengrassListener):
+class MySpoolPublisherListener(spool.SpoolPublisherListener):
 
     #
-    # To be called whenever the AWS Greengrass service changes its status.
+    # Constructor.
     #
-    # @param aws_greengrass AWS Greengrass service that has changed its status.
-    # @param new_status     New status.
-    # @param old_status     Old status.
+    # @param pmp Application to report the status to.
     #
-    def on_status_change(self, aws_greengrass, new_status, old_status):
-        print('AWS Greengrass service with endpoint \"%s\" from \"%s\" to \"%s\".' %
-            (aws_greengrass.get_endpoint(), str(old_status), str(new_status)))
-
-
-#
-# Implementation of the interface used by the EdgeClient class to notify that a
-# client has updated its status.
-#
-class MyClientListener(EdgeClientListener):
+    def __init__(self, pmp):
+        self._pmp = pmp
 
     #
-    # To be called whenever a client changes its status.
+    # To be called periodically with the statistics of the publisher.
     #
-    # @param client     Client that has changed its status.
-    # @param new_status New status.
-    # @param old_status Old status.
+    # @param publisher  Publisher.
+    # @param statistics Dictionary of statistics.
     #
-    def on_status_change(self, client, new_status, old_status):
-        print('Client \"%s\" from \"%s\" to \"%s\".' %
-            (client.get_name(), str(old_status), str(new_status)))
-
-
-#
-# Setting flag.
-#
-class FlagThread(threading.Thread):
+    def on_statistics(self, publisher, statistics):
+        if statistics["spool_records"] or not statistics["connected"]:
+            self._pmp.print_status(event_stream.STATUS_SPOOL,
+                'Spool: %d messages (%d bytes) pending, drain rate %.1f ' \
+                '[msg/s], %d dropped, %s.' % (statistics["spool_records"],
+                statistics["spool_bytes"], statistics["drain_rate_msgs_per_s"],
+                statistics["dropped"],
+                'connected' if statistics["connected"] else 'disconnected'),
+                statistics)
 
     #
-    # Constructor.
+    # To be called whenever a message has been published.
     #
-    def __init__(self, function, flag, timeout):
-        threading.Thread.__init__(self)
-        self._function = function
-        self._flag = flag
-        self._timeout = timeout
-        self.daemon = True
-
-    #
-    # Run the thread.
+    # @param publisher Publisher.
+    # @param message   Message, whose trace is a (stream, sequence number,
+    #                  acquisition time) tuple, if any.
+    # @param ack_time  Time when the client acknowledged the message.
     #
-    def run(self):
-        while True:
-            self._function(self._flag)
-            time.sleep(self._timeout)
+    def on_published(self, publisher, message, ack_time):
+        if message.trace:
+            self._pmp.on_published(message.client_name, message.trace, ack_time)
 
 
 #
@@ -236,15 +285,42 @@ class PMP():
     #
     def __init__(self, argv):
         self._argv = argv
+        self.running = True
+        self.schedulers = []
+        self.worker_error = None
+        self.dump_writers = {}
+        self.dump_lock = threading.Lock()
+        self.dumping_completed = False
+        self.publisher = None
+        self.reducers = {}
+        self.deadbands = {}
+        self.anomaly_detector = None
+        self.quiet = False
+        self.log_pipeline = None
+        self.event_stream = None
+        self.metrics = self.create_metrics()
+        self.metrics_exporter = None
+        self.tracer = tracing.Tracer(self.metrics)
+        self.samples_count = 0
+        self.samples_lock = threading.Lock()
+        self.profile_mode = None
+        self.profile_duration_s = 0
+        self.profile_samples = 0
+        self.profile_output = definitions.PROFILE_PATH
+        self.profile_top = profiling.DEFAULT_TOP
+        self.profiler = None
+        self.profile_timer = None
+        self._timestamp = (None, '')
+        self.fatal_exceptions = (ValueError,)
+        self.startup_report = False
+        self.startup_phases = [('imports', LOAD_TIME, IMPORTED_TIME)]
 
     #
     # Start the main PMP application.
     #
     def start(self):
+        interrupted = False
         try:
-            # Configure logging.
-            self.configure_logging()
-
             # Printing intro.
             self.print_intro()
 
@@ -254,39 +330,49 @@ class PMP():
             # Reading configuration file.
             self.read_configuration(configuration_file)
 
+            # Configure logging.
+            self.configure_logging()
+            self.mark_startup('configuration')
+
 
             # IO-LINK CONFIGURATION.
 
             devices = []
+            buses = self.get_buses()
             if self.configuration["setup"]["use_sensors"]:
-                # Initializing Serial Port.
-                serial_port = serial.Serial()
-                serial_port.port = self.configuration["serial_port"]["name"]
-                serial_port.baudrate = \
-                    self.configuration["serial_port"]["baudrate_bits_per_second"]
-                serial_port.parity = serial.PARITY_NONE
-                serial_port.stopbits = serial.STOPBITS_ONE
-                serial_port.bytesize = serial.EIGHTBITS
-                serial_port.timeout = SERIAL_PORT_TIMEOUT_s
-                serial_port.write_timeout = None
-
-                # Initializing an IO-Link Masterboard and connecting it to the host.
-                print('\nInitializing Masterboard on port \"%s\" with a baud rate of ' \
-                    '\"%d\" [b/s]...' % (serial_port.port, serial_port.baudrate))
-                master = IOLinkMaster(serial_port)
-                master_listener = MyIOLinkMasterListener()
-                master.add_listener(master_listener)
-                status = master.connect()
-
-                # Initializing IO-Link Devices.
-                print('\nInitializing IO-Link Devices...')
-                for device in self.configuration["setup"]["devices"]:
-                    device_name = device["name"]
-                    device_position = device["position"]
-                    devices.append(master.get_device_by_position(
-                        device_position, device_name))
-                    print('Device \"%s\" on position \"%d\" initialized.' % \
-                        (device_name, device_position))
+                from utils import iolink_utils
+                self.fatal_exceptions += iolink_utils.FATAL_EXCEPTIONS
+                self.mark_startup('sensors modules')
+
+                devices = [None] * len(self.configuration["setup"]["devices"])
+                for serial_port_configuration in self.get_serial_ports():
+                    if serial_port_configuration["name"] not in buses:
+                        continue
+
+                    # Initializing Serial Port.
+                    serial_port = iolink_utils.create_serial_port(
+                        serial_port_configuration["name"],
+                        serial_port_configuration["baudrate_bits_per_second"],
+                        SERIAL_PORT_TIMEOUT_s)
+
+                    # Initializing an IO-Link Masterboard and connecting it to the host.
+                    print('\nInitializing Masterboard on port \"%s\" with a baud rate of ' \
+                        '\"%d\" [b/s]...' % (serial_port.port, serial_port.baudrate))
+                    master = iolink_utils.IOLinkMaster(serial_port)
+                    master_listener = iolink_utils.MyIOLinkMasterListener()
+                    master.add_listener(master_listener)
+                    status = master.connect()
+
+                    # Initializing IO-Link Devices.
+                    print('\nInitializing IO-Link Devices...')
+                    for i in buses[serial_port.port]:
+                        device = self.configuration["setup"]["devices"][i]
+                        device_name = device["name"]
+                        device_position = device["position"]
+                        devices[i] = master.get_device_by_position(
+                            device_position, device_name)
+                        print('Device \"%s\" on position \"%d\" initialized.' % \
+                            (device_name, device_position))
 
                 # Checking setup.
                 for device in devices:
@@ -296,9 +382,10 @@ class PMP():
 
                 # IO-Link setup complete.
                 print('\nIO-Link setup complete.\n')
+                self.mark_startup('masterboards')
 
                 # Setting devices' parameters.
-                # sze = iolink_protocol.SZE.SZE_1024
+                # sze = iolink_utils.iolink_protocol.SZE.SZE_1024
                 # for device in devices:
                 #     print('Device %d:' % (device.get_position()))
                 #     print('\tSetting SZE to %s...' % (sze.value), end='')
@@ -314,12 +401,16 @@ class PMP():
 
             clients = []
             if self.configuration["setup"]["use_cloud"]:
+                from utils import edge_utils
+                self.fatal_exceptions += edge_utils.FATAL_EXCEPTIONS
+                self.mark_startup('cloud modules')
+
                 # Initializing Edge Computing.
                 print('\nInitializing Edge Computing...\n')
-                edge = AWSGreengrass(
+                edge = edge_utils.AWSGreengrass(
                     self.endpoint,
                     self.root_ca_path)
-                edge.add_listener(MyAWSGreengrassListener())
+                edge.add_listener(edge_utils.MyAWSGreengrassListener())
 
                 # Initializing AWS MQTT clients.
                 for device in self.configuration["setup"]["devices"]:
@@ -331,61 +422,17 @@ class PMP():
                         self.configuration["setup"]["device_certificates_path"] \
                         + '/' + device_name + PRIV_K_EXT))
 
-                # Connecting clients to the cloud.
-                for client in clients:
-                    client.add_listener(MyClientListener())
-                    if not client.connect():
-                        print('Client \"%s\" cannot connect to core.\n' \
-                            'AWS setup incomplete.\n\nExiting...\n' % \
-                            (client.get_name()))
-                        sys.exit(0)
+                # Connecting clients, sending handshake information, and
+                # subscribing to topics, concurrently.
+                print('\nConnecting clients and sending handshake information...\n')
+                self.start_clients(devices, clients)
 
-                # Sending handshake information.
-                print('\nSending handshake information...\n')
-                for i in range(0, len(devices)):
-                    # Getting data.
-                    data = self.get_handshake(devices[i])
-
-                    # Publishing data.
-                    self.publish_handshake(data, clients[i])
-
-                # Subscribing to Cloud's default topics.
-                for client in clients:
-                    client.subscribe(
-                        definitions.MQTT_AWS_HEADER_TOPIC + "/"
-                        + client.get_name() + "/"
-                        + definitions.MQTT_AWS_GET_TOPIC,
-                        definitions.MQTT_QOS_1,
-                        self.on_shadow_get_callback)
-                    client.subscribe(
-                        definitions.MQTT_AWS_HEADER_TOPIC + "/"
-                        + client.get_name() + "/"
-                        + definitions.MQTT_AWS_UPDATE_TOPIC,
-                        definitions.MQTT_QOS_1,
-                        self.on_shadow_update_callback)
-                    # client.subscribe(
-                    #     definitions.MQTT_AWS_HEADER_TOPIC + "/"
-                    #     + client.get_name() + "/"
-                    #     + definitions.MQTT_AWS_UPDATE_TOPIC + "/"
-                    #     #+ definitions.MQTT_AWS_ACCEPTED_TOPIC, 
-                    #     #+ definitions.MQTT_AWS_DOCUMENTS_TOPIC,
-                    #     + definitions.MQTT_AWS_DELTA_TOPIC,
-                    #     definitions.MQTT_QOS_1,
-                    #     self.on_shadow_update_delta_callback)
-                
-                # Subscribing to user defined topics.
-                for client in clients:
-                    client.subscribe(
-                        definitions.MQTT_HDR_TOPIC + "/"
-                        + client.get_name() + "/"
-                        + definitions.MQTT_PRT_TOPIC + "/"
-                        + definitions.MQTT_EVT_TOPIC + "/"
-                        + definitions.MQTT_THR_TOPIC,
-                        definitions.MQTT_QOS_1,
-                        self.on_events_threshold_callback)
+                # Initializing publishing.
+                self.initialize_publishing(clients)
 
                 # Edge Computing Initialized.
                 print('\nEdge Computing setup complete.\n')
+                self.mark_startup('clients')
             else:
                 for device in self.configuration["setup"]["devices"]:
                     device_name = device["name"]
@@ -395,108 +442,205 @@ class PMP():
             # GETTING DATA AND PUBLISHING.
 
             if self.configuration["setup"]["use_threads_for_polling_sensors"]:
-                # Sensors' flags.
-                self.env_flags = [False] * len(devices)
-                self.ine_tdm_flags = [False] * len(devices)
-                self.ine_fdm_flags = [False] * len(devices)
-
-                # Shadow devices' flags.
-                shadow_flags = [False] * len(devices)
-
-                # Starting threads.
-                for i in range(0, len(devices)):
-                    FlagThread(self.set_env_flag, i, ENV_DATA_TIMEOUT_s).start()
-                    FlagThread(self.set_tdm_flag, i, INE_TDM_DATA_TIMEOUT_s).start()
-                    FlagThread(self.set_fdm_flag, i, INE_FDM_DATA_TIMEOUT_s).start()
-                    #if self.configuration["setup"]["use_cloud"]:
-                    #    FlagThread(set_shadow_flag, i, SHADOW_GET_TIMEOUT_s).start()
+                # Scheduling periodic acquisitions, with a scheduler per bus.
+                for indexes in buses.values():
+                    bus_scheduler = scheduler.Scheduler()
+                    bus_scheduler.add_listener(MySchedulerListener(self))
+                    for i in indexes:
+                        self.schedule_acquisitions(
+                            bus_scheduler, devices[i], clients[i])
+                    self.schedulers.append(bus_scheduler)
 
                 # Measurements.
                 self.initialize_dumping(devices)
+                self.initialize_reduction()
+                self.initialize_deadbands()
+                self.initialize_anomaly_detection()
+                self.initialize_metrics()
+                self.start_profiling()
+                self.mark_startup('measurements')
+                self.print_startup_report()
 
                 # Demo running.
-                print('\nDemo running...\n')
-                a = 0
-                # Infinite loop.
-                while True:
-                    for i in range(0, len(devices)):
-                        if self.env_flags[i]:
-                            # Getting data.
-                            data = self.get_env(devices[i])
-
-                            # Publishing data.
-                            self.publish_env(data, clients[i])
+                self.print_status(event_stream.STATUS_RUNNING,
+                    '\nDemo running...\n')
 
-                            # Resetting flag.
-                            self.env_flags[i] = False
-
-                        elif self.ine_tdm_flags[i]:
-                            # Getting data.
-                            data = self.get_tdm(devices[i])
-
-                            # Publishing data.
-                            self.publish_ine_tdm(data, clients[i])
-
-                            # Resetting flag.
-                            self.ine_tdm_flags[i] = False
-
-                        elif self.ine_fdm_flags[i]:
-                            # Getting data.
-                            data = self.get_fdm(devices[i])
-
-                            # Publishing data.
-                            self.publish_ine_fdm(data, clients[i])
-
-                            # Resetting flag.
-                            self.ine_fdm_flags[i] = False
-
-                        # elif shadow_flags[i] and self.configuration["setup"]["use_cloud"]:
-                        #     # Getting shadow's state.
-                        #     clients[i].get_shadow_state(self.on_shadow_get_callback, SHADOW_CALLBACK_TIMEOUT_s)
-
-                        #     # Resetting flag.
-                        #     shadow_flags[i] = False
+                # Running the schedulers until the application is stopped.
+                self.run_workers(
+                    [bus_scheduler.run for bus_scheduler in self.schedulers],
+                    list(buses))
 
             else:
                 # Measurements.
                 self.initialize_dumping(devices)
+                self.initialize_reduction()
+                self.initialize_deadbands()
+                self.initialize_anomaly_detection()
+                self.initialize_metrics()
+                self.start_profiling()
+                self.mark_startup('measurements')
+                self.print_startup_report()
 
                 # Demo running.
-                print('\nDemo running...\n')
-
-                # Infinite loop.
-                while True:
-                    for i in range(0, len(devices)):
-                        # Getting data.
-                        data = self.get_env(devices[i])
+                self.print_status(event_stream.STATUS_RUNNING,
+                    '\nDemo running...\n')
+
+                # Polling each bus until the application is stopped.
+                self.run_workers(
+                    [functools.partial(self.poll,
+                        [devices[i] for i in indexes],
+                        [clients[i] for i in indexes])
+                    for indexes in buses.values()],
+                    list(buses))
+
+        except Exception as e:
+            # Errors of the sensors, of the cloud, and of the configuration stop
+            # the application gracefully.
+            if not isinstance(e, self.fatal_exceptions):
+                raise
+            self.close_logging()
+            print(e)
+            print('\nExiting...\n')
+            sys.exit(0)
+        except KeyboardInterrupt:
+            self.stop()
+            print('\nExiting...\n')
+            interrupted = True
+        finally:
+            self.close_dumping()
+            self.close_publishing()
+            self.close_metrics()
+            self.close_profiling()
+            if self.event_stream:
+                self.event_stream.close()
+            self.close_logging()
+
+        # Exiting without waiting for the threads of the SDKs, once everything
+        # has been closed.
+        if interrupted:
+            sys.stdout.flush()
+            os._exit(0)
+
+    #
+    # Stop the acquisition loop.
+    # The current acquisition is completed before returning from "start()".
+    #
+    def stop(self):
+        self.running = False
+        for bus_scheduler in self.schedulers:
+            bus_scheduler.stop()
+
+    #
+    # Running the polling workers of the buses, the first one in the calling
+    # thread and the others in their own threads, until all of them return.
+    # An error of a worker stops the other ones, and is raised again here.
+    #
+    # @param workers List of functions, one per bus.
+    # @param names   List of the names of the buses.
+    #
+    def run_workers(self, workers, names):
+        threads = []
+        for worker, name in list(zip(workers, names))[1:]:
+            thread = threading.Thread(target=self.run_worker, args=(worker,),
+                name='bus ' + name, daemon=True)
+            thread.start()
+            threads.append(thread)
+        if workers:
+            self.run_worker(workers[0])
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(WORKER_JOIN_TIMEOUT_s)
+        if self.worker_error:
+            raise self.worker_error
+
+    #
+    # Running a polling worker, stopping the application on errors.
+    #
+    def run_worker(self, worker):
+        try:
+            if self.profiler:
+                self.profiler.profile_call(worker)
+            else:
+                worker()
+        except Exception as e:
+            if not self.worker_error:
+                self.worker_error = e
+            self.stop()
 
-                        # Publishing data.
-                        self.publish_env(data, clients[i])
+    #
+    # Polling devices of the same bus one after the other until the application
+    # is stopped.
+    #
+    def poll(self, devices, clients):
+        while self.running:
+            for i in range(0, len(devices)):
+                self.process_env(devices[i], clients[i])
+                self.process_ine_tdm(devices[i], clients[i])
+                self.process_ine_fdm(devices[i], clients[i])
+                if not self.running:
+                    break
 
-                        # Getting data.
-                        data = self.get_tdm(devices[i])
+    #
+    # Getting the name of a device or of a client, which is the name itself
+    # when the sensors or the cloud are not used.
+    #
+    def get_name(self, item):
+        return item if isinstance(item, str) else item.get_name()
 
-                        # Publishing data.
-                        self.publish_ine_tdm(data, clients[i])
+    #
+    # Checking whether a device is an IO-Link device, i.e. the sensors are used.
+    #
+    def is_iolink_device(self, device):
+        return not isinstance(device, str)
 
-                        # Getting data.
-                        data = self.get_fdm(devices[i])
+    #
+    # Checking whether a client is connected to the cloud, i.e. the cloud is
+    # used.
+    #
+    def is_cloud_client(self, client):
+        return not isinstance(client, str)
 
-                        # Publishing data.
-                        self.publish_ine_fdm(data, clients[i])
+    #
+    # Recording the end of a phase of the startup, which began at the end of the
+    # previous one.
+    #
+    def mark_startup(self, phase):
+        self.startup_phases.append(
+            (phase, self.startup_phases[-1][2], time.time()))
 
-        except (EdgeSTInvalidDataException, EdgeSTInvalidOperationException, \
-            WireSTInvalidOperationException, SerialException, SerialTimeoutException, \
-            ValueError) as e:
-            print(e)
-            print('\nExiting...\n')
-            sys.exit(0)
-        except KeyboardInterrupt:
-            try:
-                print('\nExiting...\n')
-                sys.exit(0)
-            except SystemExit:
-                os._exit(0)
+    #
+    # Getting the time when the process started [s since the epoch], from
+    # "/proc/self/stat" and "/proc/uptime".
+    #
+    # @return The start time, or None if not available.
+    #
+    def get_process_start_time(self):
+        try:
+            with open('/proc/self/stat', 'r') as fp:
+                # Fields after the command, which may contain spaces.
+                fields = fp.read().rsplit(')', 1)[1].split()
+            with open('/proc/uptime', 'r') as fp:
+                uptime_s = float(fp.read().split()[0])
+            start_s = int(fields[19]) / os.sysconf('SC_CLK_TCK')
+            return time.time() - uptime_s + start_s
+        except (OSError, ValueError, IndexError):
+            return None
+
+    #
+    # Printing the time spent by each phase of the startup, if requested.
+    #
+    def print_startup_report(self):
+        if not self.startup_report:
+            return
+        phases = list(self.startup_phases)
+        start_time = self.get_process_start_time()
+        if start_time is not None and start_time < LOAD_TIME:
+            phases.insert(0, ('interpreter', start_time, LOAD_TIME))
+        print('\nStartup report:')
+        for phase, begin, end in phases:
+            print('    %-20s %8.1f [ms]' % (phase, (end - begin) * 1000))
+        print('    %-20s %8.1f [ms]' % \
+            ('total', (phases[-1][2] - phases[0][1]) * 1000))
 
     #
     # Printing presentation message.
@@ -511,8 +655,10 @@ class PMP():
         # Reading in command-line parameters.
         try:
             opts, args = getopt.getopt(argv,
-                "hc:",
-                ["help", "config-file="])
+                "hqc:e:",
+                ["help", "quiet", "config-file=", "events-fd=", "profile=",
+                "profile-duration=", "profile-samples=", "profile-output=",
+                "profile-top=", "startup-report"])
             #if len(opts) == 0:
             #    raise getopt.GetoptError("No input parameters!")
             for opt, arg in opts:
@@ -521,7 +667,25 @@ class PMP():
                     sys.exit(0)
                 if opt in ("-c", "--config-file"):
                     configuration_file = arg
-        except getopt.GetoptError:
+                if opt in ("-q", "--quiet"):
+                    self.quiet = True
+                if opt in ("-e", "--events-fd"):
+                    self.event_stream = event_stream.EventStreamWriter(int(arg))
+                if opt == "--profile":
+                    if arg not in profiling.MODES:
+                        raise getopt.GetoptError("Unknown profiling mode!")
+                    self.profile_mode = arg
+                if opt == "--profile-duration":
+                    self.profile_duration_s = float(arg)
+                if opt == "--profile-samples":
+                    self.profile_samples = int(arg)
+                if opt == "--profile-output":
+                    self.profile_output = arg
+                if opt == "--profile-top":
+                    self.profile_top = int(arg)
+                if opt == "--startup-report":
+                    self.startup_report = True
+        except (getopt.GetoptError, ValueError, OSError):
             print(USAGE + HELP)
             sys.exit(1)
 
@@ -540,6 +704,9 @@ class PMP():
         try:
             with open(json_configuration_file, 'r') as fp:
                 self.configuration = json.load(fp)
+            self.devices_configuration = {}
+            for device in self.configuration["setup"]["devices"]:
+                self.devices_configuration[device["name"]] = device
         except FileNotFoundError as e:
             print('Configuration file "%s" not found.\n\nExiting...\n' % \
                 (json_configuration_file))
@@ -569,50 +736,271 @@ class PMP():
 
     #
     # Configure logging.
+    # Messages of the acquisition loop are written to the console by a
+    # background thread, according to the "logging" configuration.
     #
     def configure_logging(self):
-        logger = logging.getLogger("Demo")
-        logger.setLevel(logging.ERROR)
-        streamHandler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        streamHandler.setFormatter(formatter)
-        logger.addHandler(streamHandler)
+        self.log_pipeline = log_pipeline.LogPipeline(
+            self.configuration.get("logging", {}))
+        self.log_pipeline.start()
+
+    #
+    # Closing logging, writing the pending messages.
+    #
+    def close_logging(self):
+        if self.log_pipeline:
+            self.log_pipeline.close()
+            self.log_pipeline = None
 
     #
-    # Setting the flag for getting environmental data.
+    # Logging a message through the logging pipeline, if configured, or
+    # printing it otherwise.
+    #
+    def log(self, level, message, *args):
+        if self.log_pipeline:
+            self.log_pipeline.get_logger().log(level, message, *args)
+        else:
+            print(message % args if args else message)
+
+    #
+    # Starting the clients concurrently through a bounded pool of workers, and
+    # waiting for the acknowledgements of their handshakes.
+    # The timings of each client are reported, and the application exits if a
+    # client cannot connect.
+    #
+    def start_clients(self, devices, clients):
+        start = time.monotonic()
+        workers = self.configuration["setup"].get(
+            "startup_workers", DEFAULT_STARTUP_WORKERS)
+        results = {}
+        failed = []
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(workers, len(clients)))) as executor:
+            futures = dict((executor.submit(
+                self.start_client, devices[i], clients[i]), clients[i])
+                for i in range(0, len(clients)))
+            for future in concurrent.futures.as_completed(futures):
+                client = futures[future]
+                try:
+                    results[client.get_name()] = future.result()
+                except Exception as e:
+                    print('Client \"%s\" cannot connect to core: %s' % \
+                        (client.get_name(), e))
+                    failed.append(client.get_name())
+        if failed:
+            print('AWS setup incomplete.\n\nExiting...\n')
+            sys.exit(0)
+
+        # Waiting for the acknowledgements of the handshakes.
+        acks = dict((name, results[name]["handshake_ack"]) for name in results)
+        concurrent.futures.wait(list(acks.values()),
+            timeout=SHADOW_CALLBACK_TIMEOUT_s)
+        print('')
+        for client in clients:
+            timings = results[client.get_name()]
+            ack = acks[client.get_name()]
+            if ack.done():
+                response_status, ack_s = ack.result()
+            else:
+                response_status, ack_s = 'no response', None
+            print('Client \"%s\": connected in %.3f [s], subscribed in ' \
+                '%.3f [s], handshake %s%s.' % (client.get_name(),
+                timings["connect_s"], timings["subscribe_s"], response_status,
+                '' if ack_s is None else ' in %.3f [s]' % (ack_s)))
+        print('Clients started in %.3f [s].' % (time.monotonic() - start))
+
+    #
+    # Starting a client: connecting it, sending handshake information, and
+    # subscribing to the topics.
+    #
+    # @return Dictionary of timings, with the future of the acknowledgement of
+    #         the handshake as "handshake_ack".
+    # @raise EdgeSTInvalidOperationException if the client cannot connect.
+    #
+    def start_client(self, device, client):
+        from utils import edge_utils
+        start = time.monotonic()
+        client.add_listener(edge_utils.MyClientListener())
+        if not client.connect():
+            raise edge_utils.EdgeSTInvalidOperationException('Connection refused.')
+        connect_s = time.monotonic() - start
+
+        # Sending handshake information.
+        handshake_ack = self.publish_handshake(
+            self.get_handshake(device), client)
+
+        # Subscribing to topics.
+        start = time.monotonic()
+        self.subscribe(client)
+        return {
+            "connect_s": connect_s,
+            "subscribe_s": time.monotonic() - start,
+            "handshake_ack": handshake_ack
+        }
+
     #
-    def set_env_flag(self, flag):
-        # Setting the flag for getting environmental data.
-        self.env_flags[flag] = True
+    # Subscribing a client to Cloud's default topics and to user defined ones.
+    #
+    def subscribe(self, client):
+        # Subscribing to Cloud's default topics.
+        client.subscribe(
+            definitions.MQTT_AWS_HEADER_TOPIC + "/"
+            + client.get_name() + "/"
+            + definitions.MQTT_AWS_GET_TOPIC,
+            definitions.MQTT_QOS_1,
+            self.on_shadow_get_callback)
+        client.subscribe(
+            definitions.MQTT_AWS_HEADER_TOPIC + "/"
+            + client.get_name() + "/"
+            + definitions.MQTT_AWS_UPDATE_TOPIC,
+            definitions.MQTT_QOS_1,
+            self.on_shadow_update_callback)
+        # client.subscribe(
+        #     definitions.MQTT_AWS_HEADER_TOPIC + "/"
+        #     + client.get_name() + "/"
+        #     + definitions.MQTT_AWS_UPDATE_TOPIC + "/"
+        #     #+ definitions.MQTT_AWS_ACCEPTED_TOPIC, 
+        #     #+ definitions.MQTT_AWS_DOCUMENTS_TOPIC,
+        #     + definitions.MQTT_AWS_DELTA_TOPIC,
+        #     definitions.MQTT_QOS_1,
+        #     self.on_shadow_update_delta_callback)
+
+        # Subscribing to user defined topics.
+        client.subscribe(
+            definitions.MQTT_HDR_TOPIC + "/"
+            + client.get_name() + "/"
+            + definitions.MQTT_PRT_TOPIC + "/"
+            + definitions.MQTT_EVT_TOPIC + "/"
+            + definitions.MQTT_THR_TOPIC,
+            definitions.MQTT_QOS_1,
+            self.on_events_threshold_callback)
+
+    #
+    # Getting the configurations of the serial ports of the IO-Link
+    # Masterboards.
+    # The single "serial_port" of former configuration files is supported too.
+    #
+    def get_serial_ports(self):
+        if "serial_ports" in self.configuration:
+            return self.configuration["serial_ports"]
+        return [self.configuration["serial_port"]]
+
+    #
+    # Getting the indexes of the devices grouped by bus, i.e. by the name of the
+    # serial port of their Masterboard, in the order of the serial ports.
+    # Devices without a serial port are on the first one.
+    #
+    # @raise ValueError if a device refers to an unknown serial port.
+    #
+    def get_buses(self):
+        serial_port_names = [serial_port["name"]
+            for serial_port in self.get_serial_ports()]
+        buses = dict((name, []) for name in serial_port_names)
+        for i, device in enumerate(self.configuration["setup"]["devices"]):
+            name = device.get("serial_port", serial_port_names[0])
+            if name not in buses:
+                raise ValueError('Device \"%s\" on unknown serial port ' \
+                    '\"%s\".' % (device["name"], name))
+            buses[name].append(i)
+        return dict((name, indexes)
+            for name, indexes in buses.items() if indexes)
+
+    #
+    # Scheduling the periodic acquisitions of a device.
+    #
+    def schedule_acquisitions(self, bus_scheduler, device, client):
+        device_name = self.get_name(device)
+        intervals = self.get_intervals(self.devices_configuration[device_name])
+        bus_scheduler.add_task(scheduler.PeriodicTask(
+            device_name + '_' + definitions.MQTT_ENV_TOPIC,
+            self.process_env,
+            intervals["environmental_s"],
+            (device, client)))
+        bus_scheduler.add_task(scheduler.PeriodicTask(
+            device_name + '_' + definitions.MQTT_INE_TOPIC \
+            + definitions.MQTT_TDM_TOPIC,
+            self.process_ine_tdm,
+            intervals["inertial_tdm_s"],
+            (device, client)))
+        bus_scheduler.add_task(scheduler.PeriodicTask(
+            device_name + '_' + definitions.MQTT_INE_TOPIC \
+            + definitions.MQTT_FDM_TOPIC,
+            self.process_ine_fdm,
+            intervals["inertial_fdm_s"],
+            (device, client)))
+        #if self.configuration["setup"]["use_cloud"]:
+        #    bus_scheduler.add_task(scheduler.PeriodicTask(
+        #        device_name + '_shadow',
+        #        client.get_shadow_state,
+        #        SHADOW_GET_TIMEOUT_s,
+        #        (self.on_shadow_get_callback, SHADOW_CALLBACK_TIMEOUT_s)))
+
+    #
+    # Getting the acquisition intervals of a device.
+    # Intervals defined for the device override the global ones, which in turn
+    # override the default ones.
+    #
+    def get_intervals(self, device_configuration):
+        intervals = {
+            "environmental_s": ENV_DATA_TIMEOUT_s,
+            "inertial_tdm_s": INE_TDM_DATA_TIMEOUT_s,
+            "inertial_fdm_s": INE_FDM_DATA_TIMEOUT_s
+        }
+        intervals.update(self.configuration.get("intervals", {}))
+        intervals.update(device_configuration.get("intervals", {}))
+        return intervals
 
     #
-    # Setting the flag for getting time domain data.
+    # Getting and publishing environmental data.
     #
-    def set_tdm_flag(self, flag):
-        # Setting the flag for getting time domain data.
-        self.ine_tdm_flags[flag] = True
+    def process_env(self, device, client):
+        self.process(device, client, STREAM_ENV, self.get_env, self.publish_env)
 
     #
-    # Setting the flag for getting frequency domain data.
+    # Getting and publishing time domain data.
     #
-    def set_fdm_flag(self, flag):
-        # Setting the flag for getting frequency domain data.
-        self.ine_fdm_flags[flag] = True
+    def process_ine_tdm(self, device, client):
+        self.process(
+            device, client, STREAM_TDM, self.get_tdm, self.publish_ine_tdm)
 
     #
-    # Setting the flag for getting shadow state from AWS IoT.
+    # Getting and publishing frequency domain data.
     #
-    def set_shadow_flag(self, flag):
-        # Setting the flag for getting shadow state from AWS IoT.
-        self.shadow_flags[flag] = True
+    def process_ine_fdm(self, device, client):
+        self.process(
+            device, client, STREAM_FDM, self.get_fdm, self.publish_ine_fdm)
+
+    #
+    # Getting and publishing data of a stream, measuring the stages.
+    #
+    def process(self, device, client, stream, get, publish):
+        client_name = self.get_name(client)
+        start = time.monotonic()
+        try:
+            # Getting data.
+            data = get(device)
+            acquisition_time = time.time()
+            self.observe_stage(client_name, stream, STAGE_ACQUIRE, start)
+            self.metrics.increment(METRIC_SAMPLES, (client_name, stream))
+            with self.samples_lock:
+                self.samples_count += 1
+                samples_count = self.samples_count
+            if self.profile_samples and samples_count >= self.profile_samples:
+                self.stop()
+
+            # Publishing data.
+            publish(data, client, acquisition_time)
+        except Exception:
+            self.metrics.increment(METRIC_ERRORS, (client_name, stream))
+            raise
+        self.observe_stage(client_name, stream, STAGE_TOTAL, start)
 
     #
     # Getting handshake data.
     #
     def get_handshake(self, device):
         data = []
-        if isinstance(device, IOLinkDevice):
+        if self.is_iolink_device(device):
             data.append("STEVAL-BFA001VxB")
             data.append(device.get_firmware())
             data.append(device.get_features())
@@ -626,7 +1014,7 @@ class PMP():
     # Getting environmental data.
     #
     def get_env(self, device):
-        if isinstance(device, IOLinkDevice):
+        if self.is_iolink_device(device):
             return device.get_env()
         else:
             return [round(1100.0 * random.random(), 3),
@@ -637,7 +1025,7 @@ class PMP():
     # Getting time domain data.
     #
     def get_tdm(self, device):
-        if isinstance(device, IOLinkDevice):
+        if self.is_iolink_device(device):
             return device.get_tdm()
         else:
             return [[round(10.0 * random.random(), 3),
@@ -651,7 +1039,7 @@ class PMP():
     # Getting frequency domain data.
     #
     def get_fdm(self, device):
-        if isinstance(device, IOLinkDevice):
+        if self.is_iolink_device(device):
             return device.get_fft()
         else:
             data = []
@@ -665,6 +1053,9 @@ class PMP():
     #
     # Publishing handshake data.
     #
+    # @return Future of the acknowledgement of the shadow update, whose result
+    #         is a (response status, seconds elapsed) pair.
+    #
     def publish_handshake(self, data, client):
         # Getting a JSON representation of the message to publish.
         state_json = {
@@ -681,94 +1072,446 @@ class PMP():
         state_json_str = json.dumps(state_json, sort_keys=True)
         print('[%s] (%s): %s' % \
             (client.get_name(), self.timestamp(), state_json_str))
+        future = concurrent.futures.Future()
         client.update_shadow_state(
             state_json_str,
-            self.on_shadow_update_callback,
+            functools.partial(
+                self.on_handshake_ack_callback, future, time.monotonic()),
             SHADOW_CALLBACK_TIMEOUT_s)
+        return future
 
     #
     # Publishing Environmental data.
     #
-    def publish_env(self, data, client):
+    # @param acquisition_time Acquisition time of the data, as given by
+    #                         "time.time()", now if not given.
+    #
+    def publish_env(self, data, client, acquisition_time=None):
         # Getting a JSON representation of the message to publish.
         data_json = {
             "Pressure": data[EnvIndex.PRESSURE.value], 
             "Humidity": data[EnvIndex.HUMIDITY.value], 
             "Temperature": data[EnvIndex.TEMPERATURE.value]
         }
+        client_name = self.get_name(client)
+        if acquisition_time is None:
+            acquisition_time = time.time()
+
+        # Checking for local anomalies.
+        self.check_anomalies(
+            client_name, deadband.STREAM_ENVIRONMENTAL, data_json)
+
+        # Skipping samples within the deadbands, which are dumped anyway.
+        if not self.check_deadband(
+            client_name, deadband.STREAM_ENVIRONMENTAL, data_json):
+            self.dump_env(client_name,
+                self.encode_sample(data_json, acquisition_time))
+            return
 
         # Publishing the message.
-        client_name = client.get_name() if isinstance(client, AWSClient) \
-            else client
-        data_json_str = json.dumps(data_json, sort_keys=True)
-        print('[%s] (%s): %s' % \
-            (client_name, self.timestamp(), data_json_str))
-        if isinstance(client, AWSClient):
-            client.publish(
+        sequence = self.tracer.next_sequence(client_name)
+        start = time.monotonic()
+        data_json_str = self.encode_sample(
+            data_json, acquisition_time, sequence)
+        self.observe_stage(client_name, STREAM_ENV, STAGE_ENCODE, start)
+        self.print_sample(client_name, STREAM_ENV, data_json_str)
+        if self.is_cloud_client(client):
+            self.publish(
+                client,
                 definitions.MQTT_HDR_TOPIC + "/" \
                 + client_name + "/" \
                 + definitions.MQTT_SNS_TOPIC + "/" \
                 + definitions.MQTT_ENV_TOPIC,
                 data_json_str,
-                definitions.MQTT_QOS_0)
+                definitions.MQTT_QOS_0,
+                (STREAM_ENV, sequence, acquisition_time))
         self.dump_env(client_name, data_json_str)
 
     #
     # Publishing Inertial Time Domain data.
     #
-    def publish_ine_tdm(self, data, client):
+    # @param acquisition_time Acquisition time of the data, as given by
+    #                         "time.time()", now if not given.
+    #
+    def publish_ine_tdm(self, data, client, acquisition_time=None):
         # Getting a JSON representation of the message to publish.
         data_json = {
             "RMS_Speed": data[TdmIndex.RMS.value],
             "Peak_Acceleration": data[TdmIndex.PEAK.value]
         }
+        client_name = self.get_name(client)
+        if acquisition_time is None:
+            acquisition_time = time.time()
+
+        # Checking for local anomalies.
+        self.check_anomalies(
+            client_name, deadband.STREAM_INERTIAL_TDM, data_json)
+
+        # Skipping samples within the deadbands, which are dumped anyway.
+        if not self.check_deadband(
+            client_name, deadband.STREAM_INERTIAL_TDM, data_json):
+            self.dump_ine_tdm(client_name,
+                self.encode_sample(data_json, acquisition_time))
+            return
 
         # Publishing the message.
-        client_name = client.get_name() if isinstance(client, AWSClient) \
-            else client
-        data_json_str = json.dumps(data_json, sort_keys=True)
-        print('[%s] (%s): %s' % \
-            (client_name, self.timestamp(), data_json_str))
-        if isinstance(client, AWSClient):
-            client.publish(
+        sequence = self.tracer.next_sequence(client_name)
+        start = time.monotonic()
+        data_json_str = self.encode_sample(
+            data_json, acquisition_time, sequence)
+        self.observe_stage(client_name, STREAM_TDM, STAGE_ENCODE, start)
+        self.print_sample(client_name, STREAM_TDM, data_json_str)
+        if self.is_cloud_client(client):
+            self.publish(
+                client,
                 definitions.MQTT_HDR_TOPIC + "/" \
                 + client_name + "/" \
                 + definitions.MQTT_SNS_TOPIC + "/" \
                 + definitions.MQTT_INE_TOPIC \
                 + definitions.MQTT_TDM_TOPIC,
                 data_json_str,
-                definitions.MQTT_QOS_0)
+                definitions.MQTT_QOS_0,
+                (STREAM_TDM, sequence, acquisition_time))
         self.dump_ine_tdm(client_name, data_json_str)
 
     #
     # Publishing Inertial Frequency Domain data.
     #
-    def publish_ine_fdm(self, data, client):
-        # Getting a JSON representation of the message to publish.
-        data_json = {
-            "Ine_FFT": data
-        }
+    # @param acquisition_time Acquisition time of the data, as given by
+    #                         "time.time()", now if not given.
+    #
+    def publish_ine_fdm(self, data, client, acquisition_time=None):
+        client_name = self.get_name(client)
+        if acquisition_time is None:
+            acquisition_time = time.time()
+
+        # Publishing the reduced spectrum, and the full one only on keyframes.
+        if client_name in self.reducers:
+            reducer = self.reducers[client_name]
+            if not len(data):
+                self.dump_ine_fdm(client_name, data)
+                return
+            sequence = self.tracer.next_sequence(client_name)
+            start = time.monotonic()
+            data_json_str = self.encode_sample(
+                reducer.reduce(data), acquisition_time, sequence)
+            self.observe_stage(
+                client_name, STREAM_FDM_RED, STAGE_ENCODE, start)
+            self.print_sample(client_name, STREAM_FDM_RED, data_json_str)
+            if self.is_cloud_client(client):
+                self.publish(
+                    client,
+                    definitions.MQTT_HDR_TOPIC + "/" \
+                    + client_name + "/" \
+                    + definitions.MQTT_SNS_TOPIC + "/" \
+                    + definitions.MQTT_INE_TOPIC \
+                    + definitions.MQTT_FDM_TOPIC \
+                    + definitions.MQTT_RED_TOPIC,
+                    data_json_str,
+                    definitions.MQTT_QOS_0,
+                    (STREAM_FDM_RED, sequence, acquisition_time))
+            if not reducer.is_keyframe():
+                self.dump_ine_fdm(client_name, data)
+                return
 
         # Publishing the message.
         data_json_tmp = {
             "Ine_FFT": "[" + str(len(data)) + "]"
         }
-        client_name = client.get_name() if isinstance(client, AWSClient) \
-            else client
         data_json_tmp_str = json.dumps(data_json_tmp, sort_keys=True)
-        print('[%s] (%s): %s' % \
-            (client_name, self.timestamp(), data_json_tmp_str))
-        data_json_str = json.dumps(data_json, sort_keys=True)
-        if isinstance(client, AWSClient):
-            client.publish(
+        self.print_sample(client_name, STREAM_FDM, data_json_tmp_str)
+        if self.is_cloud_client(client):
+            sequence = self.tracer.next_sequence(client_name)
+            start = time.monotonic()
+            payload = self.encode_ine_fdm(data, client_name,
+                sequence, int(acquisition_time * 1000))
+            self.observe_stage(client_name, STREAM_FDM, STAGE_ENCODE, start)
+            self.publish(
+                client,
                 definitions.MQTT_HDR_TOPIC + "/" \
                 + client_name + "/" \
                 + definitions.MQTT_SNS_TOPIC + "/" \
                 + definitions.MQTT_INE_TOPIC \
                 + definitions.MQTT_FDM_TOPIC,
-                data_json_str,
-                definitions.MQTT_QOS_0)
-        self.dump_ine_fdm(client_name, data_json_str)
+                payload,
+                definitions.MQTT_QOS_0,
+                (STREAM_FDM, sequence, acquisition_time))
+        self.dump_ine_fdm(client_name, data)
+
+    #
+    # Encoding Inertial Frequency Domain data with the encoding configured for
+    # the device, either JSON or one of the binary formats of "fdm_codec".
+    #
+    # @param sequence     Sequence number of the sample.
+    # @param timestamp_ms Acquisition time of the sample [ms since the epoch].
+    #
+    def encode_ine_fdm(self, data, device_name, sequence, timestamp_ms):
+        encoding = self.devices_configuration[device_name].get(
+            "fdm_encoding", fdm_codec.ENCODING_JSON)
+        if encoding != fdm_codec.ENCODING_JSON:
+            try:
+                return fdm_codec.encode(data, encoding, sequence, timestamp_ms)
+            except ValueError as e:
+                self.log(logging.WARNING,
+                    'Device \"%s\": %s Falling back to JSON encoding.',
+                    device_name, e)
+                self.devices_configuration[device_name]["fdm_encoding"] = \
+                    fdm_codec.ENCODING_JSON
+
+        # Getting a JSON representation of the message to publish.
+        data_json = {
+            "Ine_FFT": data,
+            "Sequence": sequence,
+            "Timestamp": timestamp_ms
+        }
+        return json.dumps(data_json, sort_keys=True)
+
+    #
+    # Getting the JSON representation of a sample, stamped with its acquisition
+    # time [ms since the epoch] and, when published, its sequence number.
+    #
+    def encode_sample(self, data_json, acquisition_time, sequence=None):
+        data_json = dict(data_json, Timestamp=int(acquisition_time * 1000))
+        if sequence is not None:
+            data_json["Sequence"] = sequence
+        return json.dumps(data_json, sort_keys=True)
+
+    #
+    # Initializing publishing.
+    # When the spool is enabled messages are published by a background thread,
+    # and stored on disk while they cannot be delivered. Messages are published
+    # directly if the spool cannot be opened.
+    #
+    def initialize_publishing(self, clients):
+        spool_configuration = self.configuration.get("spool", {})
+        if not spool_configuration.get("enabled", False):
+            return
+        spool_path = spool_configuration.get("path", definitions.SPOOL_PATH)
+        try:
+            message_spool = spool.Spool(
+                spool_path,
+                spool_configuration.get("max_size_bytes",
+                    spool.DEFAULT_MAX_SIZE_bytes),
+                spool_configuration.get("max_age_s",
+                    spool.DEFAULT_MAX_AGE_s),
+                spool_configuration.get("segment_size_bytes",
+                    spool.DEFAULT_SEGMENT_SIZE_bytes))
+        except OSError as e:
+            print('Spool "%s" cannot be opened, publishing directly: %s\n' % \
+                (spool_path, e))
+            return
+        self.publisher = spool.SpoolPublisher(
+            dict((client.get_name(), client) for client in clients),
+            message_spool,
+            spool_configuration.get("live_queue_size",
+                spool.DEFAULT_LIVE_QUEUE_SIZE),
+            spool_configuration.get("replay_rate_msgs_per_s",
+                spool.DEFAULT_REPLAY_RATE_msgs_per_s),
+            spool_configuration.get("retry_interval_s",
+                spool.DEFAULT_RETRY_INTERVAL_s))
+        self.publisher.add_listener(MySpoolPublisherListener(self))
+        self.publisher.start()
+
+    #
+    # Publishing a message, either directly or through the spool.
+    #
+    # @param trace Optional (stream, sequence number, acquisition time) tuple,
+    #              to measure the latency when the message is acknowledged.
+    #
+    def publish(self, client, topic, payload, qos, trace=None):
+        start = time.monotonic()
+        if self.publisher:
+            self.publisher.publish(
+                client.get_name(), topic, payload, qos, trace)
+        else:
+            client.publish(topic, payload, qos)
+            if trace:
+                self.on_published(client.get_name(), trace, time.time())
+        labels = (client.get_name(), topic[topic.rfind('/') + 1:])
+        self.metrics.observe(METRIC_STAGE_DURATION, labels + (STAGE_PUBLISH,),
+            time.monotonic() - start)
+        self.metrics.increment(METRIC_PUBLISHED_MESSAGES, labels)
+        self.metrics.increment(METRIC_PUBLISHED_BYTES, labels, len(payload))
+
+    #
+    # To be called whenever a traced message has been acknowledged.
+    #
+    def on_published(self, device_name, trace, ack_time):
+        stream, sequence, acquisition_time = trace
+        self.tracer.on_published(
+            device_name, stream, sequence, acquisition_time, ack_time)
+
+    #
+    # Closing publishing, storing the messages not yet published.
+    #
+    def close_publishing(self):
+        if self.publisher:
+            self.publisher.close()
+            self.publisher = None
+
+    #
+    # Initializing the reduction of Inertial Frequency Domain data for the
+    # devices having a "fdm_reduction" configuration, either their own or the
+    # global one. The "fdm_reduction" module is imported only when needed, as it
+    # depends on NumPy.
+    #
+    def initialize_reduction(self):
+        self.reducers = {}
+        for device in self.configuration["setup"]["devices"]:
+            configuration = device.get("fdm_reduction",
+                self.configuration.get("fdm_reduction"))
+            if configuration and configuration.get("stages"):
+                from utils import fdm_reduction
+                self.reducers[device["name"]] = \
+                    fdm_reduction.SpectrumReducer(configuration)
+
+    #
+    # Initializing the deadband filters of the environmental and inertial time
+    # domain streams of the devices. The "deadband" configuration of a stream
+    # is taken from the device, if present, or from the global one.
+    #
+    def initialize_deadbands(self):
+        self.deadbands = {}
+        global_configuration = self.configuration.get("deadband", {})
+        for device in self.configuration["setup"]["devices"]:
+            device_configuration = device.get("deadband", {})
+            for stream in [deadband.STREAM_ENVIRONMENTAL,
+                deadband.STREAM_INERTIAL_TDM]:
+                configuration = device_configuration.get(stream,
+                    global_configuration.get(stream))
+                if configuration:
+                    self.deadbands[(device["name"], stream)] = \
+                        deadband.Deadband(configuration)
+
+    #
+    # Checking whether a sample of a stream of a device has to be published
+    # according to its deadband filter, if any.
+    #
+    def check_deadband(self, device_name, stream, sample):
+        if (device_name, stream) not in self.deadbands:
+            return True
+        deadband_filter = self.deadbands[(device_name, stream)]
+        published = deadband_filter.check(sample)
+        self.metrics.set(METRIC_DEADBAND_PUBLISHED, (device_name, stream),
+            deadband_filter.get_published())
+        self.metrics.set(METRIC_DEADBAND_SUPPRESSED, (device_name, stream),
+            deadband_filter.get_suppressed())
+        return published
+
+    #
+    # Initializing the local detection of anomalies on the environmental and
+    # inertial time domain streams, if enabled by the "anomaly" configuration.
+    #
+    def initialize_anomaly_detection(self):
+        configuration = self.configuration.get("anomaly", {})
+        self.anomaly_detector = stream_stats.AnomalyDetector(configuration) \
+            if configuration.get("enabled", False) else None
+
+    #
+    # Checking a sample of a stream of a device for local anomalies, and
+    # printing the events raised, if any.
+    #
+    def check_anomalies(self, device_name, stream, sample):
+        if not self.anomaly_detector:
+            return
+        for event in self.anomaly_detector.check(device_name, stream, sample):
+            self.print_event(
+                event.device_name, event.severity, event.message,
+                round(event.value, 3))
+
+    #
+    # Creating the metrics of the application.
+    #
+    def create_metrics(self):
+        registry = metrics.MetricsRegistry()
+        registry.add_histogram(METRIC_STAGE_DURATION,
+            'Duration of the stages of the acquisition loop.',
+            ('device', 'stream', 'stage'))
+        registry.add_counter(METRIC_SAMPLES,
+            'Samples acquired.', ('device', 'stream'))
+        registry.add_counter(METRIC_PUBLISHED_MESSAGES,
+            'Messages published.', ('device', 'stream'))
+        registry.add_counter(METRIC_PUBLISHED_BYTES,
+            'Bytes of the payloads published.', ('device', 'stream'))
+        registry.add_counter(METRIC_ERRORS,
+            'Errors while getting and publishing samples.',
+            ('device', 'stream'))
+        registry.add_histogram(METRIC_SCHEDULER_LATENESS,
+            'Delay between the due time and the start of the tasks.',
+            ('task',))
+        registry.add_counter(METRIC_SCHEDULER_SKIPPED,
+            'Periods skipped by the tasks.', ('task',))
+        registry.add_counter(METRIC_DEADBAND_PUBLISHED,
+            'Samples published by the deadband filters.', ('device', 'stream'))
+        registry.add_counter(METRIC_DEADBAND_SUPPRESSED,
+            'Samples suppressed by the deadband filters.', ('device', 'stream'))
+        return registry
+
+    #
+    # Measuring the duration of a stage of a stream of a device.
+    #
+    # @param start Start time of the stage, as given by "time.monotonic()".
+    #
+    def observe_stage(self, device_name, stream, stage, start):
+        self.metrics.observe(METRIC_STAGE_DURATION,
+            (device_name, stream, stage), time.monotonic() - start)
+
+    #
+    # Initializing the periodic export of the metrics, if enabled by the
+    # "metrics" configuration.
+    #
+    def initialize_metrics(self):
+        configuration = self.configuration.get("metrics", {})
+        if not configuration.get("enabled", False):
+            return
+        try:
+            self.metrics_exporter = metrics.MetricsExporter(
+                self.metrics,
+                configuration.get("textfile_path"),
+                configuration.get("interval_s",
+                    metrics.DEFAULT_EXPORT_INTERVAL_s),
+                configuration.get("http_port", 0))
+            self.metrics_exporter.start()
+        except OSError as e:
+            print('Metrics cannot be exported: %s\n' % (e))
+
+    #
+    # Closing the export of the metrics, exporting them a last time.
+    #
+    def close_metrics(self):
+        if self.metrics_exporter:
+            self.metrics_exporter.close()
+            self.metrics_exporter = None
+
+    #
+    # Starting profiling the acquisition loop, if requested, and the timer which
+    # stops the application after the requested duration, if any.
+    #
+    def start_profiling(self):
+        if not self.profile_mode:
+            return
+        self.samples_count = 0
+        self.profiler = profiling.create_profiler(self.profile_mode)
+        self.profiler.start()
+        if self.profile_duration_s:
+            self.profile_timer = threading.Timer(
+                self.profile_duration_s, self.stop)
+            self.profile_timer.daemon = True
+            self.profile_timer.start()
+
+    #
+    # Stopping profiling and writing its results, if profiling.
+    #
+    def close_profiling(self):
+        if self.profile_timer:
+            self.profile_timer.cancel()
+            self.profile_timer = None
+        if self.profiler:
+            self.profiler.stop()
+            summary = self.profiler.write(self.profile_output, self.profile_top)
+            self.profiler = None
+            print('\n%s\nProfiling results written to \"%s.*\".\n' % \
+                (summary, self.profile_output))
 
     #
     # Initializing dumping process.
@@ -778,65 +1521,104 @@ class PMP():
         self.tdm_samples = {}
         self.fdm_samples = {}
         for device in devices:
-            device_name = device.get_name() if isinstance(device, IOLinkDevice) \
-                else device
+            device_name = self.get_name(device)
             self.env_samples[device_name] = self.configuration["dump"]["env_samples"]
             self.tdm_samples[device_name] = self.configuration["dump"]["tdm_samples"]
             self.fdm_samples[device_name] = self.configuration["dump"]["fdm_samples"]
 
     #
-    # Dumping Inertial Frequency Domain data.
+    # Dumping Environmental data.
     #
     def dump_env(self, device_name, data_json_str):
         if self.env_samples[device_name]:
-            data_json_str = data_json_str.replace('}', '}\r\n')
+            start = time.monotonic()
             fn = device_name + '_' + definitions.MQTT_ENV_TOPIC + DUMP_EXT
-            fd = open(fn, 'a')
-            fd.write(data_json_str)
-            fd.close()
+            self.get_dump_writer(fn).write_record(data_json_str)
             self.env_samples[device_name] -= 1
+            if not self.env_samples[device_name]:
+                self.close_dump_writer(fn)
+            self.observe_stage(device_name, STREAM_ENV, STAGE_DUMP, start)
             self.check_dumping()
 
     #
-    # Dumping Inertial Frequency Domain data.
+    # Dumping Inertial Time Domain data.
     #
     def dump_ine_tdm(self, device_name, data_json_str):
         if self.tdm_samples[device_name]:
-            data_json_str = data_json_str.replace('}', '}\r\n')
+            start = time.monotonic()
             fn = device_name + '_' + definitions.MQTT_INE_TOPIC + definitions.MQTT_TDM_TOPIC + DUMP_EXT
-            fd = open(fn, 'a')
-            fd.write(data_json_str)
-            fd.close()
+            self.get_dump_writer(fn).write_record(data_json_str)
             self.tdm_samples[device_name] -= 1
+            if not self.tdm_samples[device_name]:
+                self.close_dump_writer(fn)
+            self.observe_stage(device_name, STREAM_TDM, STAGE_DUMP, start)
             self.check_dumping()
 
     #
     # Dumping Inertial Frequency Domain data.
     #
-    def dump_ine_fdm(self, device_name, data_json_str):
+    def dump_ine_fdm(self, device_name, data):
         if self.fdm_samples[device_name]:
-            data_json_str = data_json_str.replace(': [[', ': [\r\n[')
-            data_json_str = data_json_str.replace('], [', '], \r\n[')
-            data_json_str = data_json_str.replace(']]}', ']\r\n]}\r\n')
+            start = time.monotonic()
             fn = device_name + '_' + definitions.MQTT_INE_TOPIC + definitions.MQTT_FDM_TOPIC + DUMP_EXT
-            fd = open(fn, 'a')
-            fd.write(data_json_str)
-            fd.close()
+            self.get_dump_writer(fn).write_rows_record("Ine_FFT", data)
             self.fdm_samples[device_name] -= 1
+            if not self.fdm_samples[device_name]:
+                self.close_dump_writer(fn)
+            self.observe_stage(device_name, STREAM_FDM, STAGE_DUMP, start)
             self.check_dumping()
 
+    #
+    # Getting the writer of a dump file, opening it if needed.
+    #
+    # Dump files are written by the polling worker of their device only, while
+    # the dictionary of their writers is shared among the workers.
+    #
+    def get_dump_writer(self, fn):
+        with self.dump_lock:
+            if fn not in self.dump_writers:
+                self.dump_writers[fn] = dump_writer.DumpWriter(
+                    fn,
+                    self.configuration["dump"].get("flush_every_samples",
+                        dump_writer.DEFAULT_FLUSH_EVERY_SAMPLES),
+                    self.configuration["dump"].get("flush_interval_s",
+                        dump_writer.DEFAULT_FLUSH_INTERVAL_s))
+            return self.dump_writers[fn]
+
+    #
+    # Closing the writer of a dump file.
+    #
+    def close_dump_writer(self, fn):
+        with self.dump_lock:
+            writer = self.dump_writers.pop(fn, None)
+        if writer:
+            writer.close()
+
+    #
+    # Closing all the dump files, flushing pending samples.
+    #
+    def close_dumping(self):
+        with self.dump_lock:
+            fns = list(self.dump_writers)
+        for fn in fns:
+            self.close_dump_writer(fn)
+
     #
     # Checking dumping process.
+    # When all the samples have been dumped the application is stopped.
     #
     def check_dumping(self):
-        end = 0
-        for device_name in self.fdm_samples:
-            end += self.env_samples[device_name] + \
-                self.tdm_samples[device_name] + \
-                self.fdm_samples[device_name]
-        if not end:
-            print('\nDumping samples completed.\n\nExiting...\n')
-            sys.exit(0)
+        with self.dump_lock:
+            end = 0
+            for device_name in self.fdm_samples:
+                end += self.env_samples[device_name] + \
+                    self.tdm_samples[device_name] + \
+                    self.fdm_samples[device_name]
+            if end or self.dumping_completed:
+                return
+            self.dumping_completed = True
+        print('\nDumping samples completed.\n\nExiting...\n')
+        self.stop()
 
     #
     # Custom shadow callback for "get()" operations.
@@ -844,7 +1626,8 @@ class PMP():
     def on_shadow_get_callback(self, payload, response_status, token):
         # "payload" is a JSON string ready to be parsed using "json.loads()"
         # both in both Python 2.x and Python 3.x
-        print("Get request with token \"" + token + "\" " + response_status)
+        self.log(logging.INFO, 'Get request with token \"%s\" %s',
+            token, response_status)
         #if response_status == "accepted":
         #state_json_str = json.loads(payload)
         #print(state_json_str)
@@ -855,11 +1638,22 @@ class PMP():
     def on_shadow_update_callback(self, payload, response_status, token):
         # "payload" is a JSON string ready to be parsed using "json.loads()"
         # both in both Python 2.x and Python 3.x
-        print("Update request with token \"" + token + "\" " + response_status)
+        self.log(logging.INFO, 'Update request with token \"%s\" %s',
+            token, response_status)
         #if response_status == "accepted":
         #state_json_str = json.loads(payload)
         #print(state_json_str)
 
+    #
+    # Custom shadow callback for the "update()" operation of the handshake,
+    # completing the future of its acknowledgement.
+    #
+    def on_handshake_ack_callback(self, future, start, payload,
+        response_status, token):
+        self.on_shadow_update_callback(payload, response_status, token)
+        if not future.done():
+            future.set_result((response_status, time.monotonic() - start))
+
     #
     # Custom shadow callback for "update-delta()" operations.
     #
@@ -877,7 +1671,8 @@ class PMP():
     def on_shadow_delete_callback(self, payload, response_status, token):
         # "payload" is a JSON string ready to be parsed using "json.loads()"
         # both in both Python 2.x and Python 3.x
-        print("Delete request with token \"" + token + "\" " + response_status)
+        self.log(logging.INFO, 'Delete request with token \"%s\" %s',
+            token, response_status)
         #if response_status == "accepted":
         #    state_json_str = json.loads(payload)
 
@@ -890,18 +1685,67 @@ class PMP():
         message_json = json.loads(message.payload.decode('utf-8'))
         message_json["client"] = client
         severity = message_json["severity"]
-        print('[%s] (%s): Event of severity \"%d\": %s%s' % (\
-            client,
-            self.timestamp(),
-            severity,
-            message_json["msg"],
-            '' if not severity else (' (%s)' % (message_json["info"]["value"]))))
+        self.print_event(client, severity, message_json["msg"],
+            None if not severity else message_json["info"]["value"])
+
+    #
+    # Printing a sample to the console, unless quiet, and writing it to the
+    # event stream, if any.
+    # Through the logging pipeline, samples are printed or summarized according
+    # to the level of their stream.
+    #
+    def print_sample(self, client, stream, data_json_str):
+        if self.quiet:
+            pass
+        elif self.log_pipeline:
+            self.log_pipeline.log_sample(
+                client, stream, self.timestamp(), data_json_str)
+        else:
+            print('[%s] (%s): %s' % \
+                (client, self.timestamp(), data_json_str))
+        if self.event_stream:
+            self.event_stream.write_sample(client, stream, data_json_str)
+
+    #
+    # Printing an event to the console, unless quiet, and writing it to the
+    # event stream, if any.
+    #
+    def print_event(self, client, severity, message, value=None):
+        if not self.quiet:
+            self.log(logging.WARNING,
+                '[%s] (%s): Event of severity \"%d\": %s%s',
+                client,
+                self.timestamp(),
+                severity,
+                message,
+                '' if value is None else (' (%s)' % (value)))
+        if self.event_stream:
+            self.event_stream.write_event(client, severity, message, value)
+
+    #
+    # Printing a status message to the console, unless quiet, and writing it to
+    # the event stream, if any.
+    #
+    # @param status  Status, see "event_stream.STATUS_*".
+    # @param message Human-readable message.
+    # @param fields  Optional dictionary of fields related to the status.
+    #
+    def print_status(self, status, message, fields=None):
+        if not self.quiet:
+            self.log(logging.INFO, message)
+        if self.event_stream:
+            self.event_stream.write_status(status, message.strip(), fields)
 
     #
     # Get the current timestamp.
+    # The formatted timestamp is cached, and recomputed once per second.
     #
     def timestamp(self):
-        return time.strftime("%H:%M:%S")
+        now = int(time.time())
+        if now != self._timestamp[0]:
+            self._timestamp = \
+                (now, time.strftime("%H:%M:%S", time.localtime(now)))
+        return self._timestamp[1]
 
 
 # RUNNING MAIN APPLICATION
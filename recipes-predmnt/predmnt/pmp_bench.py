@@ -0,0 +1,495 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This application benchmarks the acquisition, publishing and dumping path of
+# the Predictive Maintenance application with simulated devices and in-memory
+# cloud clients, and reports throughput, per-stage latencies and memory usage.
+#
+# Devices are spread over simulated buses, each one polled by its own worker as
+# in the application. A simulated serial transfer time per acquisition models
+# the time spent waiting for the Masterboards, which is what polling the buses
+# in parallel overlaps. With "--scaling" the benchmark is repeated from one bus
+# up to the given number of buses, to report how throughput scales.
+
+
+# IMPORT
+
+from __future__ import print_function
+import os
+import sys
+import getopt
+import json
+import copy
+import time
+import shutil
+import platform
+import tempfile
+import resource
+import threading
+import functools
+
+from edge_st_sdk.aws.aws_client import AWSClient
+
+from pmp import PMP
+from utils import definitions
+from utils import fdm_codec
+
+
+# CONSTANTS
+
+# Usage message.
+USAGE = """Usage:
+
+python3 pmp_bench.py [-h] [-d <devices>] [-n <iterations>] [-e <encoding>]
+    [-b <buses>] [-l <serial_latency_ms>] [-o <output_file>] [--scaling]
+    [--dump] [--console]
+
+"""
+
+# Help message.
+HELP = """-h, --help
+    Shows these help information.
+-d, --devices
+    Number of simulated devices (default: %d).
+-n, --iterations
+    Number of acquisition cycles per device (default: %d).
+-e, --encoding
+    Encoding of Inertial Frequency Domain data: %s (default: %s).
+-b, --buses
+    Number of simulated buses, i.e. Masterboards, the devices are spread over
+    (default: %d).
+-l, --serial-latency-ms
+    Simulated serial transfer time of each acquisition [ms] (default: %d).
+--scaling
+    Repeats the benchmark from one bus up to the given number of buses, and
+    reports the throughput of each run.
+-o, --output-file
+    File where to write the results in JSON format (default: "%s").
+--dump
+    Enables dumping of all the samples to log files in a temporary folder.
+--console
+    Keeps the console output of the application, which is discarded otherwise.
+"""
+
+# Defaults.
+DEFAULT_DEVICES = 4
+DEFAULT_ITERATIONS = 50
+DEFAULT_BUSES = 1
+DEFAULT_SERIAL_LATENCY_ms = 0
+DEFAULT_OUTPUT_FILE = 'pmp_bench.json'
+
+# Simulated serial ports.
+SERIAL_PORT_NAME = 'bench_bus_%d'
+
+# Version of the results' format.
+RESULTS_VERSION = 2
+
+# Streams and stages.
+STREAMS = [
+    definitions.MQTT_ENV_TOPIC,
+    definitions.MQTT_INE_TOPIC + definitions.MQTT_TDM_TOPIC,
+    definitions.MQTT_INE_TOPIC + definitions.MQTT_FDM_TOPIC
+]
+STAGES = ['acquisition', 'publishing', 'dumping']
+
+# Percentiles to report.
+PERCENTILES = [50, 90, 99]
+
+
+# CLASSES
+
+#
+# In-memory AWS client which counts the messages published.
+#
+class FakeAWSClient(AWSClient):
+
+    #
+    # Constructor.
+    #
+    def __init__(self, name):
+        self._name = name
+        self.messages = 0
+        self.bytes = 0
+
+    #
+    # Get the name of the client.
+    #
+    def get_name(self):
+        return self._name
+
+    #
+    # Publish a message.
+    #
+    def publish(self, topic, payload, qos):
+        self.messages += 1
+        self.bytes += len(payload)
+        return True
+
+
+#
+# Collector of latencies.
+#
+class Latencies(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self):
+        self._samples = {}
+        for stream in STREAMS:
+            self._samples[stream] = {}
+            for stage in STAGES:
+                self._samples[stream][stage] = []
+
+    #
+    # Add a latency in seconds.
+    #
+    def add(self, stream, stage, latency_s):
+        self._samples[stream][stage].append(latency_s)
+
+    #
+    # Get the latencies in seconds of a stage.
+    #
+    def get_samples(self, stream, stage):
+        return self._samples[stream][stage]
+
+    #
+    # Get the statistics of the latencies in milliseconds.
+    #
+    def get_statistics(self):
+        statistics = {}
+        for stream in STREAMS:
+            statistics[stream] = {}
+            for stage in STAGES:
+                samples = sorted(self._samples[stream][stage])
+                if not samples:
+                    continue
+                stage_statistics = {
+                    "count": len(samples),
+                    "mean": 1000.0 * sum(samples) / len(samples),
+                    "max": 1000.0 * samples[-1]
+                }
+                for percentile in PERCENTILES:
+                    index = max(0, -(-percentile * len(samples) // 100) - 1)
+                    stage_statistics["p%d" % (percentile)] = \
+                        1000.0 * samples[index]
+                statistics[stream][stage] = stage_statistics
+        return statistics
+
+
+#
+# Benchmark application class.
+#
+class PMPBench():
+
+    #
+    # Constructor.
+    #
+    def __init__(self, argv):
+        self._argv = argv
+
+    #
+    # Start the benchmark.
+    #
+    def start(self):
+        parameters = self.read_input(self._argv)
+        working_path = tempfile.mkdtemp(prefix='pmp_bench_')
+        output_file = os.path.abspath(parameters["output_file"])
+        current_path = os.getcwd()
+        try:
+            os.chdir(working_path)
+            if parameters["scaling"]:
+                runs = []
+                for buses in range(1, parameters["buses"] + 1):
+                    runs.append(self.run(parameters, working_path, buses))
+                results = runs[-1]
+                results["scaling"] = [{
+                    "buses": buses,
+                    "messages_per_s": run["messages_per_s"],
+                    "speedup": run["messages_per_s"] / runs[0]["messages_per_s"]
+                } for buses, run in enumerate(runs, 1)]
+            else:
+                results = self.run(parameters, working_path, parameters["buses"])
+        finally:
+            os.chdir(current_path)
+            shutil.rmtree(working_path, ignore_errors=True)
+        report = {
+            "version": RESULTS_VERSION,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": {
+                "machine": platform.machine(),
+                "system": platform.system(),
+                "python": platform.python_version()
+            },
+            "parameters": parameters,
+            "results": results
+        }
+        with open(output_file, 'w') as fp:
+            json.dump(report, fp, indent=4, sort_keys=True)
+        self.print_report(report)
+        print('\nResults written to \"%s\".\n' % (output_file))
+
+    #
+    # Reading input.
+    #
+    def read_input(self, argv):
+        parameters = {
+            "devices": DEFAULT_DEVICES,
+            "iterations": DEFAULT_ITERATIONS,
+            "encoding": fdm_codec.ENCODING_JSON,
+            "buses": DEFAULT_BUSES,
+            "serial_latency_ms": DEFAULT_SERIAL_LATENCY_ms,
+            "output_file": DEFAULT_OUTPUT_FILE,
+            "scaling": False,
+            "dump": False,
+            "console": False
+        }
+        encodings = [fdm_codec.ENCODING_JSON] + \
+            sorted(fdm_codec.SAMPLE_FORMATS.keys())
+        help_message = USAGE + HELP % (DEFAULT_DEVICES, DEFAULT_ITERATIONS,
+            ', '.join(encodings), fdm_codec.ENCODING_JSON, DEFAULT_BUSES,
+            DEFAULT_SERIAL_LATENCY_ms, DEFAULT_OUTPUT_FILE)
+        try:
+            opts, args = getopt.getopt(argv,
+                "hd:n:e:b:l:o:",
+                ["help", "devices=", "iterations=", "encoding=", "buses=",
+                "serial-latency-ms=", "output-file=", "scaling", "dump",
+                "console"])
+            for opt, arg in opts:
+                if opt in ("-h", "--help"):
+                    print(help_message)
+                    sys.exit(0)
+                if opt in ("-d", "--devices"):
+                    parameters["devices"] = int(arg)
+                if opt in ("-n", "--iterations"):
+                    parameters["iterations"] = int(arg)
+                if opt in ("-e", "--encoding"):
+                    if arg not in encodings:
+                        raise getopt.GetoptError("Unknown encoding!")
+                    parameters["encoding"] = arg
+                if opt in ("-b", "--buses"):
+                    parameters["buses"] = int(arg)
+                if opt in ("-l", "--serial-latency-ms"):
+                    parameters["serial_latency_ms"] = float(arg)
+                if opt in ("-o", "--output-file"):
+                    parameters["output_file"] = arg
+                if opt == "--scaling":
+                    parameters["scaling"] = True
+                if opt == "--dump":
+                    parameters["dump"] = True
+                if opt == "--console":
+                    parameters["console"] = True
+        except (getopt.GetoptError, ValueError):
+            print(help_message)
+            sys.exit(1)
+        if parameters["devices"] < 1 or parameters["iterations"] < 1 or \
+            parameters["buses"] < 1 or parameters["serial_latency_ms"] < 0:
+            print(help_message)
+            sys.exit(1)
+        return parameters
+
+    #
+    # Create the application to benchmark, configured with simulated devices
+    # spread over the given number of buses.
+    #
+    def create_pmp(self, parameters, working_path, buses):
+        configuration = copy.deepcopy(definitions.DEFAULT_PMP_CONFIGURATION_JSON)
+        configuration["setup"]["use_sensors"] = False
+        configuration["setup"]["use_cloud"] = False
+        configuration["serial_ports"] = [{
+            "name": SERIAL_PORT_NAME % (bus + 1),
+            "baudrate_bits_per_second":
+                definitions.SERIAL_PORT_BAUDRATE_bits_per_second
+        } for bus in range(0, buses)]
+        for i in range(0, parameters["devices"]):
+            configuration["setup"]["devices"].append({
+                "name": "bench_device_%d" % (i + 1),
+                "position": i // buses + 1,
+                "serial_port": SERIAL_PORT_NAME % (i % buses + 1),
+                "fdm_encoding": parameters["encoding"]
+            })
+        # One more sample than needed, so that dumping never completes.
+        samples = parameters["iterations"] + 1 if parameters["dump"] else 0
+        configuration["dump"]["env_samples"] = samples
+        configuration["dump"]["tdm_samples"] = samples
+        configuration["dump"]["fdm_samples"] = samples
+        configuration_file = os.path.join(working_path, 'pmp_bench.json')
+        with open(configuration_file, 'w') as fp:
+            json.dump(configuration, fp)
+
+        pmp = PMP([])
+        pmp.read_configuration(configuration_file)
+        return pmp
+
+    #
+    # Wrap a dumping method of the application to measure its latency, which is
+    # also accumulated per thread to be excluded from the publishing latency.
+    #
+    def wrap(self, function, latencies, stream, stage, local):
+        def wrapper(*args):
+            start_time = time.perf_counter()
+            result = function(*args)
+            latency_s = time.perf_counter() - start_time
+            latencies.add(stream, stage, latency_s)
+            local.dump_s += latency_s
+            return result
+        return wrapper
+
+    #
+    # Wrap a method of the application getting data to simulate the serial
+    # transfer time, during which other buses can be polled.
+    #
+    def simulate_serial_latency(self, function, latency_ms):
+        if not latency_ms:
+            return function
+        def wrapper(*args):
+            time.sleep(latency_ms / 1000.0)
+            return function(*args)
+        return wrapper
+
+    #
+    # Run the benchmark.
+    #
+    def run(self, parameters, working_path, buses):
+        pmp = self.create_pmp(parameters, working_path, buses)
+        devices = [device["name"]
+            for device in pmp.configuration["setup"]["devices"]]
+        clients = [FakeAWSClient(device) for device in devices]
+        pmp.initialize_dumping(devices)
+        pmp.initialize_reduction()
+        pmp.initialize_deadbands()
+        pmp.initialize_anomaly_detection()
+
+        # Measuring dumping, which is nested into publishing.
+        latencies = Latencies()
+        local = threading.local()
+        pmp.dump_env = self.wrap(pmp.dump_env, latencies, STREAMS[0], STAGES[2], local)
+        pmp.dump_ine_tdm = self.wrap(pmp.dump_ine_tdm, latencies, STREAMS[1], STAGES[2], local)
+        pmp.dump_ine_fdm = self.wrap(pmp.dump_ine_fdm, latencies, STREAMS[2], STAGES[2], local)
+        stream_functions = [
+            (STREAMS[0], pmp.get_env, pmp.publish_env),
+            (STREAMS[1], pmp.get_tdm, pmp.publish_ine_tdm),
+            (STREAMS[2], pmp.get_fdm, pmp.publish_ine_fdm)
+        ]
+        stream_functions = [(stream, self.simulate_serial_latency(
+            get_function, parameters["serial_latency_ms"]), publish_function)
+            for stream, get_function, publish_function in stream_functions]
+
+        # Polling the devices of a bus.
+        def poll(indexes):
+            local.dump_s = 0.0
+            for iteration in range(0, parameters["iterations"]):
+                for i in indexes:
+                    for stream, get_function, publish_function in stream_functions:
+                        t0 = time.perf_counter()
+                        data = get_function(devices[i])
+                        t1 = time.perf_counter()
+                        publish_function(data, clients[i])
+                        t2 = time.perf_counter()
+                        latencies.add(stream, STAGES[0], t1 - t0)
+                        latencies.add(stream, STAGES[1], t2 - t1 - local.dump_s)
+                        local.dump_s = 0.0
+
+        stdout = sys.stdout
+        if not parameters["console"]:
+            sys.stdout = open(os.devnull, 'w')
+        try:
+            bus_indexes = pmp.get_buses()
+            start_time = time.perf_counter()
+            pmp.run_workers(
+                [functools.partial(poll, indexes)
+                for indexes in bus_indexes.values()],
+                list(bus_indexes))
+            elapsed_s = time.perf_counter() - start_time
+        finally:
+            pmp.close_dumping()
+            if sys.stdout is not stdout:
+                sys.stdout.close()
+                sys.stdout = stdout
+
+        messages = sum(client.messages for client in clients)
+        published_bytes = sum(client.bytes for client in clients)
+        dumped_bytes = sum(os.path.getsize(os.path.join(working_path, fn))
+            for fn in os.listdir(working_path) if fn.endswith('.log'))
+        return {
+            "buses": buses,
+            "elapsed_s": elapsed_s,
+            "messages": messages,
+            "messages_per_s": messages / elapsed_s,
+            "bytes": published_bytes,
+            "bytes_per_s": published_bytes / elapsed_s,
+            "dumped_bytes": dumped_bytes,
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "latency_ms": latencies.get_statistics()
+        }
+
+    #
+    # Print a human-readable report.
+    #
+    def print_report(self, report):
+        parameters = report["parameters"]
+        results = report["results"]
+        print('\nDevices: %d, iterations: %d, encoding: %s, dump: %s.' % \
+            (parameters["devices"], parameters["iterations"],
+            parameters["encoding"], parameters["dump"]))
+        print('Buses: %d, serial latency: %g [ms].\n' % \
+            (results["buses"], parameters["serial_latency_ms"]))
+        print('Messages: %d (%.1f [msg/s])' % \
+            (results["messages"], results["messages_per_s"]))
+        print('Bytes:    %d (%.1f [KB/s])' % \
+            (results["bytes"], results["bytes_per_s"] / 1024.0))
+        print('Peak RSS: %d [KB]\n' % (results["peak_rss_kb"]))
+        print('%-16s %-12s %10s %10s %10s %10s [ms]' % \
+            ('Stream', 'Stage', 'p50', 'p90', 'p99', 'max'))
+        for stream in STREAMS:
+            for stage in STAGES:
+                if stage not in results["latency_ms"][stream]:
+                    continue
+                statistics = results["latency_ms"][stream][stage]
+                print('%-16s %-12s %10.3f %10.3f %10.3f %10.3f' % \
+                    (stream, stage, statistics["p50"], statistics["p90"],
+                    statistics["p99"], statistics["max"]))
+        if "scaling" in results:
+            print('\n%-8s %14s %10s' % ('Buses', '[msg/s]', 'Speedup'))
+            for run in results["scaling"]:
+                print('%-8d %14.1f %10.2f' % \
+                    (run["buses"], run["messages_per_s"], run["speedup"]))
+
+
+# RUNNING MAIN APPLICATION
+
+if __name__ == "__main__":
+    try:
+        bench = PMPBench(sys.argv[1:])
+        bench.start()
+    except KeyboardInterrupt:
+        print('\nExiting...\n')
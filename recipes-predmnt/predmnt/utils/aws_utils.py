@@ -41,10 +41,16 @@
 
 from __future__ import print_function
 import os
+import shutil
+import time
+import threading
+import selectors
 import subprocess
 import json
 
-from utils import gtk_utils
+from utils import fs_utils
+from utils import credentials
+from utils import inotify
 from utils import definitions
 
 
@@ -53,115 +59,312 @@ from utils import definitions
 # AWS Greengrass.
 GREENGRASS_GROUP_PATH = definitions.GREENGRASS_PATH \
     + '/ggc/deployment/group/group.json'
-RESTART_GREENGRASS_COMMAND = definitions.GREENGRASS_PATH \
-    + '/ggc/core/greengrassd restart'
-RESTART_GREENGRASS_OUTPUT_PATH = definitions.HOME_PATH \
-    + '/greengrass_output'
+GREENGRASS_PID_PATH = '/var/run/greengrassd.pid'
+RESTART_GREENGRASS_COMMAND = [definitions.GREENGRASS_PATH \
+    + '/ggc/core/greengrassd', 'restart']
 RESTART_GREENGRASS_OK = 'Greengrass successfully started'
 
+# Credentials.
+EDGE_CREDENTIALS_FOLDER = 'credentials'
+EDGE_CONFIG_MEMBER = 'config/config.json'
+EDGE_CORE_THING_KEYS = ['iotHost', 'caPath']
+EDGE_FOLDERS = ['certs', 'config']
+DEVICE_CERTIFICATE_EXT = '.cert.pem'
+DEVICE_PRIVATE_KEY_EXT = '.private.key'
+
+# Timeouts.
+DEFAULT_RESTART_TIMEOUT_s = 120
+DEFAULT_DEPLOYMENT_TIMEOUT_s = 600
+PROGRESS_INTERVAL_s = 1
+
+# Size of the chunks of output read from processes.
+READ_SIZE_bytes = 4096
+
 
 #FUNCTIONS
 
 #
 # Configure edge gateway for AWS.
 #
-def configure_edge_gateway_aws(edge_gateway_path, textbuffer=None):
-    edge_gateway_basename = os.path.basename(edge_gateway_path)
+# The credentials archive is checked and extracted to a staging folder, whose
+# "certs" and "config" folders then replace the installed ones.
+#
+# @param edge_gateway_path Path of the edge gateway's credentials.
+# @param output_callback   Function called with each message to show.
+# @return True if the credentials have been installed, False otherwise.
+#
+def configure_edge_gateway_aws(edge_gateway_path, output_callback=None):
+    staging_path = credentials.create_staging_folder(
+        definitions.GREENGRASS_PATH + '/' + EDGE_CREDENTIALS_FOLDER)
     try:
-        command = \
-            'cd %s && ' \
-            'rm -rf certs config && ' \
-            'cp %s . && ' \
-            'unzip -o %s && ' \
-            'rm -rf %s 2>&1' % \
-            (definitions.GREENGRASS_PATH, edge_gateway_path,
-                edge_gateway_basename, edge_gateway_basename)
-        output = subprocess.check_output(command,
-            stderr=subprocess.STDOUT, shell=True).decode('utf-8')
-        if textbuffer:
-            gtk_utils.write_to_buffer(textbuffer, output)
-    except subprocess.CalledProcessError as e:
-        pass
-    endpoint = json.load(open(definitions.GREENGRASS_CONFIG_PATH))["coreThing"]["iotHost"]
+        credentials.extract_archive(edge_gateway_path, staging_path,
+            [EDGE_CONFIG_MEMBER])
+        with open(os.path.join(staging_path, EDGE_CONFIG_MEMBER), 'r') as fp:
+            core_thing = json.load(fp).get("coreThing", {})
+        missing = [key for key in EDGE_CORE_THING_KEYS if key not in core_thing]
+        if missing:
+            raise ValueError('Configuration misses \"coreThing.%s\".' % \
+                (missing[0]))
+    except ValueError as e:
+        _write(output_callback, 'Invalid edge gateway credentials: %s\n' % (e))
+        shutil.rmtree(staging_path, ignore_errors=True)
+        return False
+    for folder in EDGE_FOLDERS:
+        if os.path.isdir(os.path.join(staging_path, folder)):
+            credentials.replace_folder(os.path.join(staging_path, folder),
+                os.path.join(definitions.GREENGRASS_PATH, folder))
+    shutil.rmtree(staging_path, ignore_errors=True)
+    _write(output_callback, 'Edge gateway credentials \"%s\" installed.\n' % \
+        (os.path.basename(edge_gateway_path)))
+    return True
+
+#
+# Get the credentials of each device, expanding the folders of archives: the
+# archives of a folder are assigned to consecutive positions starting from the
+# given one, continuing on the following Masterboards.
+#
+# @param devices_dict Dictionary of the paths of the devices' credentials or of
+#                     folders of them, by (masterboard, position) pair.
+# @return Dictionary of the paths of the devices' credentials, by
+#         (masterboard, position) pair.
+# @raise ValueError if a folder has no credentials, or if a position is
+#        assigned twice.
+#
+def get_devices_credentials(devices_dict):
+    devices_credentials = {}
+    for (masterboard, position), path in sorted(devices_dict.items()):
+        archives = credentials.get_archives(path)
+        if not archives:
+            raise ValueError('No credentials found in \"%s\".' % (path))
+        for i, archive_path in enumerate(archives):
+            index = position - 1 + i
+            key = (masterboard + index // definitions.MASTERBOARD_POSITIONS,
+                index % definitions.MASTERBOARD_POSITIONS + 1)
+            if key in devices_credentials:
+                raise ValueError('Masterboard %d, Position %d assigned twice.' % \
+                    key)
+            devices_credentials[key] = archive_path
+    return devices_credentials
 
 #
 # Configure devices for AWS.
 #
-def configure_devices_aws(devices_dict, textbuffer=None):
+# The credentials archives are checked and extracted in parallel to a staging
+# folder, which replaces the installed one only if all of them are valid. The
+# configuration file is then written once.
+#
+# @param devices_dict Dictionary of the paths of the devices' credentials, or of
+#                     folders of them, by (masterboard, position) pair, both
+#                     starting from 1, see "get_devices_credentials()". The
+#                     serial port of the n-th Masterboard is added to the
+#                     configuration if missing.
+# @param output_callback Function called with each message to show.
+# @return True if the credentials have been installed, False otherwise.
+#
+def configure_devices_aws(devices_dict, output_callback=None):
+    start = time.monotonic()
+    with open(definitions.PMP_CONFIGURATION_PATH, 'r') as fp:
+        pmp_configuration_json = json.load(fp)
+    device_certificates_path = \
+        pmp_configuration_json["setup"]["device_certificates_path"]
+    with open(definitions.GREENGRASS_CONFIG_PATH, 'r') as fp:
+        root_ca_path = json.load(fp)["coreThing"]["caPath"]
     try:
-        with open(definitions.PMP_CONFIGURATION_PATH, 'r') as fp:
-            pmp_configuration_json = json.load(fp)
-        device_certificates_path = \
-            pmp_configuration_json["setup"]["device_certificates_path"]
-        command = \
-            'rm -rf %s && ' \
-            'mkdir -p %s 2>&1' % \
-            (device_certificates_path, device_certificates_path)
-        output = subprocess.check_output(command,
-            stderr=subprocess.STDOUT, shell=True).decode('utf-8')
-        if textbuffer:
-            gtk_utils.write_to_buffer(textbuffer, output)
-    except subprocess.CalledProcessError as e:
-        pass
-    root_ca_path = json.load(open(definitions.GREENGRASS_CONFIG_PATH))["coreThing"]["caPath"]
-    for position in devices_dict:
-        device_path = devices_dict[position]
-        device_basename = os.path.basename(device_path)
-        try:
-            command = \
-                'cd %s && ' \
-                'cp %s . && ' \
-                'unzip -o %s && ' \
-                'rm -rf %s %s 2>&1' % \
-                (device_certificates_path, device_path,
-                    device_basename, device_basename, root_ca_path)
-            output = subprocess.check_output(command,
-                stderr=subprocess.STDOUT, shell=True).decode('utf-8')
-            if textbuffer:
-                gtk_utils.write_to_buffer(textbuffer, output)
-        except subprocess.CalledProcessError as e:
-            pass
-        with open(definitions.PMP_CONFIGURATION_PATH, 'r') as fp:
-            pmp_configuration_json = json.load(fp)
+        devices_credentials = get_devices_credentials(devices_dict)
+    except ValueError as e:
+        _write(output_callback, '%s\n' % (e))
+        return False
+    names = [credentials.get_archive_name(path)
+        for path in devices_credentials.values()]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if duplicates:
+        _write(output_callback, 'Duplicated devices \"%s\".\n' % \
+            ('\", \"'.join(duplicates)))
+        return False
+
+    # Extracting credentials.
+    staging_path = credentials.create_staging_folder(device_certificates_path)
+    extracted, errors = credentials.extract_archives([
+        (path, staging_path,
+            [credentials.get_archive_name(path) + DEVICE_CERTIFICATE_EXT,
+            credentials.get_archive_name(path) + DEVICE_PRIVATE_KEY_EXT],
+            [os.path.basename(root_ca_path)])
+        for path in devices_credentials.values()])
+    if errors:
+        for path in sorted(errors):
+            _write(output_callback, '%s\n' % (errors[path]))
+        shutil.rmtree(staging_path, ignore_errors=True)
+        return False
+    credentials.replace_folder(staging_path, device_certificates_path)
+
+    # Updating configuration.
+    serial_ports = pmp_configuration_json.setdefault("serial_ports", [])
+    for (masterboard, position), path in sorted(devices_credentials.items()):
+        serial_port_name = definitions.SERIAL_PORT_NAME % (masterboard - 1)
+        if serial_port_name not in \
+            [serial_port["name"] for serial_port in serial_ports]:
+            serial_ports.append({
+                "name": serial_port_name,
+                "baudrate_bits_per_second":
+                    definitions.SERIAL_PORT_BAUDRATE_bits_per_second
+            })
         device_dict = {}
-        device_dict["name"] = device_basename[:device_basename.find('.')]
-        device_dict["position"] = int(position.split(' ')[1])
+        device_dict["name"] = credentials.get_archive_name(path)
+        device_dict["position"] = position
+        device_dict["serial_port"] = serial_port_name
         pmp_configuration_json["setup"]["devices"].append(device_dict)
-        with open(definitions.PMP_CONFIGURATION_PATH, 'w') as fp:
-            json.dump(pmp_configuration_json, fp)
-
-#
-# Restart AWS Greengrass.
-#
-def restart_aws_greengrass():
-    os.system('%s > %s' % \
-        (RESTART_GREENGRASS_COMMAND, RESTART_GREENGRASS_OUTPUT_PATH))
-    while True:
-        try:
-            output = subprocess.check_output('cat %s' \
-                % (RESTART_GREENGRASS_OUTPUT_PATH), \
-                stderr=subprocess.STDOUT, shell=True).decode('utf-8')
-            if RESTART_GREENGRASS_OK in output:
-                os.system('rm -rf %s' % \
-                    (RESTART_GREENGRASS_OUTPUT_PATH))
-                #print(RESTART_GREENGRASS_OK)
+        _write(output_callback, 'Masterboard %d, Position %d: device \"%s\" ' \
+            'installed (%d files).\n' % (masterboard, position,
+            device_dict["name"], len(extracted[path])))
+    fs_utils.create_file_from_json(
+        definitions.PMP_CONFIGURATION_PATH, pmp_configuration_json)
+    _write(output_callback, 'Credentials of %d devices installed in %.1f [s].\n' % \
+        (len(devices_credentials), time.monotonic() - start))
+    return True
+
+#
+# Check whether AWS Greengrass is running, i.e. whether the process whose
+# identifier is written in the PID file of the daemon is alive.
+#
+def is_aws_greengrass_running():
+    try:
+        with open(GREENGRASS_PID_PATH, 'r') as fp:
+            pid = int(fp.read().strip())
+        os.kill(pid, 0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+#
+# Restart AWS Greengrass, unless it is already running and healthy.
+#
+# The output of the daemon is read through a pipe until it reports a
+# successful start, the process exits, or the timeout elapses.
+#
+# @param timeout_s         Timeout in seconds.
+# @param progress_callback Function called with each line of output.
+# @param force             Restart even if already running, e.g. after the
+#                          credentials have changed.
+# @return True if AWS Greengrass is running, False otherwise.
+#
+def restart_aws_greengrass(timeout_s=DEFAULT_RESTART_TIMEOUT_s,
+    progress_callback=None, force=False):
+    if not force and is_aws_greengrass_running():
+        if progress_callback:
+            progress_callback('AWS Greengrass already running.')
+        return True
+    try:
+        process = subprocess.Popen(RESTART_GREENGRASS_COMMAND,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        if progress_callback:
+            progress_callback(str(e))
+        return False
+    deadline = time.monotonic() + timeout_s
+    started = False
+    pending = b''
+    with selectors.DefaultSelector() as selector:
+        selector.register(process.stdout, selectors.EVENT_READ)
+        while not started:
+            remaining_s = deadline - time.monotonic()
+            if remaining_s <= 0 or not selector.select(remaining_s):
                 break
-        except subprocess.CalledProcessError as e:
-            pass
+            chunk = os.read(process.stdout.fileno(), READ_SIZE_bytes)
+            if not chunk:
+                break
+            lines = (pending + chunk).split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                line = line.decode('utf-8', 'replace').rstrip()
+                if progress_callback and line:
+                    progress_callback(line)
+                if RESTART_GREENGRASS_OK in line:
+                    started = True
+
+    # The daemon may keep the output open: draining it in the background, so
+    # that it never blocks or gets a broken pipe.
+    if started:
+        threading.Thread(target=_drain, args=(process,), daemon=True).start()
+    else:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+    return started
+
+#
+# Wait for a deployment from the AWS cloud, i.e. for the group file to be
+# written, through filesystem change notifications.
+#
+# @param timeout_s         Timeout in seconds.
+# @param progress_callback Function called every second with the seconds
+#                          elapsed.
+# @return True if a deployment has been received, False on timeout.
+#
+def wait_for_aws_deployment(timeout_s=DEFAULT_DEPLOYMENT_TIMEOUT_s,
+    progress_callback=None):
+    group_path = os.path.dirname(GREENGRASS_GROUP_PATH)
+    group_name = os.path.basename(GREENGRASS_GROUP_PATH)
+    start = time.monotonic()
+    try:
+        watcher = inotify.Inotify()
+    except OSError:
+        watcher = None
+    try:
+        # Watching before getting the modification time, not to miss changes.
+        # Without the group's folder, its modification time is polled.
+        if watcher:
+            try:
+                watcher.add_watch(group_path,
+                    inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO)
+            except OSError:
+                watcher.close()
+                watcher = None
+        modification_time = _get_modification_time(GREENGRASS_GROUP_PATH)
+        while True:
+            elapsed_s = time.monotonic() - start
+            if elapsed_s >= timeout_s:
+                return False
+            if progress_callback:
+                progress_callback(elapsed_s)
+            wait_s = min(PROGRESS_INTERVAL_s, timeout_s - elapsed_s)
+            if watcher:
+                events = watcher.read_events(wait_s)
+                if any(event.name == group_name for event in events):
+                    return True
+            else:
+                time.sleep(wait_s)
+                if _get_modification_time(GREENGRASS_GROUP_PATH) \
+                    != modification_time:
+                    return True
+    finally:
+        if watcher:
+            watcher.close()
 
 #
-# Wait for deployment from the AWS cloud.
+# Read and discard the output of a process until it is closed.
 #
-def wait_for_aws_deployment():
-    #print('Waiting for deployment...')
-    group_date_orig = group_date_new = subprocess.check_output('stat -c %%y %s' \
-        % (GREENGRASS_GROUP_PATH), \
-        stderr=subprocess.STDOUT, shell=True).decode('utf-8')
-    while group_date_orig == group_date_new:
-        try:
-            group_date_new = subprocess.check_output('stat -c %%y %s' \
-                % (GREENGRASS_GROUP_PATH), \
-                stderr=subprocess.STDOUT, shell=True).decode('utf-8')
-        except subprocess.CalledProcessError as e:
+def _drain(process):
+    try:
+        while os.read(process.stdout.fileno(), READ_SIZE_bytes):
             pass
-    #print('Deployment successfully completed!')
+    except OSError:
+        pass
+    process.stdout.close()
+    process.wait()
+
+#
+# Show a message through the output callback, if any.
+#
+def _write(output_callback, message):
+    if output_callback:
+        output_callback(message)
+
+#
+# Get the modification time of a file, None if it does not exist.
+#
+def _get_modification_time(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides the installer of the credentials of the edge gateway and of
+# the devices, distributed as zip archives. The archives are checked and
+# extracted in-process and in parallel, into a staging folder which replaces the
+# installed one only when all of them are valid.
+
+
+# IMPORT
+
+from __future__ import print_function
+import os
+import shutil
+import zipfile
+import concurrent.futures
+
+
+# CONSTANTS
+
+# Archives.
+ARCHIVE_EXT = '.zip'
+
+# Suffixes of the staging folder and of the replaced one.
+STAGING_EXT = '.new'
+REPLACED_EXT = '.old'
+
+# Maximum number of archives extracted concurrently.
+DEFAULT_WORKERS = 8
+
+
+# FUNCTIONS
+
+#
+# Get the credentials archives found at a path.
+#
+# @param path Path of either an archive or a folder of archives.
+# @return The sorted list of the paths of the archives.
+#
+def get_archives(path):
+    if not os.path.isdir(path):
+        return [path]
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+        if name.lower().endswith(ARCHIVE_EXT)
+        and os.path.isfile(os.path.join(path, name)))
+
+#
+# Get the name of the credentials of an archive, i.e. its basename without
+# extensions.
+#
+def get_archive_name(path):
+    return os.path.basename(path).split('.')[0]
+
+#
+# Check and extract an archive.
+#
+# @param path           Path of the archive.
+# @param destination    Folder where to extract the archive.
+# @param required_names Names of the members which must be found within the
+#                       archive.
+# @param excluded_names Names of the members not to extract.
+# @return The list of the names of the extracted members.
+# @raise ValueError if the archive is corrupted, has members outside of the
+#        destination folder, or misses any of the required members.
+#
+def extract_archive(path, destination, required_names=(), excluded_names=()):
+    basename = os.path.basename(path)
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+            for name in names:
+                normalized = os.path.normpath(name)
+                if os.path.isabs(normalized) or normalized == os.pardir or \
+                    normalized.startswith(os.pardir + os.sep):
+                    raise ValueError('Archive \"%s\" has unsafe member \"%s\".' % \
+                        (basename, name))
+            missing = [name for name in required_names if name not in names]
+            if missing:
+                raise ValueError('Archive \"%s\" misses \"%s\".' % \
+                    (basename, '\", \"'.join(missing)))
+            extracted = [name for name in names if name not in excluded_names]
+            # The CRC of each member is checked while extracting it.
+            archive.extractall(destination, extracted)
+            return extracted
+    except (zipfile.BadZipFile, zipfile.LargeZipFile, OSError) as e:
+        raise ValueError('Archive \"%s\" is invalid: %s.' % (basename, e))
+
+#
+# Check and extract archives in parallel.
+#
+# @param archives List of (path, destination, required names, excluded names)
+#                 tuples, see "extract_archive()".
+# @param workers  Maximum number of archives extracted concurrently.
+# @return A pair of dictionaries, by path of the archive: the lists of the
+#         extracted members of the valid archives, and the errors of the
+#         invalid ones.
+#
+def extract_archives(archives, workers=DEFAULT_WORKERS):
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, min(workers, len(archives)))) as executor:
+        futures = [(archive[0], executor.submit(extract_archive, *archive))
+            for archive in archives]
+    extracted = {}
+    errors = {}
+    for path, future in futures:
+        try:
+            extracted[path] = future.result()
+        except ValueError as e:
+            errors[path] = e
+    return extracted, errors
+
+#
+# Create an empty staging folder for a folder to install.
+#
+# @return The path of the staging folder.
+#
+def create_staging_folder(path):
+    staging_path = path + STAGING_EXT
+    shutil.rmtree(staging_path, ignore_errors=True)
+    os.makedirs(staging_path)
+    return staging_path
+
+#
+# Replace a folder with another one, e.g. a staging folder, renaming them so
+# that the destination is never left partially written.
+#
+def replace_folder(source, destination):
+    replaced_path = destination + REPLACED_EXT
+    shutil.rmtree(replaced_path, ignore_errors=True)
+    if os.path.exists(destination):
+        os.rename(destination, replaced_path)
+    os.rename(source, destination)
+    shutil.rmtree(replaced_path, ignore_errors=True)
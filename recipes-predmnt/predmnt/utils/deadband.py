@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides deadband filtering of the samples to publish, so that a
+# sample is published only when one of its fields has changed meaningfully since
+# the last published sample, or when nothing has been published for too long.
+#
+# Configuration example:
+#
+# "deadband": {
+#     "environmental": {
+#         "heartbeat_s": 600,
+#         "fields": {
+#             "Pressure": {"absolute": 0.5},
+#             "Humidity": {"absolute": 1.0},
+#             "Temperature": {"absolute": 0.2}
+#         }
+#     },
+#     "inertial_tdm": {
+#         "heartbeat_s": 300,
+#         "fields": {
+#             "RMS_Speed": {"relative": 0.05},
+#             "Peak_Acceleration": {"absolute": 0.1, "relative": 0.05}
+#         }
+#     }
+# }
+
+
+# IMPORT
+
+from __future__ import print_function
+import time
+
+
+# CONSTANTS
+
+# Streams.
+STREAM_ENVIRONMENTAL = 'environmental'
+STREAM_INERTIAL_TDM = 'inertial_tdm'
+
+# Defaults.
+DEFAULT_HEARTBEAT_s = 0
+
+
+# CLASSES
+
+#
+# Deadband filter of the samples of a stream of a device.
+#
+# A sample is a dictionary of fields, whose values are either numbers or lists
+# of numbers (e.g. one per axis). A field has changed when any of its values
+# differs from the last published one by more than the field's threshold, that
+# is the largest between its "absolute" deadband and its "relative" deadband
+# times the magnitude of the last published value. Fields without a deadband
+# have a null threshold, i.e. any change is meaningful.
+#
+class Deadband(object):
+
+    #
+    # Constructor.
+    #
+    # @param configuration Dictionary with the optional "fields" deadbands and
+    #                      the optional "heartbeat_s" maximum time without
+    #                      publishing (0 to disable the heartbeat).
+    # @raise ValueError if the configuration is invalid.
+    #
+    def __init__(self, configuration):
+        self._fields = {}
+        for field, deadband in configuration.get("fields", {}).items():
+            absolute = deadband.get("absolute", 0.0)
+            relative = deadband.get("relative", 0.0)
+            if absolute < 0 or relative < 0:
+                raise ValueError('Deadbands of field \"%s\" must not be ' \
+                    'negative.' % (field))
+            self._fields[field] = (absolute, relative)
+        self._heartbeat_s = configuration.get("heartbeat_s", DEFAULT_HEARTBEAT_s)
+        self._last_sample = None
+        self._last_publish_time = None
+        self._published = 0
+        self._suppressed = 0
+
+    #
+    # Check whether a sample has to be published, and if so record it as the
+    # last published one.
+    #
+    # @param sample Dictionary of fields.
+    # @param now    Current time as given by "time.monotonic()", if known.
+    # @return True if the sample has to be published, False otherwise.
+    #
+    def check(self, sample, now=None):
+        if now is None:
+            now = time.monotonic()
+        if self._last_sample is None \
+            or (self._heartbeat_s \
+                and now - self._last_publish_time >= self._heartbeat_s) \
+            or self._has_changed(sample):
+            self._last_sample = sample
+            self._last_publish_time = now
+            self._published += 1
+            return True
+        self._suppressed += 1
+        return False
+
+    #
+    # Get the number of published samples.
+    #
+    def get_published(self):
+        return self._published
+
+    #
+    # Get the number of suppressed samples.
+    #
+    def get_suppressed(self):
+        return self._suppressed
+
+    #
+    # Check whether any field of a sample has changed meaningfully with respect
+    # to the last published sample.
+    #
+    def _has_changed(self, sample):
+        for field, value in sample.items():
+            if field not in self._last_sample:
+                return True
+            absolute, relative = self._fields.get(field, (0.0, 0.0))
+            last_value = self._last_sample[field]
+            if isinstance(value, (list, tuple)):
+                if not isinstance(last_value, (list, tuple)) \
+                    or len(value) != len(last_value):
+                    return True
+                pairs = zip(value, last_value)
+            elif isinstance(last_value, (list, tuple)):
+                return True
+            else:
+                pairs = [(value, last_value)]
+            for new, last in pairs:
+                if abs(new - last) > max(absolute, relative * abs(last)):
+                    return True
+        return False
@@ -47,11 +47,25 @@ GREENGRASS_PATH = '/greengrass'
 GREENGRASS_CONFIG_PATH = GREENGRASS_PATH + '/config/config.json'
 DEVICE_CERTIFICATES_PATH = PMP_PATH + '/devices_pmp_aws'
 GATEWAY_RULES_PATH = '/etc/sysctl.d/98-gateway.conf'
+SPOOL_PATH = PMP_PATH + '/spool'
+METRICS_PATH = PMP_PATH + '/metrics/pmp.prom'
+PROFILE_PATH = PMP_PATH + '/profile/pmp'
+WHEELHOUSE_PATH = PMP_PATH + '/wheelhouse'
+
+# Serial ports of the IO-Link Masterboards, given their index.
+SERIAL_PORT_NAME = '/dev/ttyUSB%d'
+SERIAL_PORT_BAUDRATE_bits_per_second = 230400
+
+# Positions of the devices on an IO-Link Masterboard.
+MASTERBOARD_POSITIONS = 4
 
 # Python packages to install through "pip" tool.
 PYTHON_PIP_UPGRADE = 'pip3 install --upgrade pip'
 PYTHON_PACKAGES_TO_INSTALL = 'awsiotpythonsdk wire-st-sdk edge-st-sdk'
 
+# Folder of the USB key with the wheels of the Python packages to install.
+WHEELHOUSE_FOLDER = 'wheelhouse'
+
 # Cloud's default MQTT Topics.
 MQTT_AWS_HEADER_TOPIC = "$aws/things"
 MQTT_AWS_GET_TOPIC = "shadow/get"
@@ -70,6 +84,7 @@ MQTT_INE_TOPIC = "inertial"
 MQTT_ACO_TOPIC = "acoustic"
 MQTT_TDM_TOPIC = "_tdm"
 MQTT_FDM_TOPIC = "_fdm"
+MQTT_RED_TOPIC = "_reduced"
 MQTT_EVT_TOPIC = "events"
 MQTT_THR_TOPIC = "threshold"
 MQTT_GUI_TOPIC = "gui"
@@ -85,20 +100,59 @@ COLORS = ["#00FF00", "#FFCC00", "#FF0000", "#0000FF"]
 # Default PMP configuration.
 DEFAULT_PMP_CONFIGURATION_JSON = \
 {
-    "serial_port": {
-        "name": "/dev/ttyUSB0",
-        "baudrate_bits_per_second": 230400
-    },
+    "serial_ports": [
+        {
+            "name": SERIAL_PORT_NAME % (0),
+            "baudrate_bits_per_second": SERIAL_PORT_BAUDRATE_bits_per_second
+        }
+    ],
     "setup": {
         "use_sensors": True,
         "use_cloud": True,
         "use_threads_for_polling_sensors": True,
+        "startup_workers": 8,
         "device_certificates_path": DEVICE_CERTIFICATES_PATH,
         "devices": []
     },
+    "intervals": {
+        "environmental_s": 30,
+        "inertial_tdm_s": 30,
+        "inertial_fdm_s": 5
+    },
     "dump": {
         "env_samples": 0,
         "tdm_samples": 0,
-        "fdm_samples": 0
+        "fdm_samples": 0,
+        "flush_every_samples": 10,
+        "flush_interval_s": 5
+    },
+    "spool": {
+        "enabled": False,
+        "path": SPOOL_PATH,
+        "max_size_bytes": 64 * 1024 * 1024,
+        "max_age_s": 24 * 60 * 60,
+        "segment_size_bytes": 1024 * 1024,
+        "live_queue_size": 100,
+        "replay_rate_msgs_per_s": 5,
+        "retry_interval_s": 10
+    },
+    "anomaly": {
+        "enabled": False,
+        "min_samples": 30,
+        "ewma_alpha": 0.1,
+        "window_samples": 60,
+        "z_score_thresholds": [3, 4, 5],
+        "trend_threshold": 0.5
+    },
+    "metrics": {
+        "enabled": False,
+        "textfile_path": METRICS_PATH,
+        "interval_s": 15,
+        "http_port": 0
+    },
+    "logging": {
+        "queue_size": 1000,
+        "summary_interval_s": 10,
+        "stream_levels": {}
     }
 }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This file provides a buffered writer to dump samples to a log file, which is
+# kept open between samples and flushed according to a configurable policy.
+
+
+# IMPORT
+
+from __future__ import print_function
+import json
+import time
+
+
+# CONSTANTS
+
+# Flush policy.
+DEFAULT_FLUSH_EVERY_SAMPLES = 10
+DEFAULT_FLUSH_INTERVAL_s = 5
+DEFAULT_BUFFER_SIZE_bytes = 64 * 1024
+
+# End of line of dumped records.
+EOL = '\r\n'
+
+
+# CLASSES
+
+#
+# Buffered writer of samples to a log file.
+#
+class DumpWriter(object):
+
+    #
+    # Constructor.
+    #
+    # @param file_path           Path of the log file, opened in append mode.
+    # @param flush_every_samples Flush after this number of samples, if not zero.
+    # @param flush_interval_s    Flush when this time has elapsed since the last
+    #                            flush, if not zero.
+    # @param buffer_size         Size of the write buffer in bytes.
+    #
+    def __init__(self, file_path,
+        flush_every_samples=DEFAULT_FLUSH_EVERY_SAMPLES,
+        flush_interval_s=DEFAULT_FLUSH_INTERVAL_s,
+        buffer_size=DEFAULT_BUFFER_SIZE_bytes):
+        self._file_path = file_path
+        self._flush_every_samples = flush_every_samples
+        self._flush_interval_s = flush_interval_s
+        self._fp = open(file_path, 'a', buffering=buffer_size)
+        self._pending_samples = 0
+        self._last_flush_time = time.monotonic()
+
+    #
+    # Get the path of the log file.
+    #
+    def get_file_path(self):
+        return self._file_path
+
+    #
+    # Write a record made of a single line.
+    #
+    def write_record(self, record):
+        self._fp.write(record)
+        self._fp.write(EOL)
+        self._on_sample_written()
+
+    #
+    # Write a record made of a JSON object with a single key whose value is a
+    # list of rows, one row per line, e.g.:
+    #
+    # {"key": [
+    # [...],
+    # [...]
+    # ]}
+    #
+    # The rows are serialized one by one, without building the whole record.
+    #
+    def write_rows_record(self, key, rows):
+        self._fp.write('{%s: [' % (json.dumps(key)))
+        separator = EOL
+        for row in rows:
+            self._fp.write(separator)
+            self._fp.write(json.dumps(row))
+            separator = ', ' + EOL
+        self._fp.write(EOL + ']}' + EOL)
+        self._on_sample_written()
+
+    #
+    # Flush the buffered samples to the log file.
+    #
+    def flush(self):
+        if not self._fp.closed:
+            self._fp.flush()
+        self._pending_samples = 0
+        self._last_flush_time = time.monotonic()
+
+    #
+    # Flush and close the log file.
+    #
+    def close(self):
+        if not self._fp.closed:
+            self._fp.flush()
+            self._fp.close()
+
+    #
+    # Apply the flush policy after a sample has been written.
+    #
+    def _on_sample_written(self):
+        self._pending_samples += 1
+        if (self._flush_every_samples and \
+            self._pending_samples >= self._flush_every_samples) or \
+            (self._flush_interval_s and \
+            time.monotonic() - self._last_flush_time >= self._flush_interval_s):
+            self.flush()
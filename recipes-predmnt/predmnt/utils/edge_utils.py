@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides the parts of the Predictive Maintenance application which
+# depend on the Edge SDK. It is imported only when the cloud is used, to keep
+# the startup of the application fast otherwise.
+
+
+# IMPORT
+
+from __future__ import print_function
+
+from edge_st_sdk.aws.aws_greengrass import AWSGreengrass
+from edge_st_sdk.aws.aws_greengrass import AWSGreengrassListener
+from edge_st_sdk.aws.aws_client import AWSClient
+from edge_st_sdk.edge_client import EdgeClientListener
+from edge_st_sdk.utils.edge_st_exceptions import EdgeSTInvalidDataException
+from edge_st_sdk.utils.edge_st_exceptions import EdgeSTInvalidOperationException
+
+
+# CONSTANTS
+
+# Exceptions which stop the application.
+FATAL_EXCEPTIONS = (EdgeSTInvalidDataException, EdgeSTInvalidOperationException)
+
+
+# CLASSES
+
+#
+# Implementation of the interface used by the EdgeClient class to notify that a
+# client has updated its status.
+#
+class MyAWSGreengrassListener(AWSGreengrassListener):
+
+    #
+    # To be called whenever the AWS Greengrass service changes its status.
+    #
+    # @param aws_greengrass AWS Greengrass service that has changed its status.
+    # @param new_status     New status.
+    # @param old_status     Old status.
+    #
+    def on_status_change(self, aws_greengrass, new_status, old_status):
+        print('AWS Greengrass service with endpoint \"%s\" from \"%s\" to \"%s\".' %
+            (aws_greengrass.get_endpoint(), str(old_status), str(new_status)))
+
+
+#
+# Implementation of the interface used by the EdgeClient class to notify that a
+# client has updated its status.
+#
+class MyClientListener(EdgeClientListener):
+
+    #
+    # To be called whenever a client changes its status.
+    #
+    # @param client     Client that has changed its status.
+    # @param new_status New status.
+    # @param old_status Old status.
+    #
+    def on_status_change(self, client, new_status, old_status):
+        print('Client \"%s\" from \"%s\" to \"%s\".' %
+            (client.get_name(), str(old_status), str(new_status)))
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides a typed stream of messages in JSON-lines format, written
+# by the PMP application to a pipe, and the parser used by the GUI to read it.
+#
+# Each line is a JSON object with a "type" and a "time" (seconds since the
+# epoch) fields, plus:
+#   - "sample" messages: "client", "stream" and "data" (the published sample);
+#   - "event" messages: "client", "severity", "message" and "value" (null for
+#     normal events);
+#   - "status" messages: "status", "message" (human-readable) and the optional
+#     fields related to the status.
+#
+# The writer never blocks the acquisition: lines which cannot be written are
+# kept in a bounded buffer, and dropped when the buffer is full.
+
+
+# IMPORT
+
+from __future__ import print_function
+import os
+import json
+import time
+import errno
+import threading
+
+
+# CONSTANTS
+
+# Types of messages.
+TYPE_SAMPLE = 'sample'
+TYPE_EVENT = 'event'
+TYPE_STATUS = 'status'
+
+# Statuses.
+STATUS_RUNNING = 'running'
+STATUS_SCHEDULER = 'scheduler'
+STATUS_SPOOL = 'spool'
+
+# Maximum size of the lines pending to be written.
+DEFAULT_MAX_PENDING_bytes = 256 * 1024
+
+# Size of the chunks read from the stream.
+READ_SIZE_bytes = 64 * 1024
+
+
+# CLASSES
+
+#
+# Writer of messages to a file descriptor, e.g. the writing end of a pipe.
+# Thread-safe.
+#
+class EventStreamWriter(object):
+
+    #
+    # Constructor.
+    #
+    # @param fd                File descriptor, set to non-blocking mode.
+    # @param max_pending_bytes Maximum size of the lines pending to be written.
+    #
+    def __init__(self, fd, max_pending_bytes=DEFAULT_MAX_PENDING_bytes):
+        self._fd = fd
+        self._max_pending_bytes = max_pending_bytes
+        self._pending = bytearray()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._broken = False
+        self._written = 0
+        self._dropped = 0
+        os.set_blocking(fd, False)
+
+    #
+    # Write a "sample" message.
+    #
+    # @param client        Name of the client.
+    # @param stream        Name of the stream.
+    # @param data_json_str JSON representation of the sample, embedded as is.
+    #
+    def write_sample(self, client, stream, data_json_str):
+        self._write('{"type": "%s", "time": %.3f, "client": %s, ' \
+            '"stream": %s, "data": %s}\n' % (TYPE_SAMPLE, time.time(),
+            json.dumps(client), json.dumps(stream), data_json_str))
+
+    #
+    # Write an "event" message.
+    #
+    def write_event(self, client, severity, message, value=None):
+        self._write_message({
+            "type": TYPE_EVENT,
+            "time": round(time.time(), 3),
+            "client": client,
+            "severity": severity,
+            "message": message,
+            "value": value
+        })
+
+    #
+    # Write a "status" message.
+    #
+    # @param status  Status.
+    # @param message Human-readable message.
+    # @param fields  Optional dictionary of fields related to the status.
+    #
+    def write_status(self, status, message, fields=None):
+        message_json = dict(fields) if fields else {}
+        message_json.update({
+            "type": TYPE_STATUS,
+            "time": round(time.time(), 3),
+            "status": status,
+            "message": message
+        })
+        self._write_message(message_json)
+
+    #
+    # Get the number of messages written or pending.
+    #
+    def get_written(self):
+        return self._written
+
+    #
+    # Get the number of messages dropped.
+    #
+    def get_dropped(self):
+        return self._dropped
+
+    #
+    # Try to write the pending lines and close the file descriptor.
+    #
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._flush()
+            self._closed = True
+            os.close(self._fd)
+
+    #
+    # Write a message given as a dictionary.
+    #
+    def _write_message(self, message_json):
+        self._write(json.dumps(message_json) + '\n')
+
+    #
+    # Write a line, or drop it if the pending lines would exceed their maximum
+    # size.
+    #
+    def _write(self, line):
+        data = line.encode('utf-8')
+        with self._lock:
+            if self._closed or self._broken or \
+                len(self._pending) + len(data) > self._max_pending_bytes:
+                self._dropped += 1
+                return
+            self._pending += data
+            self._written += 1
+            self._flush()
+
+    #
+    # Write as much of the pending lines as possible without blocking.
+    #
+    def _flush(self):
+        while self._pending and not self._broken:
+            try:
+                written = os.write(self._fd, self._pending)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                # The reader has gone away.
+                self._pending = bytearray()
+                self._broken = True
+                return
+            del self._pending[:written]
+
+
+#
+# Parser of the messages read from a stream, which may come in chunks not
+# aligned to lines.
+#
+class EventStreamReader(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self):
+        self._buffer = b''
+        self._invalid = 0
+
+    #
+    # Feed a chunk of data.
+    #
+    # @param data Bytes read from the stream.
+    # @return The list of messages completed by the chunk, as dictionaries.
+    #
+    def feed(self, data):
+        lines = (self._buffer + data).split(b'\n')
+        self._buffer = lines.pop()
+        messages = []
+        for line in lines:
+            if not line:
+                continue
+            try:
+                messages.append(json.loads(line.decode('utf-8')))
+            except ValueError:
+                self._invalid += 1
+        return messages
+
+    #
+    # Get the number of lines which could not be parsed.
+    #
+    def get_invalid(self):
+        return self._invalid
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This file provides the encoder and the decoder of the compact binary format
+# used to publish Inertial Frequency Domain data. It only depends on the Python
+# standard library, so that it can be used on the cloud side as well, e.g.:
+#
+#   python3 fdm_codec.py <payload_file>
+#
+# prints the JSON representation of a binary payload.
+#
+# Payload layout (little-endian):
+#   - header:
+#     - magic "PMFD" (4 bytes);
+#     - version (uint8);
+#     - sample format (uint8): 0 for float32, 1 for scaled int16;
+#     - number of axes (uint8);
+#     - reserved (uint8);
+#     - number of bins (uint32);
+#     - frequency of the first bin [Hz] (float32);
+#     - frequency step between bins [Hz] (float32);
+#     - version 2 only: sequence number of the sample (uint32);
+#     - version 2 only: acquisition time of the sample [ms since the epoch]
+#       (uint64);
+#   - one scale factor per axis (float32), amplitude = sample * scale;
+#   - samples, bin by bin, one per axis (float32 or int16).
+#
+# Version 1 payloads, without sequence number and acquisition time, are still
+# produced when these are not given, and decoded.
+
+
+# IMPORT
+
+from __future__ import print_function
+import sys
+import struct
+import json
+
+
+# CONSTANTS
+
+# Encodings.
+ENCODING_JSON = 'json'
+ENCODING_FLOAT32 = 'float32'
+ENCODING_INT16 = 'int16'
+
+# Header.
+MAGIC = b'PMFD'
+VERSION_1 = 1
+VERSION_2 = 2
+VERSION = VERSION_2
+HEADER_FORMATS = {
+    VERSION_1: '<4sBBBBIff',
+    VERSION_2: '<4sBBBBIffIQ'
+}
+# Size of the shortest header.
+HEADER_SIZE = struct.calcsize(HEADER_FORMATS[VERSION_1])
+
+# Sample formats.
+SAMPLE_FORMATS = {
+    ENCODING_FLOAT32: (0, 'f'),
+    ENCODING_INT16: (1, 'h')
+}
+INT16_MAX = 32767
+
+# Maximum relative deviation allowed for the frequency step between bins.
+FREQUENCY_STEP_TOLERANCE = 1e-3
+
+
+# FUNCTIONS
+
+#
+# Check whether a payload is encoded in binary format.
+#
+def is_encoded(payload):
+    return isinstance(payload, (bytes, bytearray)) and \
+        payload[:len(MAGIC)] == MAGIC
+
+#
+# Encode frequency domain data, given as a list of [frequency, x, y, z] rows
+# with equally spaced frequencies.
+#
+# @param data         List of rows.
+# @param encoding     Either "ENCODING_FLOAT32" or "ENCODING_INT16".
+# @param sequence     Sequence number of the sample, if any.
+# @param timestamp_ms Acquisition time of the sample [ms since the epoch], if
+#                     any. A version 2 payload is produced when both the
+#                     sequence number and the acquisition time are given, a
+#                     version 1 payload otherwise.
+# @return The binary payload.
+# @raise ValueError if the encoding is unknown or the frequencies are not
+#        equally spaced.
+#
+def encode(data, encoding, sequence=None, timestamp_ms=None):
+    if encoding not in SAMPLE_FORMATS:
+        raise ValueError('Unknown encoding \"%s\".' % (encoding))
+    sample_format, sample_type = SAMPLE_FORMATS[encoding]
+    bins = len(data)
+    axes = len(data[0]) - 1 if bins else 0
+
+    # Frequency axis.
+    frequency_start = data[0][0] if bins else 0.0
+    frequency_step = data[1][0] - data[0][0] if bins > 1 else 0.0
+    tolerance = abs(frequency_step) * FREQUENCY_STEP_TOLERANCE
+    for i in range(1, bins):
+        if abs(data[i][0] - frequency_start - i * frequency_step) > tolerance:
+            raise ValueError('Frequencies are not equally spaced.')
+
+    # Samples.
+    samples = [row[axis] for row in data for axis in range(1, axes + 1)]
+    if encoding == ENCODING_INT16:
+        scales = []
+        for axis in range(0, axes):
+            peak = max(abs(value) for value in samples[axis::axes])
+            scales.append(peak / INT16_MAX if peak else 1.0)
+        samples = [int(round(value / scales[i % axes]))
+            for i, value in enumerate(samples)]
+    else:
+        scales = [1.0] * axes
+
+    if sequence is None or timestamp_ms is None:
+        header = struct.pack(HEADER_FORMATS[VERSION_1], MAGIC, VERSION_1,
+            sample_format, axes, 0, bins, frequency_start, frequency_step)
+    else:
+        header = struct.pack(HEADER_FORMATS[VERSION_2], MAGIC, VERSION_2,
+            sample_format, axes, 0, bins, frequency_start, frequency_step,
+            sequence, timestamp_ms)
+    return header \
+        + struct.pack('<%df' % (axes), *scales) \
+        + struct.pack('<%d%s' % (len(samples), sample_type), *samples)
+
+#
+# Decode a binary payload.
+#
+# @param payload The binary payload.
+# @return A dictionary with the header's fields and the data as a list of
+#         [frequency, x, y, z] rows. The "sequence" and "timestamp_ms" fields
+#         are None for version 1 payloads.
+# @raise ValueError if the payload is malformed.
+#
+def decode(payload):
+    if len(payload) < HEADER_SIZE:
+        raise ValueError('Payload too short.')
+    magic, version = struct.unpack_from('<4sB', payload, 0)
+    if magic != MAGIC:
+        raise ValueError('Invalid magic number.')
+    if version not in HEADER_FORMATS:
+        raise ValueError('Unsupported version %d.' % (version))
+    header_format = HEADER_FORMATS[version]
+    if len(payload) < struct.calcsize(header_format):
+        raise ValueError('Payload too short.')
+    header = struct.unpack_from(header_format, payload, 0)
+    _, _, sample_format, axes, _, bins, frequency_start, frequency_step = \
+        header[:8]
+    sequence, timestamp_ms = header[8:] if version == VERSION_2 \
+        else (None, None)
+    encodings = [encoding for encoding in SAMPLE_FORMATS
+        if SAMPLE_FORMATS[encoding][0] == sample_format]
+    if not encodings:
+        raise ValueError('Unknown sample format %d.' % (sample_format))
+    encoding = encodings[0]
+    sample_type = SAMPLE_FORMATS[encoding][1]
+
+    offset = struct.calcsize(header_format)
+    scales_format = '<%df' % (axes)
+    samples_format = '<%d%s' % (bins * axes, sample_type)
+    if len(payload) != offset + struct.calcsize(scales_format) \
+        + struct.calcsize(samples_format):
+        raise ValueError('Payload size does not match its header.')
+    scales = struct.unpack_from(scales_format, payload, offset)
+    offset += struct.calcsize(scales_format)
+    samples = struct.unpack_from(samples_format, payload, offset)
+
+    data = []
+    for i in range(0, bins):
+        row = [frequency_start + i * frequency_step]
+        for axis in range(0, axes):
+            row.append(samples[i * axes + axis] * scales[axis])
+        data.append(row)
+    return {
+        "version": version,
+        "encoding": encoding,
+        "bins": bins,
+        "axes": axes,
+        "frequency_start": frequency_start,
+        "frequency_step": frequency_step,
+        "scales": list(scales),
+        "sequence": sequence,
+        "timestamp_ms": timestamp_ms,
+        "data": data
+    }
+
+
+# RUNNING MAIN APPLICATION
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print('Usage:\n\npython3 fdm_codec.py <payload_file>\n')
+        sys.exit(1)
+    with open(sys.argv[1], 'rb') as fp:
+        decoded = decode(fp.read())
+    decoded_json = {"Ine_FFT": decoded["data"]}
+    if decoded["version"] == VERSION_2:
+        decoded_json["Sequence"] = decoded["sequence"]
+        decoded_json["Timestamp"] = decoded["timestamp_ms"]
+    print(json.dumps(decoded_json, sort_keys=True))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This file provides the reduction of Inertial Frequency Domain data to a few
+# features (band energies, octave buckets and peaks) to be published in place
+# of the full spectrum.
+#
+# Configuration example:
+#
+# "fdm_reduction": {
+#     "stages": [
+#         {"type": "bands", "bands": [[0, 100], [100, 1000], [1000, 3000]]},
+#         {"type": "octave", "fraction": 3},
+#         {"type": "peaks", "count": 5}
+#     ],
+#     "keyframe_every": 60
+# }
+
+
+# IMPORT
+
+from __future__ import print_function
+import math
+import numpy as np
+
+
+# CONSTANTS
+
+# Stages.
+STAGE_BANDS = 'bands'
+STAGE_OCTAVE = 'octave'
+STAGE_PEAKS = 'peaks'
+
+# Keys of the reduced data.
+BANDS_KEY = 'Ine_FFT_Bands'
+OCTAVE_KEY = 'Ine_FFT_Octave_%d'
+PEAKS_KEY = 'Ine_FFT_Peaks'
+
+# Octave buckets.
+OCTAVE_REFERENCE_FREQUENCY_Hz = 1000.0
+OCTAVE_FRACTIONS = [1, 3]
+
+# Defaults.
+DEFAULT_PEAKS_COUNT = 5
+DEFAULT_KEYFRAME_EVERY = 0
+
+
+# CLASSES
+
+#
+# Reducer of the spectra of a device.
+#
+# The reduction is made of a list of stages, each one adding a key to the
+# reduced data:
+# - bands: energy of the spectrum within fixed frequency bands, as a list of
+#   [low frequency, high frequency, energy_x, energy_y, energy_z] rows;
+# - octave: energy within 1/1 or 1/3 octave buckets centered on 1 kHz * 2^n or
+#   1 kHz * 2^(n/3), as a list of [center frequency, energy_x, energy_y,
+#   energy_z] rows; buckets without any bin, i.e. narrower than the spacing of
+#   the bins, are skipped;
+# - peaks: for each axis, the list of the highest local maxima of the spectrum,
+#   as [frequency, amplitude] pairs sorted by decreasing amplitude.
+# The energy of a band is the sum of the squared amplitudes of the bins whose
+# frequency lies within [low, high).
+#
+class SpectrumReducer(object):
+
+    #
+    # Constructor.
+    #
+    # @param configuration Dictionary with the "stages" list and the optional
+    #                      "keyframe_every" number of spectra between full
+    #                      spectra to publish (0 to never publish them).
+    # @raise ValueError if the configuration is invalid.
+    #
+    def __init__(self, configuration):
+        self._stages = configuration.get("stages", [])
+        for stage in self._stages:
+            if stage.get("type") not in [STAGE_BANDS, STAGE_OCTAVE, STAGE_PEAKS]:
+                raise ValueError('Unknown FDM reduction stage \"%s\".' % \
+                    (stage.get("type")))
+            if stage["type"] == STAGE_OCTAVE and \
+                stage.get("fraction", 1) not in OCTAVE_FRACTIONS:
+                raise ValueError('Octave fraction must be one of %s.' % \
+                    (OCTAVE_FRACTIONS))
+            if stage["type"] == STAGE_BANDS:
+                for band in stage.get("bands", []):
+                    if not isinstance(band, (list, tuple)) or len(band) != 2:
+                        raise ValueError('Bands must be [low, high] pairs.')
+                    if band[0] > band[1]:
+                        raise ValueError('Band %s must not have its low ' \
+                            'frequency above its high frequency.' % (band))
+        self._keyframe_every = configuration.get(
+            "keyframe_every", DEFAULT_KEYFRAME_EVERY)
+        self._count = 0
+        self._keyframe = False
+        self._frequencies = None
+        self._edges_cache = {}
+
+    #
+    # Check whether the last reduced spectrum has to be published in full as
+    # well, i.e. whether it is a keyframe.
+    #
+    def is_keyframe(self):
+        return self._keyframe
+
+    #
+    # Reduce a spectrum.
+    #
+    # @param data List of [frequency, x, y, z] rows.
+    # @return Dictionary of reduced data, empty if the spectrum is.
+    #
+    def reduce(self, data):
+        spectrum = np.asarray(data, dtype=np.float64)
+        if spectrum.ndim != 2 or not spectrum.shape[0]:
+            self._keyframe = False
+            return {}
+        self._keyframe = bool(self._keyframe_every) and \
+            self._count % self._keyframe_every == 0
+        self._count += 1
+        frequencies = spectrum[:, 0]
+        amplitudes = spectrum[:, 1:]
+        if self._frequencies is None or \
+            not np.array_equal(frequencies, self._frequencies):
+            self._frequencies = frequencies
+            self._edges_cache = {}
+
+        # Cumulative energy, so that the energy of any band is a difference.
+        energy = np.concatenate((
+            np.zeros((1, amplitudes.shape[1])),
+            np.cumsum(amplitudes * amplitudes, axis=0)))
+
+        reduced = {}
+        for i, stage in enumerate(self._stages):
+            if stage["type"] == STAGE_BANDS:
+                low, high = self._get_edges(i, stage)
+                reduced[BANDS_KEY] = np.column_stack((low, high,
+                    self._get_band_energy(energy, low, high))).tolist()
+            elif stage["type"] == STAGE_OCTAVE:
+                low, high = self._get_edges(i, stage)
+                centers = np.sqrt(low * high)
+                reduced[OCTAVE_KEY % (stage.get("fraction", 1))] = \
+                    np.column_stack((centers,
+                    self._get_band_energy(energy, low, high))).tolist()
+            elif stage["type"] == STAGE_PEAKS:
+                reduced[PEAKS_KEY] = self._get_peaks(
+                    frequencies, amplitudes,
+                    stage.get("count", DEFAULT_PEAKS_COUNT))
+        return reduced
+
+    #
+    # Get the edges of the bands of a stage, computed once per frequency axis.
+    #
+    def _get_edges(self, index, stage):
+        if index in self._edges_cache:
+            return self._edges_cache[index]
+        if stage["type"] == STAGE_BANDS:
+            bands = np.asarray(stage.get("bands", []), dtype=np.float64)
+            bands = bands.reshape(-1, 2)
+            low, high = bands[:, 0], bands[:, 1]
+        else:
+            fraction = stage.get("fraction", 1)
+            positive = self._frequencies[self._frequencies > 0]
+            if positive.size:
+                first = int(math.ceil(fraction * math.log2(
+                    positive[0] / OCTAVE_REFERENCE_FREQUENCY_Hz)))
+                last = int(math.floor(fraction * math.log2(
+                    positive[-1] / OCTAVE_REFERENCE_FREQUENCY_Hz)))
+            else:
+                first, last = 0, -1
+            centers = OCTAVE_REFERENCE_FREQUENCY_Hz * \
+                np.power(2.0, np.arange(first, last + 1) / float(fraction))
+            half_width = np.power(2.0, 1.0 / (2 * fraction))
+            low, high = centers / half_width, centers * half_width
+
+            # Skipping the buckets without any bin.
+            bins = np.searchsorted(self._frequencies, high, side='left') \
+                - np.searchsorted(self._frequencies, low, side='left')
+            low, high = low[bins > 0], high[bins > 0]
+        self._edges_cache[index] = (low, high)
+        return low, high
+
+    #
+    # Get the energy within the given bands, per axis.
+    #
+    def _get_band_energy(self, energy, low, high):
+        first = np.searchsorted(self._frequencies, low, side='left')
+        last = np.searchsorted(self._frequencies, high, side='left')
+        return energy[last] - energy[first]
+
+    #
+    # Get the highest local maxima of each axis.
+    #
+    def _get_peaks(self, frequencies, amplitudes, count):
+        axes = amplitudes.shape[1]
+        if amplitudes.shape[0] < 3 or count <= 0:
+            return [[] for axis in range(0, axes)]
+        inner = amplitudes[1:-1]
+        maxima = (inner > amplitudes[:-2]) & (inner >= amplitudes[2:])
+        candidates = np.where(maxima, inner, -np.inf)
+        count = min(count, candidates.shape[0])
+        indexes = np.argpartition(-candidates, count - 1, axis=0)[:count]
+        values = np.take_along_axis(candidates, indexes, axis=0)
+        order = np.argsort(-values, axis=0)
+        indexes = np.take_along_axis(indexes, order, axis=0)
+        values = np.take_along_axis(values, order, axis=0)
+        peaks = []
+        for axis in range(0, axes):
+            valid = np.isfinite(values[:, axis])
+            peaks.append(np.column_stack((
+                frequencies[indexes[valid, axis] + 1],
+                values[valid, axis])).tolist())
+        return peaks
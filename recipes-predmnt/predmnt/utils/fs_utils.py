@@ -41,17 +41,29 @@
 
 from __future__ import print_function
 import os
+import re
+import time
 import subprocess
 import json
 
 from utils import definitions
+from utils import inotify
 
 
 # CONSTANTS
 
+# Suffix of the temporary files written before replacing the original ones.
+TEMPORARY_EXT = '.tmp'
+
 # USB Key.
-MAXIMUM_MOUNT_TRIALS = 10
 MOUNT_POINT_PATH = '/media/usb'
+DEFAULT_MOUNT_TIMEOUT_s = 10
+MOUNT_RETRY_INTERVAL_s = 1
+SYS_BLOCK_PATH = '/sys/block'
+DEV_PATH = '/dev'
+MOUNTS_PATH = '/proc/mounts'
+USB_KEY_PREFIX = 'sd'
+CREDENTIALS_EXT = '.zip'
 
 # WiFi.
 CONNECT_WIFI_PATH = definitions.HOME_PATH + '/connect_wifi.sh'
@@ -72,6 +84,10 @@ killall wpa_supplicant
 """
 
 
+# Device and mount point of the USB key holding the credentials, if mounted.
+_usb_key = None
+
+
 # FUNCTIONS
 
 #
@@ -83,52 +99,142 @@ def create_file(file_path, file_content):
 
 #
 # Create configuration file from json object.
+# The file is written atomically, i.e. it is replaced by a complete temporary
+# file, so that it is never left partially written.
 #
 def create_file_from_json(file_path, json_object):
-    with open(file_path, 'w') as fp:
+    temporary_path = file_path + TEMPORARY_EXT
+    with open(temporary_path, 'w') as fp:
         json.dump(json_object, fp, sort_keys=True)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(temporary_path, file_path)
+
+#
+# Get the block devices which may hold the filesystem of a USB key, i.e. the
+# partitions of the "sd*" disks, or the disks themselves when not partitioned.
+#
+def get_usb_key_partitions():
+    partitions = []
+    try:
+        disks = sorted(os.listdir(SYS_BLOCK_PATH))
+    except OSError:
+        return partitions
+    for disk in [disk for disk in disks if disk.startswith(USB_KEY_PREFIX)]:
+        disk_path = os.path.join(SYS_BLOCK_PATH, disk)
+        try:
+            names = sorted(name for name in os.listdir(disk_path)
+                if name.startswith(disk)
+                and os.path.exists(os.path.join(disk_path, name, 'partition')))
+        except OSError:
+            continue
+        partitions.extend(
+            os.path.join(DEV_PATH, name) for name in (names or [disk]))
+    return partitions
+
+#
+# Get the mount points of the mounted block devices.
+#
+# @return Dictionary of the mount points, by device.
+#
+def get_mount_points():
+    mount_points = {}
+    try:
+        with open(MOUNTS_PATH, 'r') as fp:
+            for line in fp:
+                fields = [re.sub(r'\\([0-7]{3})',
+                    lambda match: chr(int(match.group(1), 8)), field)
+                    for field in line.split()[:2]]
+                if len(fields) == 2:
+                    mount_points.setdefault(fields[0], fields[1])
+    except OSError:
+        pass
+    return mount_points
+
+#
+# Check whether a folder holds credentials archives.
+#
+def has_credentials(path):
+    try:
+        return any(name.lower().endswith(CREDENTIALS_EXT)
+            for name in os.listdir(path))
+    except OSError:
+        return False
 
 #
 # Mount the usb key.
 #
-def mount_usb_key():
-    trials = MAXIMUM_MOUNT_TRIALS
-    device_point_path = None
+# The partitions of the USB disks are mounted in turn, until one holding the
+# expected content, e.g. the credentials archives, is found; partitions already
+# mounted elsewhere, e.g. by an automounter, are used where they are. Until
+# then, the creation of new devices is waited for. The result is cached while
+# the partition stays mounted.
+#
+# @param timeout_s     Maximum time to wait for the USB key [s].
+# @param content_check Function telling whether a mount point holds the
+#                      expected content, the credentials by default.
+# @return The mount point of the partition holding the expected content, or
+#         None if not found within the timeout.
+#
+def mount_usb_key(timeout_s=DEFAULT_MOUNT_TIMEOUT_s,
+    content_check=has_credentials):
+    global _usb_key
+    if _usb_key and get_mount_points().get(_usb_key[0]) == _usb_key[1] \
+        and content_check(_usb_key[1]):
+        return _usb_key[1]
+    _usb_key = None
+    deadline = time.monotonic() + timeout_s
     try:
-        output = subprocess.check_output('mount | grep %s' % \
-            (MOUNT_POINT_PATH),
-            stderr=subprocess.STDOUT, shell=True).decode('utf-8').split('\n')
-        if output:
-            return
-    except subprocess.CalledProcessError as e:
-        while trials:
-            try:
-                output = subprocess.check_output('ls /dev/sd*',
-                    stderr=subprocess.STDOUT, shell=True).decode('utf-8').split('\n')
-                device_point_path = max(output, key=len)
-                if device_point_path and len(device_point_path) > 8:
-                    break
-            except subprocess.CalledProcessError as e:
-                trials -= 1
-                pass
-        if device_point_path:
-            if not os.path.exists(MOUNT_POINT_PATH):
-                os.system('mkdir -p %s' % (MOUNT_POINT_PATH))
+        watcher = inotify.Inotify()
+    except OSError:
+        watcher = None
+    try:
+        # Watching before scanning the devices, not to miss new ones.
+        if watcher:
             try:
-                subprocess.check_output('mount | grep %s' % \
-                    (device_point_path),
-                    stderr=subprocess.STDOUT, shell=True).decode('utf-8').split('\n')
-            except subprocess.CalledProcessError as e:
-                os.system('mount %s %s' % (device_point_path, MOUNT_POINT_PATH))
+                watcher.add_watch(DEV_PATH, inotify.IN_CREATE)
+            except OSError:
+                watcher.close()
+                watcher = None
+        checked = set()
+        while True:
+            retry = False
+            for device in get_usb_key_partitions():
+                if device in checked:
+                    continue
+                mount_point = _mount_usb_key_partition(device, content_check)
+                if mount_point:
+                    _usb_key = (device, mount_point)
+                    return mount_point
+                if mount_point is None:
+                    retry = True
+                else:
+                    checked.add(device)
+            remaining_s = deadline - time.monotonic()
+            if remaining_s <= 0:
+                return None
+            if retry or not watcher:
+                time.sleep(min(MOUNT_RETRY_INTERVAL_s, remaining_s))
+            else:
+                watcher.read_events(remaining_s)
+    finally:
+        if watcher:
+            watcher.close()
 
 #
 # Unmount the usb key.
 #
 def unmount_usb_key():
-    os.system(
-        'umount %s &&' \
-        'rm -rf %s' % \
-        (MOUNT_POINT_PATH, MOUNT_POINT_PATH))
+    global _usb_key
+    _usb_key = None
+    if MOUNT_POINT_PATH in get_mount_points().values():
+        subprocess.call(['umount', MOUNT_POINT_PATH],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not os.path.ismount(MOUNT_POINT_PATH):
+        try:
+            os.rmdir(MOUNT_POINT_PATH)
+        except OSError:
+            pass
 
 #
 # Create scripts to connect/disconnect to/from a WiFi network.
@@ -144,3 +250,28 @@ def create_wifi_scripts(connection_ssid, connection_password):
     fd.write(DISCONNECT_WIFI)
     fd.close()
     os.system('chmod 755 %s' % (DISCONNECT_WIFI_PATH))
+
+#
+# Mount a partition of a USB disk and check whether it holds the expected
+# content.
+#
+# @return The mount point if the partition holds the expected content, an
+#         empty string if it does not, or None if it cannot be mounted.
+#
+def _mount_usb_key_partition(device, content_check):
+    mount_points = get_mount_points()
+    if device in mount_points:
+        return mount_points[device] if content_check(mount_points[device]) \
+            else ''
+    if MOUNT_POINT_PATH in mount_points.values():
+        subprocess.call(['umount', MOUNT_POINT_PATH],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.makedirs(MOUNT_POINT_PATH, exist_ok=True)
+    if subprocess.call(['mount', device, MOUNT_POINT_PATH],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL):
+        return None
+    if content_check(MOUNT_POINT_PATH):
+        return MOUNT_POINT_PATH
+    subprocess.call(['umount', MOUNT_POINT_PATH],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return ''
@@ -40,12 +40,22 @@
 # IMPORT
 
 from __future__ import print_function
+import os
+import codecs
 import subprocess
 import threading
+import functools
+import concurrent.futures
+import logging
+import time
+import queue
+from collections import deque
 import gi
 gi.require_version('Gtk', '3.0')
+gi.require_version('GdkPixbuf', '2.0')
 from gi.repository import Gtk
 from gi.repository import GLib
+from gi.repository import GdkPixbuf
 
 
 # CONSTANTS
@@ -54,6 +64,26 @@ from gi.repository import GLib
 DEFAULT_SPACE = 8
 PROGRESS_BAR_TIMEOUT_ms = 50
 
+# Console.
+CONSOLE_MAX_LINES = 5000
+CONSOLE_REPAINTS_PER_s = 10
+
+# Streams.
+STREAM_READ_SIZE_bytes = 64 * 1024
+STREAM_MAX_READS_PER_WAKEUP = 16
+STREAM_EXIT_POLL_INTERVAL_ms = 100
+
+# Tasks.
+TASK_WORKERS = 2
+TASK_STALL_PROBE_INTERVAL_ms = 100
+TASK_STALL_THRESHOLD_ms = 50
+TASK_LOGGER_NAME = 'pmp.gui'
+
+# Alarms.
+ALARM_COALESCING_WINDOW_s = 30
+AUDIO_QUEUE_SIZE = 4
+AUDIO_PLAYER_COMMAND = ['aplay', '-q']
+
 
 # FUNCTIONS
 
@@ -74,34 +104,6 @@ def write_to_buffer(buffer, message):
     while Gtk.events_pending():
         Gtk.main_iteration()
 
-#
-# Execute a command and write its output to a buffer.
-# Non-blocking call by default.
-# When run in blocking mode it may miss some text to write to the given buffer.
-#
-def execute_command_and_write_to_buffer(command, buffer, blocking=False):
-    process = subprocess.Popen(
-        command, shell = True, stdout = subprocess.PIPE)
-    GLib.io_add_watch(
-        process.stdout,
-        GLib.IO_IN,
-        write_to_buffer_callback,
-        buffer)
-    if blocking:
-        process.wait()
-
-#
-# Callback for writing to buffer.
-#
-def write_to_buffer_callback(fd, condition, buffer):
-    if condition == GLib.IO_IN:
-        line = fd.readline().decode("utf-8")
-        buffer.insert_at_cursor(line)
-        while Gtk.events_pending():
-            Gtk.main_iteration()
-        return True
-    return False
-
 #
 # Callback for textview changes (e.g. scrolling).
 #
@@ -118,6 +120,262 @@ def textview_clicked(widget, event):
 
 # CLASSES
 
+#
+# Model of a console shown through a text buffer.
+#
+# Text appended to the console, from any thread, is kept pending and inserted
+# into the buffer in batches by the GTK main loop, at most a given number of
+# times per second. The buffer keeps at most a given number of lines, trimming
+# the oldest ones.
+#
+class ConsoleModel(object):
+
+    #
+    # Constructor.
+    #
+    # @param buffer          Text buffer.
+    # @param max_lines       Maximum number of lines of the buffer.
+    # @param repaints_per_s  Maximum number of repaints per second.
+    #
+    def __init__(self, buffer, max_lines=CONSOLE_MAX_LINES,
+        repaints_per_s=CONSOLE_REPAINTS_PER_s):
+        self._buffer = buffer
+        self._max_lines = max_lines
+        self._repaint_interval_s = 1.0 / repaints_per_s
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._repaint_scheduled = False
+        self._last_repaint_time = 0
+        self._lines = 0
+        self._dropped_lines = 0
+        self._repaints = 0
+        self._frame_time_total_s = 0
+        self._frame_time_max_s = 0
+        self._frame_time_last_s = 0
+
+    #
+    # Append text to the console.
+    # Thread-safe, non-blocking call.
+    #
+    # @param text  Text to append.
+    # @param color Color of the text, if any.
+    #
+    def append(self, text, color=None):
+        with self._lock:
+            if len(self._pending) >= self._max_lines:
+                self._pending.popleft()
+                self._dropped_lines += 1
+            self._pending.append((text, color))
+            self._lines += 1
+            if self._repaint_scheduled:
+                return
+            self._repaint_scheduled = True
+            delay_s = max(0, self._last_repaint_time \
+                + self._repaint_interval_s - time.monotonic())
+        GLib.timeout_add(int(delay_s * 1000), self._repaint)
+
+    #
+    # Get the statistics of the console.
+    #
+    def get_statistics(self):
+        with self._lock:
+            return {
+                "lines": self._lines,
+                "dropped_lines": self._dropped_lines,
+                "pending_lines": len(self._pending),
+                "repaints": self._repaints,
+                "frame_time_ms_last": self._frame_time_last_s * 1000,
+                "frame_time_ms_max": self._frame_time_max_s * 1000,
+                "frame_time_ms_mean": self._frame_time_total_s * 1000 \
+                    / self._repaints if self._repaints else 0.0
+            }
+
+    #
+    # Insert the pending text into the buffer and trim its oldest lines.
+    # To be run by the GTK main loop.
+    #
+    def _repaint(self):
+        start_time = time.monotonic()
+        with self._lock:
+            pending = self._pending
+            self._pending = deque()
+            self._repaint_scheduled = False
+            self._last_repaint_time = start_time
+
+        # Inserting consecutive plain lines at once.
+        plain = []
+        for text, color in pending:
+            if color is None:
+                plain.append(text)
+                continue
+            if plain:
+                self._buffer.insert(self._buffer.get_end_iter(), ''.join(plain))
+                plain = []
+            self._buffer.insert_markup(
+                self._buffer.get_end_iter(),
+                '<span color="%s">%s</span>' % \
+                    (color, GLib.markup_escape_text(text)),
+                -1)
+        if plain:
+            self._buffer.insert(self._buffer.get_end_iter(), ''.join(plain))
+
+        # Trimming the oldest lines.
+        excess = self._buffer.get_line_count() - self._max_lines
+        if excess > 0:
+            self._buffer.delete(self._buffer.get_start_iter(),
+                self._buffer.get_iter_at_line(excess))
+
+        frame_time_s = time.monotonic() - start_time
+        with self._lock:
+            if excess > 0:
+                self._dropped_lines += excess
+            self._repaints += 1
+            self._frame_time_last_s = frame_time_s
+            self._frame_time_total_s += frame_time_s
+            self._frame_time_max_s = max(self._frame_time_max_s, frame_time_s)
+        return False
+
+
+#
+# Reader of a stream, e.g. the output of a process, run by the GTK main loop.
+#
+# The file descriptor is made non-blocking and read in large chunks whenever it
+# is readable, up to a bounded number of reads per wakeup not to starve the main
+# loop. The text is split into lines incrementally, and the complete lines read
+# at each wakeup are delivered at once. At end of file or hang-up the last
+# partial line is delivered, the file descriptor closed, and the exit code of
+# the process, if any, delivered as soon as it exits.
+#
+class StreamReader(object):
+
+    #
+    # Constructor.
+    #
+    # @param stream         File object or file descriptor to read, owned by the
+    #                       reader from now on.
+    # @param lines_callback Function called with the list of the lines read,
+    #                       each one with its line terminator but maybe the last
+    #                       one of the stream.
+    # @param exit_callback  Function called with the exit code of the process.
+    # @param process        Process writing to the stream, if any.
+    # @param read_size      Size of the chunks to read.
+    #
+    def __init__(self, stream, lines_callback, exit_callback=None,
+        process=None, read_size=STREAM_READ_SIZE_bytes):
+        self._stream = stream
+        self._fd = stream if isinstance(stream, int) else stream.fileno()
+        self._lines_callback = lines_callback
+        self._exit_callback = exit_callback
+        self._process = process
+        self._read_size = read_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._partial = ''
+        self._cancelled = False
+        self._exit_code = None
+        os.set_blocking(self._fd, False)
+        self._watch_id = GLib.io_add_watch(
+            self._fd,
+            GLib.PRIORITY_DEFAULT,
+            GLib.IO_IN | GLib.IO_HUP | GLib.IO_ERR,
+            self._on_io)
+
+    #
+    # Get the process writing to the stream, if any.
+    #
+    def get_process(self):
+        return self._process
+
+    #
+    # Check whether the stream is still being read.
+    #
+    def is_reading(self):
+        return self._watch_id is not None
+
+    #
+    # Check whether the reading has been cancelled.
+    #
+    def is_cancelled(self):
+        return self._cancelled
+
+    #
+    # Get the exit code of the process, or None if not exited yet.
+    #
+    def get_exit_code(self):
+        return self._exit_code
+
+    #
+    # Cancel the reading, discarding the pending partial line, and terminate the
+    # process, if any. The exit code is still delivered.
+    # To be called by the GTK main loop.
+    #
+    def cancel(self):
+        if self._cancelled:
+            return
+        self._cancelled = True
+        if self._watch_id is not None:
+            GLib.source_remove(self._watch_id)
+            self._close()
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+
+    #
+    # Callback for the stream being readable or hung up.
+    #
+    def _on_io(self, fd, condition):
+        chunks = []
+        eof = False
+        for i in range(0, STREAM_MAX_READS_PER_WAKEUP):
+            try:
+                chunk = os.read(self._fd, self._read_size)
+            except BlockingIOError:
+                break
+            except OSError:
+                chunk = b''
+            if not chunk:
+                eof = True
+                break
+            chunks.append(chunk)
+        parts = (self._partial + self._decoder.decode(
+            b''.join(chunks), final=eof)).split('\n')
+        self._partial = parts.pop()
+        lines = [part + '\n' for part in parts]
+        if eof and self._partial:
+            lines.append(self._partial)
+            self._partial = ''
+        if lines:
+            self._lines_callback(lines)
+        if not eof:
+            return True
+        self._close()
+        return False
+
+    #
+    # Close the stream and wait for the process to exit, if any.
+    #
+    def _close(self):
+        self._watch_id = None
+        if isinstance(self._stream, int):
+            os.close(self._fd)
+        else:
+            self._stream.close()
+        if self._process and self._on_exit_poll():
+            GLib.timeout_add(STREAM_EXIT_POLL_INTERVAL_ms, self._on_exit_poll)
+
+    #
+    # Callback for polling the exit of the process.
+    #
+    # @return True while the process is running.
+    #
+    def _on_exit_poll(self):
+        exit_code = self._process.poll()
+        if exit_code is None:
+            return True
+        self._exit_code = exit_code
+        if self._exit_callback:
+            self._exit_callback(exit_code)
+        return False
+
+
 #
 # Class to visualize a progress bar.
 #
@@ -141,6 +399,7 @@ class ProgressBarWindow(Gtk.Window):
         self.progressbar = Gtk.ProgressBar()
         hbox.pack_start(self.progressbar, True, True, 0)
 
+        self.fraction = None
         self.progress_callback_id = GLib.timeout_add(
             PROGRESS_BAR_TIMEOUT_ms,
             self.on_timeout,
@@ -157,33 +416,411 @@ class ProgressBarWindow(Gtk.Window):
         #self.progressbar.set_text(text)
         #self.progressbar.set_show_text(True)
 
+    #
+    # Set the progress, as a fraction from 0 to 1, or None when unknown, in
+    # which case the progress bar pulses.
+    #
+    def set_fraction(self, fraction):
+        self.fraction = fraction
+        if fraction is not None:
+            self.progressbar.set_fraction(fraction)
+
     #
     # Callback for progress bar's update.
     #
     def on_timeout(self, user_data):
-        self.progressbar.pulse()
+        if self.fraction is None:
+            self.progressbar.pulse()
         return True
 
+    #
+    # Destroy the window.
+    #
+    def destroy(self):
+        if self.progress_callback_id is not None:
+            GLib.source_remove(self.progress_callback_id)
+            self.progress_callback_id = None
+        Gtk.Window.destroy(self)
+
 
 #
-# Class to open a progress bar window.
+# Exception raised within a task which has been cancelled.
 #
-class ProgressBarWindowThread(threading.Thread):
+class TaskCancelledError(Exception):
+    pass
+
+
+#
+# Future of a task run by a "TaskRunner".
+#
+# Cancelling a task which has not started yet prevents it from running, while a
+# running task is requested to stop and has to check it through its context.
+#
+class TaskFuture(object):
 
     #
     # Constructor.
     #
-    def __init__(self, run_callback):
-        threading.Thread.__init__(self)
-        self._run_callback = run_callback
-        self._pbw = ProgressBarWindow()
+    # @param name Name of the task.
+    #
+    def __init__(self, name):
+        self._name = name
+        self._future = None
+        self._cancel_event = threading.Event()
+        self._callbacks = []
+        self._start_time = time.monotonic()
+        self._elapsed_s = None
 
     #
-    # Start the thread.
+    # Get the name of the task.
     #
-    def run(self):
-        self._run_callback(self._pbw)
-        self._pbw.destroy()
+    def get_name(self):
+        return self._name
+
+    #
+    # Get the duration of the task [s], or None if not done yet.
+    #
+    def get_elapsed_s(self):
+        return self._elapsed_s
+
+    #
+    # Cancel the task.
+    #
+    # @return True if the task was not done yet.
+    #
+    def cancel(self):
+        self._cancel_event.set()
+        return self._future.cancel() or not self._future.done()
+
+    #
+    # Check whether the task has been requested to stop.
+    #
+    def is_cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    #
+    # Check whether the task has been cancelled, either before running or by
+    # raising "TaskCancelledError".
+    #
+    def cancelled(self):
+        return self._future.cancelled() or (self._future.done() and \
+            isinstance(self._future.exception(), TaskCancelledError))
+
+    #
+    # Check whether the task is done.
+    #
+    def done(self):
+        return self._future.done()
+
+    #
+    # Get the result of the task, waiting for it.
+    # Not to be called by the GTK main loop before the task is done.
+    #
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+    #
+    # Get the exception raised by the task, if any, waiting for it.
+    # Not to be called by the GTK main loop before the task is done.
+    #
+    def exception(self, timeout=None):
+        if self._future.cancelled():
+            return None
+        return self._future.exception(timeout)
+
+    #
+    # Add a function to call with this future once the task is done.
+    # The function is called by the GTK main loop.
+    #
+    def add_done_callback(self, callback):
+        self._callbacks.append(callback)
+
+
+#
+# Context of a task run by a "TaskRunner", through which the task reports its
+# progress and updates the user interface.
+# Thread-safe, non-blocking calls: the updates are applied by the GTK main loop.
+#
+class TaskContext(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self, runner, future):
+        self._runner = runner
+        self._future = future
+
+    #
+    # Set the text of the progress window.
+    #
+    def set_text(self, text):
+        self._runner.post(TaskRunner.UPDATE_TEXT, self._future, text)
+
+    #
+    # Set the progress, as a fraction from 0 to 1, or None when unknown.
+    #
+    def set_progress(self, fraction):
+        self._runner.post(TaskRunner.UPDATE_PROGRESS, self._future, fraction)
+
+    #
+    # Append text to a text buffer.
+    #
+    def write(self, buffer, text):
+        self._runner.post(TaskRunner.UPDATE_WRITE, buffer, text)
+
+    #
+    # Clear a text buffer.
+    #
+    def clear(self, buffer):
+        self._runner.post(TaskRunner.UPDATE_CLEAR, buffer)
+
+    #
+    # Call a function, e.g. to update a widget.
+    #
+    def call(self, function, *args):
+        self._runner.post(TaskRunner.UPDATE_CALL, None,
+            functools.partial(function, *args))
+
+    #
+    # Check whether the task has been requested to stop.
+    #
+    def is_cancelled(self):
+        return self._future.is_cancel_requested()
+
+    #
+    # Stop the task if it has been requested to.
+    #
+    # @raise TaskCancelledError if the task has been requested to stop.
+    #
+    def check_cancelled(self):
+        if self._future.is_cancel_requested():
+            raise TaskCancelledError()
+
+
+#
+# Runner of blocking tasks in a thread pool, for the GTK windows.
+#
+# A task is a function taking a "TaskContext" as first argument. Tasks must not
+# touch widgets: their updates are queued through the context and applied by the
+# GTK main loop in coalesced batches, i.e. within a single "GLib.idle_add()"
+# callback consecutive writes to the same buffer become a single insertion, and
+# only the last text and progress of each task are shown. A progress window is
+# shown while a task runs.
+#
+# While tasks run, the stalls of the main loop, i.e. the delays of a periodic
+# timer beyond its period, are measured and logged when each task is done.
+#
+class TaskRunner(object):
+
+    # Kinds of updates.
+    UPDATE_TEXT = 'text'
+    UPDATE_PROGRESS = 'progress'
+    UPDATE_WRITE = 'write'
+    UPDATE_CLEAR = 'clear'
+    UPDATE_CALL = 'call'
+    UPDATE_DONE = 'done'
+
+    #
+    # Constructor.
+    # To be called by the GTK main loop, as all the other methods but "post()".
+    #
+    # @param workers            Number of threads.
+    # @param stall_threshold_ms Minimum stall of the main loop to count [ms].
+    #
+    def __init__(self, workers=TASK_WORKERS,
+        stall_threshold_ms=TASK_STALL_THRESHOLD_ms):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers)
+        self._stall_threshold_s = stall_threshold_ms / 1000.0
+        self._logger = logging.getLogger(TASK_LOGGER_NAME)
+        self._lock = threading.Lock()
+        self._updates = []
+        self._flush_scheduled = False
+        self._windows = {}
+        self._futures = []
+        self._probe_id = None
+        self._last_probe_time = 0
+        self._stalls = 0
+        self._stall_max_s = 0
+        self._stall_total_s = 0
+        self._batches = 0
+        self._batched_updates = 0
+
+    #
+    # Submit a task.
+    #
+    # @param task          Function taking a "TaskContext" and the given
+    #                      arguments.
+    # @param args          Arguments of the task.
+    # @param name          Name of the task, the name of the function by
+    #                      default.
+    # @param done_callback Function to call with the future once the task is
+    #                      done, by the GTK main loop.
+    # @param show_progress Whether to show a progress window.
+    # @return The future of the task, see "TaskFuture".
+    #
+    def submit(self, task, *args, name=None, done_callback=None,
+        show_progress=True):
+        future = TaskFuture(name or task.__name__)
+        if done_callback:
+            future.add_done_callback(done_callback)
+        if show_progress:
+            self._windows[future] = ProgressBarWindow()
+        self._futures.append(future)
+        self._start_stall_probe()
+        context = TaskContext(self, future)
+        future._future = self._executor.submit(self._run, task, context, args)
+        future._future.add_done_callback(
+            functools.partial(self._on_finished, future))
+        return future
+
+    #
+    # Post an update to apply by the GTK main loop.
+    # Thread-safe, non-blocking call.
+    #
+    # @param kind  Kind of update, see "TaskRunner.UPDATE_*".
+    # @param key   Future of the task, or buffer, the update refers to.
+    # @param value Value of the update.
+    #
+    def post(self, kind, key, value=None):
+        with self._lock:
+            self._updates.append((kind, key, value))
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        GLib.idle_add(self._flush)
+
+    #
+    # Get the statistics of the runner.
+    #
+    def get_statistics(self):
+        with self._lock:
+            return {
+                "running_tasks": len(self._futures),
+                "stalls": self._stalls,
+                "stall_ms_max": self._stall_max_s * 1000,
+                "stall_ms_total": self._stall_total_s * 1000,
+                "batches": self._batches,
+                "batched_updates": self._batched_updates
+            }
+
+    #
+    # Cancel all the tasks and stop the threads, without waiting for them.
+    #
+    def shutdown(self):
+        for future in list(self._futures):
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+    #
+    # Run a task within a thread of the pool.
+    #
+    def _run(self, task, context, args):
+        context.check_cancelled()
+        return task(context, *args)
+
+    #
+    # Callback for a task being finished, run within its thread.
+    #
+    def _on_finished(self, future, executor_future):
+        future._elapsed_s = time.monotonic() - future._start_time
+        self.post(TaskRunner.UPDATE_DONE, future)
+
+    #
+    # Apply the pending updates.
+    # To be run by the GTK main loop.
+    #
+    def _flush(self):
+        with self._lock:
+            updates = self._updates
+            self._updates = []
+            self._flush_scheduled = False
+            self._batches += 1
+            self._batched_updates += len(updates)
+
+        # Coalescing updates: consecutive writes to the same buffer are joined,
+        # and only the last text and progress of each task are kept.
+        coalesced = []
+        latest = {}
+        for kind, key, value in updates:
+            if kind in (TaskRunner.UPDATE_TEXT, TaskRunner.UPDATE_PROGRESS):
+                latest[(kind, key)] = value
+            elif kind == TaskRunner.UPDATE_WRITE and coalesced \
+                and coalesced[-1][0] == kind and coalesced[-1][1] is key:
+                coalesced[-1][2].append(value)
+            else:
+                coalesced.append((kind, key,
+                    [value] if kind == TaskRunner.UPDATE_WRITE else value))
+        for (kind, future), value in latest.items():
+            window = self._windows.get(future)
+            if window and kind == TaskRunner.UPDATE_TEXT:
+                window.set_text(value)
+            elif window:
+                window.set_fraction(value)
+
+        for kind, key, value in coalesced:
+            if kind == TaskRunner.UPDATE_WRITE:
+                key.insert(key.get_end_iter(), ''.join(value))
+            elif kind == TaskRunner.UPDATE_CLEAR:
+                key.delete(key.get_start_iter(), key.get_end_iter())
+            elif kind == TaskRunner.UPDATE_CALL:
+                value()
+            elif kind == TaskRunner.UPDATE_DONE:
+                self._on_done(key)
+        return False
+
+    #
+    # Handle a task being done.
+    # To be run by the GTK main loop.
+    #
+    def _on_done(self, future):
+        window = self._windows.pop(future, None)
+        if window:
+            window.destroy()
+        self._futures.remove(future)
+        exception = future.exception()
+        if exception and not isinstance(exception, TaskCancelledError):
+            self._logger.error('Task "%s" failed.', future.get_name(),
+                exc_info=(type(exception), exception, exception.__traceback__))
+        statistics = self.get_statistics()
+        self._logger.info('Task "%s" %s in %.1f [s], main loop stalls ' \
+            'over %d [ms]: %d, %.1f [ms] max, %.1f [ms] total.',
+            future.get_name(),
+            'cancelled' if future.cancelled() else 'done',
+            future.get_elapsed_s(), self._stall_threshold_s * 1000,
+            statistics["stalls"], statistics["stall_ms_max"],
+            statistics["stall_ms_total"])
+        for callback in future._callbacks:
+            callback(future)
+
+    #
+    # Start measuring the stalls of the main loop, if not yet.
+    #
+    def _start_stall_probe(self):
+        if self._probe_id is not None:
+            return
+        self._last_probe_time = time.monotonic()
+        self._probe_id = GLib.timeout_add(
+            TASK_STALL_PROBE_INTERVAL_ms, self._on_stall_probe)
+
+    #
+    # Callback for measuring the stalls of the main loop, running while there
+    # are tasks.
+    #
+    def _on_stall_probe(self):
+        now = time.monotonic()
+        stall_s = now - self._last_probe_time \
+            - TASK_STALL_PROBE_INTERVAL_ms / 1000.0
+        self._last_probe_time = now
+        if stall_s >= self._stall_threshold_s:
+            with self._lock:
+                self._stalls += 1
+                self._stall_max_s = max(self._stall_max_s, stall_s)
+                self._stall_total_s += stall_s
+        if self._futures:
+            return True
+        self._probe_id = None
+        return False
 
 
 #
@@ -225,7 +862,9 @@ class AlarmWindow(Gtk.Window):
     #
     # Constructor.
     #
-    def __init__(self, title, image_path, sound_path=None, timeout_ms=None):
+    # The image is either the path of an image file or a preloaded pixbuf.
+    #
+    def __init__(self, title, image, timeout_ms=None):
         super(AlarmWindow, self).__init__()
         self.set_title(title)
         self.set_border_width(DEFAULT_SPACE)
@@ -235,22 +874,46 @@ class AlarmWindow(Gtk.Window):
         self.alarm_button = Gtk.Button()
         self.alarm_button.props.relief = Gtk.ReliefStyle.NONE
         self.alarm_button.connect("enter-notify-event", self.on_leave)
-        image = Gtk.Image()
-        image.set_from_file(image_path)
-        self.alarm_button.add(image)
-        if sound_path:
-            command = 'aplay %s 2>&1' % (sound_path)
-            process = subprocess.Popen(
-                command, shell = True, stdout = subprocess.PIPE)
+        self.image = Gtk.Image()
+        self.set_image(image)
+        self.alarm_button.add(self.image)
         self.alarm_button.connect('clicked', self.on_close_clicked)
         self.add(self.alarm_button)
 
+        self.progress_callback_id = None
+        self.set_timeout(timeout_ms)
+
+        self.show_all()
+
+    #
+    # Set the image, either the path of an image file or a preloaded pixbuf.
+    #
+    def set_image(self, image):
+        if isinstance(image, GdkPixbuf.Pixbuf):
+            self.image.set_from_pixbuf(image)
+        else:
+            self.image.set_from_file(image)
+
+    #
+    # Set the timeout after which the window is closed, restarting it if
+    # already set.
+    #
+    def set_timeout(self, timeout_ms):
+        if self.progress_callback_id:
+            GLib.source_remove(self.progress_callback_id)
+            self.progress_callback_id = None
         if timeout_ms:
             self.progress_callback_id = GLib.timeout_add(
                 timeout_ms,
-                self.destroy)
-        
-        self.show_all()
+                self.on_timeout)
+
+    #
+    # Callback for timeout.
+    #
+    def on_timeout(self):
+        self.progress_callback_id = None
+        self.destroy()
+        return False
 
     #
     # Callback for "Close" button clicked.
@@ -265,6 +928,167 @@ class AlarmWindow(Gtk.Window):
         return True
 
 
+#
+# Class to play sounds one at a time through a single long-lived thread.
+# Sounds requested while the queue is full, or already queued, are dropped.
+#
+class AudioWorker(threading.Thread):
+
+    #
+    # Constructor.
+    #
+    def __init__(self, queue_size=AUDIO_QUEUE_SIZE):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._queue = queue.Queue(queue_size)
+        self._queued = set()
+        self._lock = threading.Lock()
+
+    #
+    # Request to play a sound.
+    # Non-blocking call.
+    #
+    # @param sound_path Path of the sound file.
+    # @return True if the sound has been queued, False otherwise.
+    #
+    def play(self, sound_path):
+        with self._lock:
+            if sound_path in self._queued:
+                return False
+            try:
+                self._queue.put_nowait(sound_path)
+            except queue.Full:
+                return False
+            self._queued.add(sound_path)
+        return True
+
+    #
+    # Run the thread.
+    #
+    def run(self):
+        while True:
+            sound_path = self._queue.get()
+            with self._lock:
+                self._queued.discard(sound_path)
+            try:
+                subprocess.call(AUDIO_PLAYER_COMMAND + [sound_path],
+                    stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+            except OSError:
+                pass
+
+
+#
+# Class to manage the alarms raised by clients, showing at most one alarm
+# window per client.
+#
+# Alarms are keyed by client and severity: an alarm repeated within the
+# coalescing window since it was last shown is suppressed, i.e. it only updates
+# the count shown in the title of its window, if still open, and restarts its
+# timeout, so that a lasting alarm is shown again once per coalescing window; an
+# alarm with a higher severity than the one shown escalates it, i.e. replaces
+# its image and plays its sound, while an alarm with a lower severity is
+# suppressed as long as the window is shown. Images are loaded once, and sounds
+# are played through a single "AudioWorker".
+# To be used from the GTK main loop.
+#
+class AlarmManager(object):
+
+    #
+    # Constructor.
+    #
+    # @param image_path_format Format of the path of the image of a severity.
+    # @param sound_path_format Format of the path of the sound of a severity.
+    # @param timeout_ms        Time after which an alarm window is closed.
+    # @param window_s          Coalescing window.
+    #
+    def __init__(self, image_path_format, sound_path_format, timeout_ms,
+        window_s=ALARM_COALESCING_WINDOW_s):
+        self._image_path_format = image_path_format
+        self._sound_path_format = sound_path_format
+        self._timeout_ms = timeout_ms
+        self._window_s = window_s
+        self._pixbufs = {}
+        self._windows = {}
+        self._shown_times = {}
+        self._counts = {}
+        self._suppressed = 0
+        self._audio_worker = AudioWorker()
+        self._audio_worker.start()
+
+    #
+    # Trigger an alarm.
+    #
+    # @param client   Name of the client.
+    # @param severity Severity of the alarm.
+    #
+    def trigger(self, client, severity):
+        now = time.monotonic()
+        key = (client, severity)
+        last_time = self._shown_times.get(key)
+        repeated = last_time is not None and now - last_time < self._window_s
+        shown = client in self._windows and \
+            self._windows[client][1] == severity
+        self._counts[key] = self._counts[key] + 1 if repeated or shown else 1
+
+        # Suppressing repeated alarms and lower severities.
+        if client in self._windows:
+            window, shown_severity = self._windows[client]
+            if severity <= shown_severity:
+                self._suppressed += 1
+                if severity == shown_severity:
+                    window.set_title(self._get_title(client, severity))
+                    window.set_timeout(self._timeout_ms)
+                return
+        elif repeated:
+            self._suppressed += 1
+            return
+
+        # Showing or escalating the alarm.
+        pixbuf = self._get_pixbuf(severity)
+        if client in self._windows:
+            window = self._windows[client][0]
+            window.set_image(pixbuf)
+            window.set_title(self._get_title(client, severity))
+            window.set_timeout(self._timeout_ms)
+            window.present()
+        else:
+            window = AlarmWindow(self._get_title(client, severity), pixbuf,
+                self._timeout_ms)
+            window.connect('destroy', self._on_window_destroyed, client)
+        self._windows[client] = (window, severity)
+        self._shown_times[key] = now
+        self._audio_worker.play(self._sound_path_format % (severity))
+
+    #
+    # Get the number of suppressed alarms.
+    #
+    def get_suppressed(self):
+        return self._suppressed
+
+    #
+    # Get the title of the window of an alarm.
+    #
+    def _get_title(self, client, severity):
+        count = self._counts[(client, severity)]
+        return client if count == 1 else '%s (x%d)' % (client, count)
+
+    #
+    # Get the image of a severity, loading it on first use.
+    #
+    def _get_pixbuf(self, severity):
+        if severity not in self._pixbufs:
+            self._pixbufs[severity] = GdkPixbuf.Pixbuf.new_from_file(
+                self._image_path_format % (severity))
+        return self._pixbufs[severity]
+
+    #
+    # Callback for alarm window destroyed.
+    #
+    def _on_window_destroyed(self, window, client):
+        if client in self._windows and self._windows[client][0] is window:
+            del self._windows[client]
+
+
 #
 # Class to show a message in a window.
 #
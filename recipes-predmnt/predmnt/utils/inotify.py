@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides a minimal binding to the Linux "inotify" API, to wait for
+# filesystem changes without polling.
+
+
+# IMPORT
+
+from __future__ import print_function
+import os
+import errno
+import select
+import struct
+import collections
+import ctypes
+import ctypes.util
+
+
+# CONSTANTS
+
+# Events.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+
+# Flags of "inotify_init1()".
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# Header of the events read from the file descriptor: watch descriptor, mask,
+# cookie, and length of the name which follows.
+EVENT_FORMAT = 'iIII'
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+READ_SIZE_bytes = 64 * 1024
+
+#
+# Filesystem event.
+#
+Event = collections.namedtuple('Event', ['wd', 'mask', 'cookie', 'name'])
+
+
+# CLASSES
+
+#
+# Watcher of filesystem changes.
+#
+class Inotify(object):
+
+    #
+    # Constructor.
+    #
+    # @raise OSError if inotify is not available.
+    #
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    #
+    # Get the file descriptor, e.g. to be watched by a main loop.
+    #
+    def fileno(self):
+        return self._fd
+
+    #
+    # Watch a file or a directory.
+    #
+    # @param path Path of the file or of the directory.
+    # @param mask Events to watch, see "IN_*".
+    # @return The watch descriptor.
+    # @raise OSError if the path cannot be watched.
+    #
+    def add_watch(self, path, mask):
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    #
+    # Read the pending events, waiting for them up to the given timeout.
+    #
+    # @param timeout_s Timeout in seconds, None to wait forever.
+    # @return The list of events, empty on timeout.
+    #
+    def read_events(self, timeout_s=None):
+        readable, _, _ = select.select([self._fd], [], [], timeout_s)
+        if not readable:
+            return []
+        try:
+            buffer = os.read(self._fd, READ_SIZE_bytes)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return []
+            raise
+        events = []
+        offset = 0
+        while offset + EVENT_SIZE <= len(buffer):
+            wd, mask, cookie, length = \
+                struct.unpack_from(EVENT_FORMAT, buffer, offset)
+            offset += EVENT_SIZE
+            name = buffer[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append(Event(wd, mask, cookie, os.fsdecode(name)))
+        return events
+
+    #
+    # Stop watching.
+    #
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    #
+    # Context manager, stopping watching on exit.
+    #
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
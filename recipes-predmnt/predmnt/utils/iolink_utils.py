@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides the parts of the Predictive Maintenance application which
+# depend on the serial port and on the IO-Link SDK. It is imported only when the
+# sensors are used, to keep the startup of the application fast otherwise.
+
+
+# IMPORT
+
+from __future__ import print_function
+import serial
+from serial import SerialException
+from serial import SerialTimeoutException
+
+import wire_st_sdk.iolink.iolink_protocol as iolink_protocol
+from wire_st_sdk.iolink.iolink_master import IOLinkMaster
+from wire_st_sdk.iolink.iolink_master import IOLinkMasterListener
+from wire_st_sdk.iolink.iolink_device import IOLinkDevice
+from wire_st_sdk.utils.wire_st_exceptions import WireSTInvalidOperationException
+
+
+# CONSTANTS
+
+# Exceptions which stop the application.
+FATAL_EXCEPTIONS = (WireSTInvalidOperationException, SerialException,
+    SerialTimeoutException)
+
+
+# FUNCTIONS
+
+#
+# Create a serial port to connect to an IO-Link Masterboard.
+#
+# @param name      Name of the serial port.
+# @param baudrate  Baud rate [b/s].
+# @param timeout_s Read timeout in seconds.
+# @return The serial port, not yet opened.
+#
+def create_serial_port(name, baudrate, timeout_s):
+    serial_port = serial.Serial()
+    serial_port.port = name
+    serial_port.baudrate = baudrate
+    serial_port.parity = serial.PARITY_NONE
+    serial_port.stopbits = serial.STOPBITS_ONE
+    serial_port.bytesize = serial.EIGHTBITS
+    serial_port.timeout = timeout_s
+    serial_port.write_timeout = None
+    return serial_port
+
+
+# CLASSES
+
+#
+# Implementation of the interface used by the IOLinkMaster class to notify the
+# status of the connection.
+#
+class MyIOLinkMasterListener(IOLinkMasterListener):
+
+    #
+    # To be called whenever a masterboard changes its status.
+    #
+    # @param masterboard IOLinkMaster instance that has changed its status.
+    # @param new_status New status.
+    # @param old_status Old status.
+    #
+    def on_status_change(self, masterboard, new_status, old_status):
+        print('Masterboard on port \"%s\" from \"%s\" to \"%s\".' %
+            (masterboard.get_port().port, str(old_status), str(new_status)))
+
+    #
+    # To be called whenever a masterboard finds a new device connected.
+    #
+    # @param masterboard (IOLinkMaster): Masterboard that has found a new device.
+    # @param device_id (str): New device found.
+    # @param device_position (int): Position of the new device found.
+    #
+    def on_device_found(self, masterboard, device_id, device_position):
+        print('Masterboard on port \"%s\" found device \"%s\" on position \"%d\".' %
+            (masterboard.get_port().port, device_id, device_position))
@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides an asynchronous logging pipeline for the console: records
+# are put on a bounded queue by the acquisition loop and written by a background
+# thread, so that a slow console, e.g. a pipe which is not read in time, never
+# blocks the acquisition. When the queue is full records are dropped, and the
+# number of dropped records is logged as soon as there is room again.
+#
+# Samples are logged per stream, with a verbosity level per stream:
+# - "DEBUG": each sample is logged, and counted in the summaries;
+# - "INFO": samples are only counted in the periodic summaries of the devices;
+# - "WARNING" or higher: samples are neither logged nor counted.
+#
+# Configuration example:
+#
+# "logging": {
+#     "queue_size": 1000,
+#     "summary_interval_s": 10,
+#     "stream_levels": {
+#         "environmental": "DEBUG",
+#         "inertial_fdm": "WARNING"
+#     }
+# }
+
+
+# IMPORT
+
+from __future__ import print_function
+import sys
+import time
+import queue
+import logging
+import logging.handlers
+
+
+# CONSTANTS
+
+# Loggers.
+LOGGER_NAME = 'pmp'
+SAMPLES_LOGGER_NAME = LOGGER_NAME + '.samples'
+
+# Defaults.
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_SUMMARY_INTERVAL_s = 10
+DEFAULT_STREAM_LEVEL = 'INFO'
+
+
+# CLASSES
+
+#
+# Handler putting records on a bounded queue without ever blocking, and
+# dropping them when the queue is full.
+#
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+
+    #
+    # Constructor.
+    #
+    # @param queue Bounded queue.
+    #
+    def __init__(self, queue):
+        super(DroppingQueueHandler, self).__init__(queue)
+        self._dropped = 0
+        self._dropped_total = 0
+
+    #
+    # Get the number of records dropped so far.
+    #
+    def get_dropped(self):
+        return self._dropped_total
+
+    #
+    # Prepare a record for queuing.
+    # Records are formatted by the background thread instead of the calling
+    # one, as they do not leave the process.
+    #
+    def prepare(self, record):
+        return record
+
+    #
+    # Queue a record, preceded by the notice of the records dropped before, if
+    # any. Called with the handler's lock held.
+    #
+    def enqueue(self, record):
+        try:
+            if self._dropped:
+                self.queue.put_nowait(logging.LogRecord(
+                    LOGGER_NAME, logging.WARNING, __file__, 0,
+                    '%d log messages dropped.', (self._dropped,), None))
+                self._dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._dropped += 1
+            self._dropped_total += 1
+
+
+#
+# Periodic summary of the samples of a device.
+#
+class SampleSummary(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self):
+        self.counts = {}
+        self.start = time.monotonic()
+
+    #
+    # Count a sample of a stream.
+    #
+    def count(self, stream):
+        self.counts[stream] = self.counts.get(stream, 0) + 1
+
+    #
+    # Get the time elapsed since the beginning of the summary [s].
+    #
+    def get_elapsed_s(self):
+        return time.monotonic() - self.start
+
+    #
+    # Get a human-readable description of the summary.
+    #
+    def describe(self):
+        return '%d samples in %.0f s (%s).' % (
+            sum(self.counts.values()),
+            self.get_elapsed_s(),
+            ', '.join('%s: %d' % (stream, self.counts[stream])
+                for stream in sorted(self.counts)))
+
+
+#
+# Asynchronous logging pipeline for the console.
+#
+class LogPipeline(object):
+
+    #
+    # Constructor.
+    #
+    # @param configuration Dictionary with the optional "queue_size",
+    #                      "summary_interval_s" (0 to disable summaries) and
+    #                      "stream_levels" settings.
+    # @param stream        Stream where to write records, standard output by
+    #                      default.
+    # @raise ValueError if a level is unknown.
+    #
+    def __init__(self, configuration, stream=None):
+        self._summary_interval_s = configuration.get(
+            "summary_interval_s", DEFAULT_SUMMARY_INTERVAL_s)
+        self._summaries = {}
+        self._stream_levels = {}
+        for stream_name, level in \
+            configuration.get("stream_levels", {}).items():
+            self._stream_levels[stream_name] = self._get_level(level)
+
+        # Writing records as they are, through a background thread.
+        console_handler = logging.StreamHandler(
+            sys.stdout if stream is None else stream)
+        console_handler.setFormatter(logging.Formatter('%(message)s'))
+        self._queue = queue.Queue(
+            configuration.get("queue_size", DEFAULT_QUEUE_SIZE))
+        self._handler = DroppingQueueHandler(self._queue)
+        self._listener = logging.handlers.QueueListener(
+            self._queue, console_handler)
+
+        self._logger = logging.getLogger(LOGGER_NAME)
+        self._logger.setLevel(logging.DEBUG)
+        self._logger.propagate = False
+        self._samples_logger = logging.getLogger(SAMPLES_LOGGER_NAME)
+        self._stream_loggers = {}
+        self._started = False
+
+    #
+    # Get the logger of the application.
+    #
+    def get_logger(self):
+        return self._logger
+
+    #
+    # Get the number of records dropped so far.
+    #
+    def get_dropped(self):
+        return self._handler.get_dropped()
+
+    #
+    # Start the background thread.
+    #
+    def start(self):
+        self._logger.addHandler(self._handler)
+        self._listener.start()
+        self._started = True
+
+    #
+    # Write the pending records and stop the background thread.
+    #
+    def close(self):
+        if self._started:
+            self._started = False
+            self._logger.removeHandler(self._handler)
+            self._listener.stop()
+
+    #
+    # Log a sample of a stream of a device, according to the level of the
+    # stream, and the summary of the device when due.
+    #
+    # @param device_name Name of the device.
+    # @param stream      Name of the stream.
+    # @param timestamp   Formatted timestamp of the sample.
+    # @param message     Message describing the sample.
+    #
+    def log_sample(self, device_name, stream, timestamp, message):
+        logger = self._get_stream_logger(stream)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[%s] (%s): %s', device_name, timestamp, message)
+        if not self._summary_interval_s or \
+            not logger.isEnabledFor(logging.INFO):
+            return
+        summary = self._summaries.get(device_name)
+        if summary is None:
+            summary = self._summaries[device_name] = SampleSummary()
+        summary.count(stream)
+        if summary.get_elapsed_s() >= self._summary_interval_s:
+            self._samples_logger.info('[%s] (%s): %s',
+                device_name, timestamp, summary.describe())
+            self._summaries[device_name] = SampleSummary()
+
+    #
+    # Get the logger of a stream, created with the level of the stream.
+    #
+    def _get_stream_logger(self, stream):
+        logger = self._stream_loggers.get(stream)
+        if logger is None:
+            logger = self._samples_logger.getChild(stream)
+            logger.setLevel(self._stream_levels.get(
+                stream, self._get_level(DEFAULT_STREAM_LEVEL)))
+            self._stream_loggers[stream] = logger
+        return logger
+
+    #
+    # Get a level given its name.
+    #
+    def _get_level(self, name):
+        level = logging.getLevelName(str(name).upper())
+        if not isinstance(level, int):
+            raise ValueError('Unknown logging level \"%s\".' % (name))
+        return level
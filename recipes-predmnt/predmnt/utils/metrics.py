@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides low-overhead metrics (counters and fixed-bucket
+# histograms) and their periodic export in the Prometheus text format, either
+# to a text file (e.g. for the node exporter's textfile collector) or through a
+# local HTTP endpoint.
+
+
+# IMPORT
+
+from __future__ import print_function
+import os
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+
+# CONSTANTS
+
+# Types of metrics.
+TYPE_COUNTER = 'counter'
+TYPE_GAUGE = 'gauge'
+TYPE_HISTOGRAM = 'histogram'
+
+# Default buckets of duration histograms [s].
+DURATION_BUCKETS_s = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Export.
+DEFAULT_EXPORT_INTERVAL_s = 15
+HTTP_PATH = '/metrics'
+HTTP_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+# FUNCTIONS
+
+#
+# Escape the value of a label.
+#
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+#
+# Format a set of labels.
+#
+def _format_labels(names, values, extra=''):
+    labels = ['%s="%s"' % (name, _escape(value))
+        for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{%s}' % (','.join(labels)) if labels else ''
+
+
+# CLASSES
+
+#
+# Histogram with fixed buckets.
+#
+class Histogram(object):
+
+    #
+    # Constructor.
+    #
+    # @param buckets Sorted list of the upper bounds of the buckets.
+    #
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    #
+    # Add a value.
+    #
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+#
+# Registry of metrics, each one with a fixed set of label names and one value
+# per combination of label values. Thread-safe.
+#
+class MetricsRegistry(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    #
+    # Add a counter.
+    #
+    # @param name        Name of the metric.
+    # @param help        Description of the metric.
+    # @param label_names Tuple of the names of the labels.
+    #
+    def add_counter(self, name, help, label_names=()):
+        self._metrics[name] = (TYPE_COUNTER, help, label_names, None, {})
+
+    #
+    # Add a gauge.
+    #
+    # @param name        Name of the metric.
+    # @param help        Description of the metric.
+    # @param label_names Tuple of the names of the labels.
+    #
+    def add_gauge(self, name, help, label_names=()):
+        self._metrics[name] = (TYPE_GAUGE, help, label_names, None, {})
+
+    #
+    # Add a histogram.
+    #
+    # @param name        Name of the metric.
+    # @param help        Description of the metric.
+    # @param label_names Tuple of the names of the labels.
+    # @param buckets     Sorted list of the upper bounds of the buckets.
+    #
+    def add_histogram(self, name, help, label_names=(),
+        buckets=DURATION_BUCKETS_s):
+        self._metrics[name] = (TYPE_HISTOGRAM, help, label_names, buckets, {})
+
+    #
+    # Increment a counter.
+    #
+    # @param name   Name of the metric.
+    # @param labels Tuple of the values of the labels.
+    # @param amount Increment.
+    #
+    def increment(self, name, labels=(), amount=1):
+        values = self._metrics[name][4]
+        with self._lock:
+            values[labels] = values.get(labels, 0) + amount
+
+    #
+    # Set the value of a gauge, or of a counter when it is kept elsewhere.
+    #
+    def set(self, name, labels, value):
+        values = self._metrics[name][4]
+        with self._lock:
+            values[labels] = value
+
+    #
+    # Add a value to a histogram.
+    #
+    # @param name   Name of the metric.
+    # @param labels Tuple of the values of the labels.
+    # @param value  Value.
+    #
+    def observe(self, name, labels, value):
+        metric = self._metrics[name]
+        values = metric[4]
+        with self._lock:
+            if labels not in values:
+                values[labels] = Histogram(metric[3])
+            values[labels].observe(value)
+
+    #
+    # Render the metrics in the Prometheus text format.
+    #
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted(self._metrics):
+                type, help, label_names, buckets, values = self._metrics[name]
+                lines.append('# HELP %s %s' % (name, help))
+                lines.append('# TYPE %s %s' % (name, type))
+                for labels in sorted(values):
+                    if type != TYPE_HISTOGRAM:
+                        lines.append('%s%s %s' % (name,
+                            _format_labels(label_names, labels),
+                            values[labels]))
+                        continue
+                    histogram = values[labels]
+                    cumulative = 0
+                    for i, bound in enumerate(buckets + ['+Inf']):
+                        cumulative += histogram.counts[i]
+                        lines.append('%s_bucket%s %d' % (name,
+                            _format_labels(label_names, labels,
+                            'le="%s"' % (bound)), cumulative))
+                    lines.append('%s_sum%s %.6f' % (name,
+                        _format_labels(label_names, labels), histogram.sum))
+                    lines.append('%s_count%s %d' % (name,
+                        _format_labels(label_names, labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    #
+    # Write the metrics to a text file, atomically replacing it.
+    #
+    def write_textfile(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            fp.write(self.render())
+        os.replace(tmp_path, path)
+
+
+#
+# Handler of the HTTP requests of the metrics' endpoint.
+#
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    #
+    # Handle a GET request.
+    #
+    def do_GET(self):
+        if self.path != HTTP_PATH:
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', HTTP_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    #
+    # Do not log requests.
+    #
+    def log_message(self, format, *args):
+        pass
+
+
+#
+# Thread exporting the metrics of a registry periodically to a text file and,
+# optionally, serving them through a local HTTP endpoint.
+#
+class MetricsExporter(threading.Thread):
+
+    #
+    # Constructor.
+    #
+    # @param registry      Registry of metrics.
+    # @param textfile_path Path of the text file, or None.
+    # @param interval_s    Interval between two writes of the text file.
+    # @param http_port     Port of the HTTP endpoint, or 0 to disable it.
+    # @param http_address  Address of the HTTP endpoint.
+    #
+    def __init__(self, registry, textfile_path=None,
+        interval_s=DEFAULT_EXPORT_INTERVAL_s, http_port=0,
+        http_address='127.0.0.1'):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._registry = registry
+        self._textfile_path = textfile_path
+        self._interval_s = interval_s
+        self._stop_event = threading.Event()
+        self._server = None
+        if http_port:
+            self._server = HTTPServer((http_address, http_port),
+                _MetricsRequestHandler)
+            self._server.registry = registry
+            self._server_thread = threading.Thread(
+                target=self._server.serve_forever)
+            self._server_thread.daemon = True
+        if textfile_path:
+            directory = os.path.dirname(textfile_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+    #
+    # Run the thread.
+    #
+    def run(self):
+        if self._server:
+            self._server_thread.start()
+        while not self._stop_event.wait(self._interval_s):
+            self._write()
+
+    #
+    # Stop exporting, writing the text file a last time.
+    #
+    def close(self):
+        self._stop_event.set()
+        if self._server:
+            if self._server_thread.is_alive():
+                self._server.shutdown()
+            self._server.server_close()
+        self._write()
+
+    #
+    # Write the text file, if any.
+    #
+    def _write(self):
+        if self._textfile_path:
+            try:
+                self._registry.write_textfile(self._textfile_path)
+            except OSError as e:
+                print('Metrics: %s' % (e))
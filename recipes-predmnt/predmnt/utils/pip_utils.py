@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides useful functions to install Python packages through the
+# "pip" tool, tracking the installation process and checking the installed
+# packages through "importlib.metadata".
+#
+# Packages can be installed offline from a wheelhouse, i.e. a folder of wheels
+# with a manifest of their SHA256 hashes in the format of "sha256sum", e.g.:
+#
+#   cd wheelhouse && pip3 download -d . <packages> && sha256sum *.whl > SHA256SUMS
+
+
+# IMPORT
+
+from __future__ import print_function
+import os
+import re
+import time
+import codecs
+import hashlib
+import subprocess
+import collections
+import importlib.metadata
+
+
+# CONSTANTS
+
+# Installation command.
+PIP_INSTALL_COMMAND = ['pip3', 'install']
+PIP_OFFLINE_OPTIONS = ['--no-index', '--find-links']
+
+# Wheelhouse.
+WHEELHOUSE_MANIFEST = 'SHA256SUMS'
+WHEEL_EXT = '.whl'
+HASH_CHUNK_SIZE_bytes = 1024 * 1024
+
+# Size of the chunks of output read from processes.
+READ_SIZE_bytes = 4096
+
+#
+# Result of an installation.
+#
+# installed   Packages installed, including the ones already installed before.
+# missing     Packages still missing.
+# return_code Return code of the last command run, or None if nothing was run.
+# elapsed_s   Duration of the installation [s].
+#
+InstallResult = collections.namedtuple('InstallResult',
+    ['installed', 'missing', 'return_code', 'elapsed_s'])
+
+
+# FUNCTIONS
+
+#
+# Normalize the name of a package, as for comparing names (PEP 503).
+#
+def normalize_name(name):
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+#
+# Get the packages which are not installed.
+#
+# @param packages List of names of packages.
+# @return The list of the names of the missing packages.
+#
+def get_missing_packages(packages):
+    # Installing packages does not invalidate the cached folder listings.
+    importlib.invalidate_caches()
+    installed = set(normalize_name(distribution.metadata['Name'])
+        for distribution in importlib.metadata.distributions()
+        if distribution.metadata['Name'])
+    return [package for package in packages
+        if normalize_name(package) not in installed]
+
+#
+# Run a command until completion, streaming its output in chunks.
+#
+# @param command         Command as a list of arguments.
+# @param output_callback Function called with each chunk of output, as text.
+# @return The return code of the command.
+#
+def run_command(command, output_callback=None):
+    try:
+        process = subprocess.Popen(command,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    except OSError as e:
+        if output_callback:
+            output_callback('%s\n' % (e))
+        return None
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with process.stdout:
+        while True:
+            chunk = os.read(process.stdout.fileno(), READ_SIZE_bytes)
+            text = decoder.decode(chunk, final=not chunk)
+            if text and output_callback:
+                output_callback(text)
+            if not chunk:
+                break
+    return process.wait()
+
+#
+# Check whether a folder is a wheelhouse, i.e. has a manifest.
+#
+def is_wheelhouse(path):
+    return os.path.isfile(os.path.join(path, WHEELHOUSE_MANIFEST))
+
+#
+# Read the manifest of a wheelhouse.
+#
+# @return Dictionary of the SHA256 hashes, by name of the file.
+# @raise ValueError if the manifest cannot be read or is malformed.
+#
+def read_manifest(path):
+    hashes = {}
+    try:
+        with open(os.path.join(path, WHEELHOUSE_MANIFEST), 'r') as fp:
+            for line in fp:
+                if not line.strip():
+                    continue
+                fields = line.split(None, 1)
+                if len(fields) != 2 or len(fields[0]) != 64:
+                    raise ValueError('Malformed manifest line \"%s\".' % \
+                        (line.strip()))
+                # Names are prefixed by '*' when hashed in binary mode.
+                hashes[fields[1].strip().lstrip('*')] = fields[0].lower()
+    except OSError as e:
+        raise ValueError('Manifest not readable: %s.' % (e))
+    return hashes
+
+#
+# Get the SHA256 hash of a file.
+#
+def get_file_hash(file_path):
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE_bytes), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+#
+# Verify the wheels of a wheelhouse against its manifest.
+#
+# @raise ValueError if a wheel is not listed in the manifest, is missing, or
+#        does not match its hash.
+#
+def verify_wheelhouse(path):
+    hashes = read_manifest(path)
+    for name in sorted(os.listdir(path)):
+        if name.endswith(WHEEL_EXT) and name not in hashes:
+            raise ValueError('Wheel \"%s\" not in manifest.' % (name))
+    for name in sorted(hashes):
+        try:
+            file_hash = get_file_hash(os.path.join(path, name))
+        except OSError as e:
+            raise ValueError('Wheel \"%s\" not readable: %s.' % (name, e))
+        if file_hash != hashes[name]:
+            raise ValueError('Wheel \"%s\" does not match its hash.' % (name))
+
+#
+# Install Python packages, unless already installed.
+#
+# @param packages        List of names of packages.
+# @param output_callback Function called with each chunk of output, as text.
+# @param pre_commands    Commands to run before installing from the network,
+#                        e.g. to upgrade the "pip" tool, only if any package is
+#                        missing.
+# @param wheelhouse_path Wheelhouse to install the packages and their
+#                        dependencies from, without network, if any. It is
+#                        verified against its manifest before installing.
+# @return The result of the installation, see "InstallResult".
+# @raise ValueError if the wheelhouse is not valid.
+#
+def install_packages(packages, output_callback=None, pre_commands=(),
+    wheelhouse_path=None):
+    start = time.monotonic()
+    return_code = None
+    missing = get_missing_packages(packages)
+    if missing:
+        if wheelhouse_path:
+            verify_wheelhouse(wheelhouse_path)
+            command = PIP_INSTALL_COMMAND + PIP_OFFLINE_OPTIONS \
+                + [wheelhouse_path] + missing
+        else:
+            for pre_command in pre_commands:
+                run_command(pre_command, output_callback)
+            command = PIP_INSTALL_COMMAND + missing
+        return_code = run_command(command, output_callback)
+        missing = get_missing_packages(missing)
+    return InstallResult(
+        [package for package in packages if package not in missing],
+        missing, return_code, time.monotonic() - start)
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides the profilers used by the profiling mode of the PMP
+# application:
+#   - "cprofile": deterministic profiler of the thread which starts it and of
+#     the functions run through "profile_call()" by other threads, based on the
+#     standard "cProfile" module;
+#   - "sampling": low-overhead statistical profiler of all the threads, which
+#     samples their stacks periodically from a background thread.
+#
+# On stop, both write a "<prefix>.pstats" file, readable through the standard
+# "pstats" module, and a "<prefix>.txt" summary of the top-N functions; the
+# sampling profiler also writes a "<prefix>.collapsed" file with one
+# "frame;frame;... count" line per stack, to be used as input for flame graphs
+# (e.g. "flamegraph.pl <prefix>.collapsed > <prefix>.svg").
+
+
+# IMPORT
+
+from __future__ import print_function
+import os
+import io
+import sys
+import time
+import marshal
+import pstats
+import cProfile
+import threading
+from collections import Counter
+
+
+# CONSTANTS
+
+# Modes.
+MODE_CPROFILE = 'cprofile'
+MODE_SAMPLING = 'sampling'
+MODES = [MODE_CPROFILE, MODE_SAMPLING]
+
+# Defaults.
+DEFAULT_SAMPLING_INTERVAL_s = 0.005
+DEFAULT_TOP = 20
+
+# Extensions of the output files.
+PSTATS_EXT = '.pstats'
+COLLAPSED_EXT = '.collapsed'
+SUMMARY_EXT = '.txt'
+
+
+# FUNCTIONS
+
+#
+# Create a profiler.
+#
+# @param mode Either "MODE_CPROFILE" or "MODE_SAMPLING".
+# @return The profiler.
+# @raise ValueError if the mode is unknown.
+#
+def create_profiler(mode):
+    if mode == MODE_CPROFILE:
+        return CProfileProfiler()
+    if mode == MODE_SAMPLING:
+        return SamplingProfiler()
+    raise ValueError('Unknown profiling mode \"%s\", must be one of %s.' % \
+        (mode, MODES))
+
+#
+# Write the summary of the top-N functions of a "pstats" file, sorted both by
+# own time and by cumulative time.
+#
+# @param pstats_path Path of the "pstats" file.
+# @param path        Path of the summary.
+# @param top         Number of functions.
+# @return The summary.
+#
+def write_summary(pstats_path, path, top=DEFAULT_TOP):
+    stream = io.StringIO()
+    stats = pstats.Stats(pstats_path, stream=stream)
+    stats.strip_dirs()
+    for sort_key in ['tottime', 'cumulative']:
+        stats.sort_stats(sort_key).print_stats(top)
+    summary = stream.getvalue()
+    with open(path, 'w') as fp:
+        fp.write(summary)
+    return summary
+
+#
+# Create the directory of the output files, if needed.
+#
+def _make_directory(prefix):
+    directory = os.path.dirname(prefix)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+
+# CLASSES
+
+#
+# Deterministic profiler of the thread which starts it, and of the functions run
+# through "profile_call()" by other threads.
+#
+# As "cProfile" only profiles the thread which enables it, each other thread
+# gets its own profile, and the profiles are merged when written.
+#
+class CProfileProfiler(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self):
+        self._profile = cProfile.Profile()
+        self._profiles = [self._profile]
+        self._lock = threading.Lock()
+        self._thread_id = None
+
+    #
+    # Start profiling.
+    #
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._profile.enable()
+
+    #
+    # Stop profiling.
+    # The functions run through "profile_call()" are expected to have returned.
+    #
+    def stop(self):
+        self._profile.disable()
+
+    #
+    # Call a function, profiling it if called by a thread other than the one
+    # which started the profiler.
+    #
+    def profile_call(self, function, *args):
+        if threading.get_ident() == self._thread_id:
+            return function(*args)
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+        try:
+            return function(*args)
+        finally:
+            profile.disable()
+
+    #
+    # Write the output files.
+    #
+    # @param prefix Prefix of the paths of the output files.
+    # @param top    Number of functions of the summary.
+    # @return The summary.
+    #
+    def write(self, prefix, top=DEFAULT_TOP):
+        _make_directory(prefix)
+        with self._lock:
+            stats = pstats.Stats(*self._profiles)
+        stats.dump_stats(prefix + PSTATS_EXT)
+        return write_summary(prefix + PSTATS_EXT, prefix + SUMMARY_EXT, top)
+
+
+#
+# Statistical profiler of all the threads but its own, sampling their stacks
+# from a background thread.
+#
+class SamplingProfiler(threading.Thread):
+
+    #
+    # Constructor.
+    #
+    # @param interval_s Interval between two samples.
+    #
+    def __init__(self, interval_s=DEFAULT_SAMPLING_INTERVAL_s):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._interval_s = interval_s
+        self._stop_event = threading.Event()
+        self._stacks = Counter()
+        self._samples = 0
+
+    #
+    # Stop profiling.
+    #
+    def stop(self):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    #
+    # Call a function, which is profiled as any other one.
+    #
+    def profile_call(self, function, *args):
+        return function(*args)
+
+    #
+    # Get the number of samples taken.
+    #
+    def get_samples(self):
+        return self._samples
+
+    #
+    # Run the thread.
+    #
+    def run(self):
+        own_id = threading.get_ident()
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            names = dict((thread.ident, thread.name)
+                for thread in threading.enumerate())
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        (code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                stack.reverse()
+                self._stacks[(names.get(thread_id, str(thread_id)),
+                    tuple(stack))] += 1
+            self._samples += 1
+            next_time += self._interval_s
+            self._stop_event.wait(max(0, next_time - time.monotonic()))
+
+    #
+    # Write the output files.
+    #
+    # @param prefix Prefix of the paths of the output files.
+    # @param top    Number of functions of the summary.
+    # @return The summary.
+    #
+    def write(self, prefix, top=DEFAULT_TOP):
+        _make_directory(prefix)
+
+        # Collapsed stacks.
+        with open(prefix + COLLAPSED_EXT, 'w') as fp:
+            for (thread_name, stack), count in sorted(self._stacks.items()):
+                frames = [thread_name] + ['%s (%s:%d)' % \
+                    (name, os.path.basename(filename), line)
+                    for filename, line, name in stack]
+                fp.write('%s %d\n' % (';'.join(frames), count))
+
+        # Statistics in "pstats" format, where times are estimated from the
+        # number of samples and the number of calls is the number of samples.
+        own = Counter()
+        cumulative = Counter()
+        callers = {}
+        for (thread_name, stack), count in self._stacks.items():
+            if not stack:
+                continue
+            own[stack[-1]] += count
+            for function in set(stack):
+                cumulative[function] += count
+            for i in range(1, len(stack)):
+                function_callers = callers.setdefault(stack[i], Counter())
+                function_callers[stack[i - 1]] += count
+        stats = {}
+        for function, count in cumulative.items():
+            stats[function] = (count, count,
+                own[function] * self._interval_s,
+                count * self._interval_s,
+                dict((caller, (n, n, 0.0, n * self._interval_s))
+                    for caller, n in callers.get(function, {}).items()))
+        with open(prefix + PSTATS_EXT, 'wb') as fp:
+            marshal.dump(stats, fp)
+        return write_summary(prefix + PSTATS_EXT, prefix + SUMMARY_EXT, top)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This file provides a timer-driven scheduler which runs periodic tasks (e.g.
+# the acquisition of data from the sensors) from a single thread, sleeping
+# until the next task is due.
+
+
+# IMPORT
+
+from __future__ import print_function
+import heapq
+import threading
+import time
+
+
+# CLASSES
+
+#
+# Interface used by the Scheduler class to notify the execution of tasks.
+#
+class SchedulerListener(object):
+
+    #
+    # To be called whenever a task has been run.
+    #
+    # @param scheduler Scheduler that has run the task.
+    # @param task      Task that has been run.
+    # @param lateness_s Delay in seconds between the due time and the actual
+    #                  start time of the task.
+    #
+    def on_task_run(self, scheduler, task, lateness_s):
+        pass
+
+
+#
+# Periodic task handled by the scheduler.
+#
+class PeriodicTask(object):
+
+    #
+    # Constructor.
+    #
+    # @param name     Name of the task.
+    # @param function Function to call periodically.
+    # @param period_s Period in seconds.
+    # @param args     Arguments to pass to the function.
+    #
+    def __init__(self, name, function, period_s, args=()):
+        if period_s <= 0:
+            raise ValueError('Period of task \"%s\" must be positive.' % (name))
+        self.name = name
+        self.function = function
+        self.period_s = period_s
+        self.args = args
+        self.due_time = None
+        self.runs = 0
+        self.skipped = 0
+        self.last_lateness_s = 0.0
+        self.max_lateness_s = 0.0
+        self.total_lateness_s = 0.0
+
+    #
+    # Get the mean lateness of the task in seconds.
+    #
+    def get_mean_lateness_s(self):
+        if not self.runs:
+            return 0.0
+        return self.total_lateness_s / self.runs
+
+
+#
+# Timer-driven scheduler of periodic tasks.
+#
+# Tasks are kept in a heap ordered by due time, and the scheduler sleeps until
+# the first one is due. The next due time of a task is computed from its
+# previous due time rather than from the end of its execution, so that periods
+# do not stretch; when a task overruns one or more periods, the missed
+# activations are skipped and counted.
+#
+class Scheduler(object):
+
+    #
+    # Constructor.
+    #
+    def __init__(self):
+        self._heap = []
+        self._counter = 0
+        self._tasks = []
+        self._listeners = []
+        self._running = True
+        self._condition = threading.Condition()
+
+    #
+    # Add a listener.
+    #
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    #
+    # Add a periodic task, to be run for the first time after the given delay.
+    #
+    def add_task(self, task, delay_s=0.0):
+        with self._condition:
+            task.due_time = time.monotonic() + delay_s
+            self._push(task)
+            self._tasks.append(task)
+            self._condition.notify()
+
+    #
+    # Get the list of the scheduled tasks.
+    #
+    def get_tasks(self):
+        return list(self._tasks)
+
+    #
+    # Run the scheduled tasks until "stop()" is called.
+    # Blocking call.
+    #
+    def run(self):
+        while True:
+            with self._condition:
+                # Sleeping until the first task is due.
+                while self._running:
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    delay_s = self._heap[0][0] - time.monotonic()
+                    if delay_s <= 0:
+                        break
+                    self._condition.wait(delay_s)
+                if not self._running:
+                    return
+                task = heapq.heappop(self._heap)[2]
+
+            # Running the task.
+            lateness_s = time.monotonic() - task.due_time
+            task.function(*task.args)
+            self._update_task(task, lateness_s)
+            for listener in self._listeners:
+                listener.on_task_run(self, task, lateness_s)
+
+    #
+    # Stop the scheduler.
+    # Tasks already running are completed.
+    #
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+    #
+    # Update the statistics and the due time of a task which has just run.
+    #
+    def _update_task(self, task, lateness_s):
+        task.runs += 1
+        task.last_lateness_s = lateness_s
+        task.total_lateness_s += lateness_s
+        task.max_lateness_s = max(task.max_lateness_s, lateness_s)
+        task.due_time += task.period_s
+        now = time.monotonic()
+        if task.due_time < now:
+            missed = int((now - task.due_time) // task.period_s) + 1
+            task.skipped += missed
+            task.due_time += missed * task.period_s
+        with self._condition:
+            self._push(task)
+
+    #
+    # Push a task onto the heap.
+    # The counter keeps tasks with the same due time in insertion order.
+    #
+    def _push(self, task):
+        heapq.heappush(self._heap, (task.due_time, self._counter, task))
+        self._counter += 1
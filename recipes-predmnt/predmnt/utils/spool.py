@@ -0,0 +1,611 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+# DESCRIPTION
+#
+# This file provides a store-and-forward mechanism for publishing messages to
+# the cloud: messages are handed over to a background thread which publishes
+# them, and those which cannot be published are stored into a bounded on-disk
+# spool, to be replayed in order once the connectivity is restored.
+
+
+# IMPORT
+
+from __future__ import print_function
+import os
+import json
+import time
+import struct
+import threading
+import collections
+
+
+# CONSTANTS
+
+# Defaults.
+DEFAULT_MAX_SIZE_bytes = 64 * 1024 * 1024
+DEFAULT_MAX_AGE_s = 24 * 60 * 60
+DEFAULT_SEGMENT_SIZE_bytes = 1024 * 1024
+DEFAULT_LIVE_QUEUE_SIZE = 100
+DEFAULT_REPLAY_RATE_msgs_per_s = 5
+DEFAULT_RETRY_INTERVAL_s = 10
+DEFAULT_STATISTICS_INTERVAL_s = 60
+
+# Segments.
+SEGMENT_NAME = 'segment_%010d.spool'
+SEGMENT_PREFIX = 'segment_'
+SEGMENT_EXT = '.spool'
+CURSOR_NAME = 'cursor.json'
+CURSOR_SAVE_EVERY_RECORDS = 20
+
+# Record header: payload size, timestamp, QoS, binary payload flag, client name
+# size, topic size, trace's stream size, sequence number (-1 if none) and
+# acquisition time.
+RECORD_HEADER_FORMAT = '<IdBBHHBqd'
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+
+# Drain rate.
+DRAIN_RATE_WINDOW_s = 5.0
+
+# Maximum time to wait for the publishing thread to terminate.
+CLOSE_TIMEOUT_s = 5
+
+
+# CLASSES
+
+#
+# Message to publish.
+# The optional trace is a (stream, sequence number, acquisition time) tuple given
+# back to the listeners when the message is published, either live or replayed
+# from the spool.
+#
+Message = collections.namedtuple('Message',
+    ['client_name', 'topic', 'payload', 'qos', 'timestamp', 'trace'],
+    defaults=(None,))
+
+
+#
+# Bounded on-disk spool of messages, made of append-only segment files.
+# Thread-safe.
+#
+class Spool(object):
+
+    #
+    # Constructor.
+    #
+    # @param path               Folder where to store the segments.
+    # @param max_size_bytes     Maximum size of the spool; the oldest segments
+    #                           are dropped when exceeded.
+    # @param max_age_s          Maximum age of the segments; older segments are
+    #                           dropped.
+    # @param segment_size_bytes Size after which a new segment is started.
+    #
+    def __init__(self, path,
+        max_size_bytes=DEFAULT_MAX_SIZE_bytes,
+        max_age_s=DEFAULT_MAX_AGE_s,
+        segment_size_bytes=DEFAULT_SEGMENT_SIZE_bytes):
+        self._path = path
+        self._max_size_bytes = max_size_bytes
+        self._max_age_s = max_age_s
+        self._segment_size_bytes = segment_size_bytes
+        self._lock = threading.Lock()
+        self._segments = collections.OrderedDict()
+        self._write_fp = None
+        self._write_id = None
+        self._read_fp = None
+        self._read_id = None
+        self._read_offset = 0
+        self._read_records = 0
+        self._popped_records = 0
+        self.dropped_records = 0
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self._load()
+
+    #
+    # Append a message.
+    #
+    def append(self, message):
+        client_name = message.client_name.encode('utf-8')
+        topic = message.topic.encode('utf-8')
+        binary = isinstance(message.payload, (bytes, bytearray))
+        payload = bytes(message.payload) if binary \
+            else message.payload.encode('utf-8')
+        stream, sequence, acquisition_time = message.trace \
+            if message.trace else ('', -1, 0.0)
+        stream = stream.encode('utf-8')
+        record = struct.pack(RECORD_HEADER_FORMAT, len(payload),
+            message.timestamp, message.qos, int(binary), len(client_name),
+            len(topic), len(stream), sequence, acquisition_time) \
+            + client_name + topic + stream + payload
+        with self._lock:
+            if self._write_fp is None or \
+                self._segments[self._write_id][0] >= self._segment_size_bytes:
+                self._roll()
+            self._write_fp.write(record)
+            self._write_fp.flush()
+            self._segments[self._write_id][0] += len(record)
+            self._segments[self._write_id][1] += 1
+            self._enforce_size()
+
+    #
+    # Get the oldest message without removing it.
+    #
+    # @return The oldest message, or None if the spool is empty.
+    #
+    def peek(self):
+        with self._lock:
+            record = self._read()
+            return record[0] if record else None
+
+    #
+    # Remove the oldest message.
+    #
+    def pop(self):
+        with self._lock:
+            record = self._read()
+            if not record:
+                return
+            self._read_offset += record[1]
+            self._read_records += 1
+            self._popped_records += 1
+            if self._popped_records % CURSOR_SAVE_EVERY_RECORDS == 0:
+                self._save_cursor()
+
+    #
+    # Check whether the spool is empty.
+    #
+    def is_empty(self):
+        return not self.get_depth()[0]
+
+    #
+    # Get the number of messages and the number of bytes in the spool.
+    #
+    def get_depth(self):
+        with self._lock:
+            records = sum(segment[1] for segment in self._segments.values())
+            size = sum(segment[0] for segment in self._segments.values())
+            if self._read_id in self._segments:
+                records -= self._read_records
+                size -= self._read_offset
+            return records, size
+
+    #
+    # Drop the segments older than the maximum age.
+    #
+    def expire(self):
+        if not self._max_age_s:
+            return
+        with self._lock:
+            oldest_time = time.time() - self._max_age_s
+            for segment_id in list(self._segments):
+                if os.path.getmtime(self._get_segment_path(segment_id)) \
+                    >= oldest_time:
+                    break
+                self._drop(segment_id)
+
+    #
+    # Close the spool, saving the read position.
+    #
+    def close(self):
+        with self._lock:
+            if self._write_fp:
+                self._write_fp.close()
+                self._write_fp = None
+            if self._read_fp:
+                self._read_fp.close()
+                self._read_fp = None
+            self._save_cursor()
+
+    #
+    # Get the path of a segment.
+    #
+    def _get_segment_path(self, segment_id):
+        return os.path.join(self._path, SEGMENT_NAME % (segment_id))
+
+    #
+    # Load the segments and the read position from disk.
+    #
+    def _load(self):
+        segment_ids = []
+        for fn in os.listdir(self._path):
+            if fn.startswith(SEGMENT_PREFIX) and fn.endswith(SEGMENT_EXT):
+                try:
+                    segment_ids.append(
+                        int(fn[len(SEGMENT_PREFIX):-len(SEGMENT_EXT)]))
+                except ValueError:
+                    pass
+        for segment_id in sorted(segment_ids):
+            self._segments[segment_id] = self._scan(segment_id)
+
+        # Restoring the read position.
+        try:
+            with open(os.path.join(self._path, CURSOR_NAME), 'r') as fp:
+                cursor = json.load(fp)
+            if cursor["segment"] in self._segments and \
+                cursor["offset"] <= self._segments[cursor["segment"]][0]:
+                self._read_id = cursor["segment"]
+                self._read_offset = cursor["offset"]
+                self._read_records = cursor["records"]
+            for segment_id in list(self._segments):
+                if segment_id >= cursor["segment"]:
+                    break
+                self._drop(segment_id, False)
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+
+    #
+    # Scan a segment, truncating an incomplete record at its end.
+    #
+    # @return The size and the number of records of the segment.
+    #
+    def _scan(self, segment_id):
+        offset = 0
+        records = 0
+        with open(self._get_segment_path(segment_id), 'rb+') as fp:
+            while True:
+                header = fp.read(RECORD_HEADER_SIZE)
+                if len(header) < RECORD_HEADER_SIZE:
+                    break
+                fields = struct.unpack(RECORD_HEADER_FORMAT, header)
+                size = fields[0] + fields[4] + fields[5] + fields[6]
+                if len(fp.read(size)) < size:
+                    break
+                offset += RECORD_HEADER_SIZE + size
+                records += 1
+            fp.truncate(offset)
+        return [offset, records]
+
+    #
+    # Start a new segment for writing.
+    #
+    def _roll(self):
+        if self._write_fp:
+            self._write_fp.close()
+        self._write_id = (next(reversed(self._segments)) + 1) \
+            if self._segments else 0
+        self._segments[self._write_id] = [0, 0]
+        self._write_fp = open(self._get_segment_path(self._write_id), 'ab')
+
+    #
+    # Drop the oldest segments while the spool exceeds its maximum size.
+    #
+    def _enforce_size(self):
+        if not self._max_size_bytes:
+            return
+        while len(self._segments) > 1 and \
+            sum(segment[0] for segment in self._segments.values()) \
+            > self._max_size_bytes:
+            self._drop(next(iter(self._segments)))
+
+    #
+    # Drop a segment.
+    #
+    def _drop(self, segment_id, count=True):
+        size, records = self._segments.pop(segment_id)
+        if segment_id == self._read_id:
+            records -= self._read_records
+            if self._read_fp:
+                self._read_fp.close()
+                self._read_fp = None
+            self._read_id = None
+            self._read_offset = 0
+            self._read_records = 0
+        if segment_id == self._write_id:
+            self._write_fp.close()
+            self._write_fp = None
+            self._write_id = None
+        if count:
+            self.dropped_records += records
+        try:
+            os.remove(self._get_segment_path(segment_id))
+        except OSError:
+            pass
+        self._save_cursor()
+
+    #
+    # Read the oldest record.
+    #
+    # @return The message and the size of the record, or None.
+    #
+    def _read(self):
+        while self._segments:
+            if self._read_id not in self._segments:
+                self._read_id = next(iter(self._segments))
+                self._read_offset = 0
+                self._read_records = 0
+            if self._read_offset < self._segments[self._read_id][0]:
+                break
+            if self._read_id == self._write_id:
+                return None
+            # Segment completely read.
+            self._drop(self._read_id, False)
+        else:
+            return None
+
+        if not self._read_fp or \
+            self._read_fp.name != self._get_segment_path(self._read_id):
+            if self._read_fp:
+                self._read_fp.close()
+            self._read_fp = open(self._get_segment_path(self._read_id), 'rb')
+        self._read_fp.seek(self._read_offset)
+        header = self._read_fp.read(RECORD_HEADER_SIZE)
+        payload_size, timestamp, qos, binary, client_name_size, topic_size, \
+            stream_size, sequence, acquisition_time = \
+            struct.unpack(RECORD_HEADER_FORMAT, header)
+        client_name = self._read_fp.read(client_name_size).decode('utf-8')
+        topic = self._read_fp.read(topic_size).decode('utf-8')
+        stream = self._read_fp.read(stream_size).decode('utf-8')
+        payload = self._read_fp.read(payload_size)
+        if not binary:
+            payload = payload.decode('utf-8')
+        trace = (stream, sequence, acquisition_time) if sequence >= 0 else None
+        message = Message(client_name, topic, payload, qos, timestamp, trace)
+        return message, RECORD_HEADER_SIZE + client_name_size + topic_size \
+            + stream_size + payload_size
+
+    #
+    # Save the read position.
+    #
+    def _save_cursor(self):
+        cursor_path = os.path.join(self._path, CURSOR_NAME)
+        try:
+            with open(cursor_path + '.tmp', 'w') as fp:
+                json.dump({
+                    "segment": self._read_id if self._read_id is not None \
+                        else (next(iter(self._segments)) if self._segments \
+                        else 0),
+                    "offset": self._read_offset,
+                    "records": self._read_records
+                }, fp)
+            os.replace(cursor_path + '.tmp', cursor_path)
+        except (IOError, OSError):
+            pass
+
+
+#
+# Interface used by the SpoolPublisher class to notify its statistics.
+#
+class SpoolPublisherListener(object):
+
+    #
+    # To be called periodically with the statistics of the publisher.
+    #
+    # @param publisher  Publisher.
+    # @param statistics Dictionary of statistics, see
+    #                   "SpoolPublisher.get_statistics()".
+    #
+    def on_statistics(self, publisher, statistics):
+        pass
+
+    #
+    # To be called whenever a message has been published.
+    #
+    # @param publisher Publisher.
+    # @param message   Message.
+    # @param ack_time  Time when the client acknowledged the message, as given
+    #                  by "time.time()".
+    #
+    def on_published(self, publisher, message, ack_time):
+        pass
+
+
+#
+# Publisher of messages to the cloud through a background thread.
+#
+# Messages are first put into a bounded in-memory queue of live messages; those
+# which do not fit into the queue or cannot be published are appended to the
+# spool. Live messages have priority over spooled ones, which are replayed in
+# order and at a limited rate, so that catching up does not starve live traffic.
+# While the connectivity is down, live messages go directly to the spool and a
+# replay is retried periodically.
+#
+class SpoolPublisher(threading.Thread):
+
+    #
+    # Constructor.
+    #
+    # @param clients                Dictionary of the clients by name.
+    # @param spool                  Spool.
+    # @param live_queue_size        Size of the queue of live messages.
+    # @param replay_rate_msgs_per_s Maximum rate of replay of spooled messages.
+    # @param retry_interval_s       Interval between publishing attempts while
+    #                               the connectivity is down.
+    # @param statistics_interval_s  Interval between statistics notifications.
+    #
+    def __init__(self, clients, spool,
+        live_queue_size=DEFAULT_LIVE_QUEUE_SIZE,
+        replay_rate_msgs_per_s=DEFAULT_REPLAY_RATE_msgs_per_s,
+        retry_interval_s=DEFAULT_RETRY_INTERVAL_s,
+        statistics_interval_s=DEFAULT_STATISTICS_INTERVAL_s):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._clients = clients
+        self._spool = spool
+        self._live_queue_size = live_queue_size
+        self._replay_period_s = 1.0 / replay_rate_msgs_per_s \
+            if replay_rate_msgs_per_s else 0.0
+        self._retry_interval_s = retry_interval_s
+        self._statistics_interval_s = statistics_interval_s
+        self._listeners = []
+        self._live = collections.deque()
+        self._condition = threading.Condition()
+        self._running = True
+        self._connected = True
+        self._next_retry_time = 0.0
+        self._next_replay_time = 0.0
+        self._published = 0
+        self._drained = 0
+        self._failures = 0
+        self._drain_rate_msgs_per_s = 0.0
+        self._rate_time = time.monotonic()
+        self._rate_drained = 0
+
+    #
+    # Add a listener.
+    #
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    #
+    # Publish a message.
+    # Non-blocking call.
+    #
+    # @param trace Optional (stream, sequence number, acquisition time) tuple
+    #              given back to the listeners when the message is published,
+    #              see "Message".
+    #
+    def publish(self, client_name, topic, payload, qos, trace=None):
+        message = Message(client_name, topic, payload, qos, time.time(), trace)
+        with self._condition:
+            if self._connected and len(self._live) < self._live_queue_size:
+                self._live.append(message)
+                self._condition.notify()
+                return
+        self._spool.append(message)
+        with self._condition:
+            self._condition.notify()
+
+    #
+    # Get the statistics of the publisher.
+    #
+    def get_statistics(self):
+        records, size = self._spool.get_depth()
+        return {
+            "connected": self._connected,
+            "live_queue": len(self._live),
+            "spool_records": records,
+            "spool_bytes": size,
+            "published": self._published,
+            "drained": self._drained,
+            "dropped": self._spool.dropped_records,
+            "failures": self._failures,
+            "drain_rate_msgs_per_s": self._drain_rate_msgs_per_s
+        }
+
+    #
+    # Stop the publisher, moving the messages not yet published to the spool.
+    # The spool is closed by the thread when it exits; should the thread still
+    # be publishing after the timeout, it closes the spool afterwards.
+    #
+    def close(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self.ident is None:
+            self._close_spool()
+        elif self.is_alive():
+            self.join(CLOSE_TIMEOUT_s)
+
+    #
+    # Run the thread.
+    #
+    def run(self):
+        next_statistics_time = time.monotonic() + self._statistics_interval_s
+        while True:
+            with self._condition:
+                message = None
+                while self._running:
+                    now = time.monotonic()
+                    if self._live:
+                        message = self._live.popleft()
+                        break
+                    timeout_s = next_statistics_time - now
+                    if not self._spool.is_empty():
+                        start_time = self._next_replay_time if self._connected \
+                            else self._next_retry_time
+                        if start_time <= now:
+                            break
+                        timeout_s = min(timeout_s, start_time - now)
+                    if timeout_s <= 0:
+                        break
+                    self._condition.wait(timeout_s)
+                if not self._running:
+                    self._close_spool()
+                    return
+
+            # Publishing either a live or a spooled message.
+            now = time.monotonic()
+            if message:
+                if not self._send(message):
+                    self._spool.append(message)
+            elif (self._next_replay_time if self._connected \
+                else self._next_retry_time) <= now and self._spool.peek():
+                if self._send(self._spool.peek()):
+                    self._spool.pop()
+                    self._drained += 1
+                    self._next_replay_time = now + self._replay_period_s
+
+            # Updating and notifying statistics.
+            now = time.monotonic()
+            if now - self._rate_time >= DRAIN_RATE_WINDOW_s:
+                self._drain_rate_msgs_per_s = \
+                    (self._drained - self._rate_drained) / (now - self._rate_time)
+                self._rate_time = now
+                self._rate_drained = self._drained
+            if now >= next_statistics_time:
+                next_statistics_time = now + self._statistics_interval_s
+                self._spool.expire()
+                statistics = self.get_statistics()
+                for listener in self._listeners:
+                    listener.on_statistics(self, statistics)
+
+    #
+    # Move the messages not yet published to the spool, and close it.
+    #
+    def _close_spool(self):
+        with self._condition:
+            while self._live:
+                self._spool.append(self._live.popleft())
+            self._spool.close()
+
+    #
+    # Send a message through its client.
+    #
+    # @return True if the message has been published, False otherwise.
+    #
+    def _send(self, message):
+        try:
+            result = self._clients[message.client_name].publish(
+                message.topic, message.payload, message.qos)
+        except Exception:
+            result = False
+        with self._condition:
+            if result is False:
+                self._failures += 1
+                self._connected = False
+                self._next_retry_time = time.monotonic() + self._retry_interval_s
+                return False
+            self._connected = True
+            self._published += 1
+        ack_time = time.time()
+        for listener in self._listeners:
+            listener.on_published(self, message, ack_time)
+        return True
@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides streaming statistics over the scalar series acquired from
+# the devices, i.e. one series per field and axis of the environmental and
+# inertial time domain data, and the local detection of anomalies on them.
+#
+# Configuration example:
+#
+# "anomaly": {
+#     "enabled": true,
+#     "min_samples": 30,
+#     "ewma_alpha": 0.1,
+#     "window_samples": 60,
+#     "z_score_thresholds": [3, 4, 5],
+#     "trend_threshold": 0.5
+# }
+
+
+# IMPORT
+
+from __future__ import print_function
+import math
+from collections import deque
+from collections import namedtuple
+
+
+# CONSTANTS
+
+# Defaults.
+DEFAULT_MIN_SAMPLES = 30
+DEFAULT_EWMA_ALPHA = 0.1
+DEFAULT_WINDOW_SAMPLES = 60
+DEFAULT_Z_SCORE_THRESHOLDS = [3, 4, 5]
+DEFAULT_TREND_THRESHOLD = 0.5
+
+# Severities, as in "definitions.EVENTS".
+SEVERITY_NORMAL = 0
+SEVERITY_WARNING = 1
+MAX_SEVERITY = 3
+
+# Names of the axes of three-axial values.
+AXES = ['X', 'Y', 'Z']
+
+
+# CLASSES
+
+#
+# Event raised on a change of severity of a series.
+#
+Event = namedtuple('Event', ['device_name', 'severity', 'message', 'value'])
+
+
+#
+# Minimum and maximum over a sliding window of samples, in amortized constant
+# time per sample and bounded memory.
+#
+class RollingExtrema(object):
+
+    #
+    # Constructor.
+    #
+    # @param window Number of samples of the window.
+    #
+    def __init__(self, window):
+        self._window = window
+        self._count = 0
+        self._minima = deque()
+        self._maxima = deque()
+
+    #
+    # Add a sample.
+    #
+    def add(self, value):
+        index = self._count
+        self._count += 1
+        while self._minima and self._minima[-1][1] >= value:
+            self._minima.pop()
+        self._minima.append((index, value))
+        while self._maxima and self._maxima[-1][1] <= value:
+            self._maxima.pop()
+        self._maxima.append((index, value))
+        if self._minima[0][0] <= index - self._window:
+            self._minima.popleft()
+        if self._maxima[0][0] <= index - self._window:
+            self._maxima.popleft()
+
+    #
+    # Get the minimum within the window, or None if there are no samples.
+    #
+    def get_min(self):
+        return self._minima[0][1] if self._minima else None
+
+    #
+    # Get the maximum within the window, or None if there are no samples.
+    #
+    def get_max(self):
+        return self._maxima[0][1] if self._maxima else None
+
+
+#
+# Statistics of a scalar series: mean and variance (Welford's algorithm),
+# exponentially weighted moving average of the values and of their differences
+# (trend), and rolling minimum and maximum.
+#
+class SeriesStatistics(object):
+
+    #
+    # Constructor.
+    #
+    # @param ewma_alpha Smoothing factor of the moving averages, in (0, 1].
+    # @param window     Number of samples of the rolling minimum and maximum.
+    #
+    def __init__(self, ewma_alpha=DEFAULT_EWMA_ALPHA,
+        window=DEFAULT_WINDOW_SAMPLES):
+        self._ewma_alpha = ewma_alpha
+        self._count = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._ewma = None
+        self._trend = 0.0
+        self._last = None
+        self._extrema = RollingExtrema(window)
+
+    #
+    # Add a sample.
+    #
+    def add(self, value):
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+        if self._ewma is None:
+            self._ewma = value
+        else:
+            self._ewma += self._ewma_alpha * (value - self._ewma)
+            self._trend += self._ewma_alpha * \
+                (value - self._last - self._trend)
+        self._last = value
+        self._extrema.add(value)
+
+    #
+    # Get the number of samples.
+    #
+    def get_count(self):
+        return self._count
+
+    #
+    # Get the mean of the samples.
+    #
+    def get_mean(self):
+        return self._mean
+
+    #
+    # Get the sample variance.
+    #
+    def get_variance(self):
+        return self._m2 / (self._count - 1) if self._count > 1 else 0.0
+
+    #
+    # Get the sample standard deviation.
+    #
+    def get_stddev(self):
+        return math.sqrt(self.get_variance())
+
+    #
+    # Get the moving average of the samples.
+    #
+    def get_ewma(self):
+        return self._ewma
+
+    #
+    # Get the moving average of the differences between consecutive samples.
+    #
+    def get_trend(self):
+        return self._trend
+
+    #
+    # Get the minimum within the rolling window.
+    #
+    def get_min(self):
+        return self._extrema.get_min()
+
+    #
+    # Get the maximum within the rolling window.
+    #
+    def get_max(self):
+        return self._extrema.get_max()
+
+    #
+    # Get the z-score of a value with respect to the current statistics, or
+    # zero if the standard deviation is null.
+    #
+    def get_z_score(self, value):
+        stddev = self.get_stddev()
+        return (value - self._mean) / stddev if stddev else 0.0
+
+    #
+    # Get the trend normalized by the standard deviation, or zero if the
+    # standard deviation is null.
+    #
+    def get_trend_score(self):
+        stddev = self.get_stddev()
+        return self._trend / stddev if stddev else 0.0
+
+
+#
+# Local anomaly detector over the series of the devices.
+#
+# Each value is scored against the statistics of its series before being added
+# to them: the severity of the series is given by the highest z-score threshold
+# exceeded by the absolute z-score, or is a warning if the absolute normalized
+# trend exceeds the trend threshold. An event is raised whenever the severity
+# of a series changes, including when it goes back to normal.
+#
+class AnomalyDetector(object):
+
+    #
+    # Constructor.
+    #
+    # @param configuration Dictionary with the optional parameters of the
+    #                      detector, see the configuration example above.
+    # @raise ValueError if the configuration is invalid.
+    #
+    def __init__(self, configuration):
+        self._min_samples = configuration.get(
+            "min_samples", DEFAULT_MIN_SAMPLES)
+        self._ewma_alpha = configuration.get("ewma_alpha", DEFAULT_EWMA_ALPHA)
+        self._window = configuration.get(
+            "window_samples", DEFAULT_WINDOW_SAMPLES)
+        self._z_score_thresholds = configuration.get(
+            "z_score_thresholds", DEFAULT_Z_SCORE_THRESHOLDS)
+        self._trend_threshold = configuration.get(
+            "trend_threshold", DEFAULT_TREND_THRESHOLD)
+        if not 0 < self._ewma_alpha <= 1:
+            raise ValueError('EWMA alpha must be within (0, 1].')
+        if self._window < 1:
+            raise ValueError('Window must contain at least one sample.')
+        if list(self._z_score_thresholds) != \
+            sorted(self._z_score_thresholds) or \
+            len(self._z_score_thresholds) > MAX_SEVERITY:
+            raise ValueError('Z-score thresholds must be sorted and at most ' \
+                '%d.' % (MAX_SEVERITY))
+        self._series = {}
+        self._severities = {}
+
+    #
+    # Get the statistics of a series, or None if the series is unknown.
+    #
+    # @param key Tuple (device name, stream, field, axis), the axis being None
+    #            for scalar fields.
+    #
+    def get_statistics(self, key):
+        return self._series.get(key)
+
+    #
+    # Add a sample of a stream of a device and check it for anomalies.
+    #
+    # @param device_name Name of the device.
+    # @param stream      Name of the stream.
+    # @param sample      Dictionary of fields, whose values are either numbers
+    #                    or lists of numbers (one per axis).
+    # @return The list of events raised by the sample.
+    #
+    def check(self, device_name, stream, sample):
+        events = []
+        for field in sorted(sample):
+            value = sample[field]
+            if isinstance(value, (list, tuple)):
+                values = enumerate(value)
+            else:
+                values = [(None, value)]
+            for axis, axis_value in values:
+                event = self._check_value(
+                    (device_name, stream, field, axis), axis_value)
+                if event:
+                    events.append(event)
+        return events
+
+    #
+    # Score a value of a series, add it to the series' statistics, and return
+    # the event raised by a change of severity, if any.
+    #
+    def _check_value(self, key, value):
+        if key not in self._series:
+            self._series[key] = SeriesStatistics(self._ewma_alpha, self._window)
+            self._severities[key] = SEVERITY_NORMAL
+        statistics = self._series[key]
+
+        # Scoring.
+        severity = SEVERITY_NORMAL
+        reason = None
+        if statistics.get_count() >= self._min_samples:
+            z_score = statistics.get_z_score(value)
+            for i, threshold in enumerate(self._z_score_thresholds):
+                if abs(z_score) >= threshold:
+                    severity = i + 1
+                    reason = 'z-score %.2f' % (z_score)
+            if severity == SEVERITY_NORMAL:
+                trend_score = statistics.get_trend_score()
+                if self._trend_threshold and \
+                    abs(trend_score) >= self._trend_threshold:
+                    severity = SEVERITY_WARNING
+                    reason = 'trend %.2f' % (trend_score)
+        statistics.add(value)
+
+        # Raising an event on a change of severity.
+        if severity == self._severities[key]:
+            return None
+        self._severities[key] = severity
+        device_name, stream, field, axis = key
+        series_name = field if axis is None else '%s %s' % \
+            (field, AXES[axis] if axis < len(AXES) else axis)
+        if severity == SEVERITY_NORMAL:
+            message = 'Local %s back to normal' % (series_name)
+        else:
+            message = 'Local anomaly on %s, %s, mean %.3f, range [%.3f, %.3f]' \
+                % (series_name, reason, statistics.get_mean(),
+                statistics.get_min(), statistics.get_max())
+        return Event(device_name, severity, message, value)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+################################################################################
+# COPYRIGHT(c) 2022 STMicroelectronics                                         #
+#                                                                              #
+# Redistribution and use in source and binary forms, with or without           #
+# modification, are permitted provided that the following conditions are met:  #
+#   1. Redistributions of source code must retain the above copyright notice,  #
+#      this list of conditions and the following disclaimer.                   #
+#   2. Redistributions in binary form must reproduce the above copyright       #
+#      notice, this list of conditions and the following disclaimer in the     #
+#      documentation and/or other materials provided with the distribution.    #
+#   3. Neither the name of STMicroelectronics nor the names of its             #
+#      contributors may be used to endorse or promote products derived from    #
+#      this software without specific prior written permission.                #
+#                                                                              #
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"  #
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE    #
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE   #
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE    #
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR          #
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF         #
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS     #
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN      #
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)      #
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE   #
+# POSSIBILITY OF SUCH DAMAGE.                                                  #
+################################################################################
+
+
+
+# DESCRIPTION
+#
+# This file provides the tracing of the samples from their acquisition to their
+# publication: each published sample carries a sequence number per device and
+# its acquisition time, so that the latency between acquisition and
+# acknowledgement by the client can be measured, and gaps and reorderings of
+# the sequence numbers can be detected.
+
+
+# IMPORT
+
+from __future__ import print_function
+import threading
+
+
+# CONSTANTS
+
+# Buckets of the latency histograms [s].
+LATENCY_BUCKETS_s = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0, 300.0, 3600.0]
+
+# Metrics.
+METRIC_LATENCY = 'pmp_publish_latency_seconds'
+METRIC_GAPS = 'pmp_sequence_gaps_total'
+METRIC_REORDERED = 'pmp_sequence_reordered_total'
+METRIC_MISSING = 'pmp_sequence_missing'
+METRIC_LOSS_RATE = 'pmp_sequence_loss_rate'
+
+
+# CLASSES
+
+#
+# Tracer of the samples of the devices. Thread-safe.
+#
+# Sequence numbers are assigned per device, across its streams, when samples
+# are published. When a sample is acknowledged, its latency is recorded and its
+# sequence number is compared with the next expected one:
+# - a higher number is a gap, whose skipped numbers are missing;
+# - a lower number is a reordering, which fills a missing number.
+# The loss rate is the ratio between the missing numbers and the numbers
+# assigned so far.
+#
+class Tracer(object):
+
+    #
+    # Constructor.
+    #
+    # @param registry Registry of metrics where to record latencies, gaps and
+    #                 reorderings.
+    #
+    def __init__(self, registry):
+        self._registry = registry
+        self._lock = threading.Lock()
+        self._sequences = {}
+        self._expected = {}
+        self._missing = {}
+        registry.add_histogram(METRIC_LATENCY,
+            'Time between the acquisition of the samples and their ' \
+            'acknowledgement by the client.',
+            ('device', 'stream'), LATENCY_BUCKETS_s)
+        registry.add_counter(METRIC_GAPS,
+            'Gaps in the sequence numbers of the acknowledged samples.',
+            ('device',))
+        registry.add_counter(METRIC_REORDERED,
+            'Samples acknowledged out of order.', ('device',))
+        registry.add_gauge(METRIC_MISSING,
+            'Sequence numbers not yet acknowledged after a gap.', ('device',))
+        registry.add_gauge(METRIC_LOSS_RATE,
+            'Ratio of missing sequence numbers.', ('device',))
+
+    #
+    # Get the next sequence number of a device.
+    #
+    def next_sequence(self, device_name):
+        key = (device_name,)
+        with self._lock:
+            sequence = self._sequences.get(key, 0)
+            self._sequences[key] = sequence + 1
+        return sequence
+
+    #
+    # To be called whenever a sample has been acknowledged by the client.
+    #
+    # @param device_name      Name of the device.
+    # @param stream           Name of the stream.
+    # @param sequence         Sequence number of the sample.
+    # @param acquisition_time Acquisition time, as given by "time.time()".
+    # @param ack_time         Acknowledgement time, as given by "time.time()".
+    #
+    def on_published(self, device_name, stream, sequence, acquisition_time,
+        ack_time):
+        self._registry.observe(METRIC_LATENCY, (device_name, stream),
+            max(0.0, ack_time - acquisition_time))
+        key = (device_name,)
+        with self._lock:
+            expected = self._expected.get(key, 0)
+            missing = self._missing.get(key, 0)
+            if sequence > expected:
+                missing += sequence - expected
+                self._registry.increment(METRIC_GAPS, key)
+            elif sequence < expected:
+                missing = max(0, missing - 1)
+                self._registry.increment(METRIC_REORDERED, key)
+            self._expected[key] = max(expected, sequence + 1)
+            self._missing[key] = missing
+            assigned = self._sequences.get(key, self._expected[key])
+        self._registry.set(METRIC_MISSING, key, missing)
+        self._registry.set(METRIC_LOSS_RATE, key,
+            float(missing) / assigned if assigned else 0.0)